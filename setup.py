@@ -28,6 +28,9 @@ setup(
         'Topic :: Utilities',
     ],
     install_requires=[
-        'Django>=1.4',
-    ]
+        'Django>=1.5,<1.8',
+    ],
+    extras_require={
+        'jinja2': ['Jinja2'],
+    },
 )
@@ -0,0 +1,215 @@
+"""
+Cached value -> label indexes of form field choices, used by the ``verbose``
+filter.
+
+The index of a plain choice field is built once and stored on the field of
+the form class, so all the form instances share it. It is kept as long as
+``field.choices`` holds the same choices: checking that is a pointer
+comparison of the choice tuples, which survives the copy of the fields every
+form instance makes, and an index is rebuilt only when different choices
+are set.
+
+Model choice fields don't load their whole table: only the labels of the
+values displayed are loaded, by ``to_field_name`` (the primary key by
+default), with a single query. They are cached per model and query for the
+current request (per thread, emptied when the request finishes), so
+displaying the same values again, in this or any other form instance of
+the page, costs no further queries, and labels are never kept from one
+request to the next. The labels of a model are also dropped whenever one
+of its instances is saved or deleted.
+"""
+import threading
+from django.core.exceptions import ValidationError
+from django.forms import ModelChoiceField
+from django.utils import six
+
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:
+    # Before Django 1.11
+    from django.db.models.sql.datastructures import EmptyResultSet
+
+INDEX_ATTR = '_template_utils_choice_index'
+KEY_ATTR = '_template_utils_choice_key'
+
+# Number of querysets whose labels are cached per model, and of labels
+# cached per queryset, in a request
+MAXSIZE = 64
+MAX_LABELS = 1000
+
+_local = threading.local()
+
+
+def _model_indexes():
+    try:
+        return _local.indexes
+    except AttributeError:
+        indexes = _local.indexes = {}
+        return indexes
+
+
+def _choice_index(choices):
+    index = {}
+    for key, label in choices:
+        if isinstance(label, (list, tuple)):
+            # An optgroup: label holds the group's choices
+            for key, label in label:
+                index.setdefault(key, label)
+        else:
+            index.setdefault(key, label)
+    # Submitted data is text, so the keys are indexed as text as well
+    for key, label in list(index.items()):
+        if not isinstance(key, six.string_types):
+            index.setdefault(six.text_type(key), label)
+    return index
+
+
+def _model_index_key(field):
+    """
+    Returns the key of the labels of ``field``'s model choices: its class
+    (for ``label_from_instance``), ``to_field_name`` and query. It is stored
+    on the field, so the SQL is only built once per queryset.
+    """
+    queryset = field.queryset
+    cached = field.__dict__.get(KEY_ATTR)
+    if cached is not None and cached[0] is queryset:
+        return cached[1]
+    try:
+        query = six.text_type(queryset.query)
+    except EmptyResultSet:
+        # An empty queryset (i.e. of none()) has no choices at all
+        query = None
+    key = (type(field), field.to_field_name, query)
+    field.__dict__[KEY_ATTR] = (queryset, key)
+    return key
+
+
+def get_model_choice_index(field, values):
+    """
+    Returns the dict mapping the values of ``field``'s model choices to
+    their labels, with ``values`` loaded into it. The values missing from
+    the choices map to ``None``.
+
+    The labels are shared, for the rest of the request, by all the fields
+    of the same class and ``to_field_name`` with the same query, so the
+    fields every form instance copies don't query them again.
+    """
+    model = field.queryset.model._meta.concrete_model
+    key = _model_index_key(field)
+    indexes = _model_indexes().setdefault(model, {})
+    index = indexes.get(key)
+    if index is None:
+        if len(indexes) >= MAXSIZE:
+            indexes.clear()
+        index = indexes[key] = {}
+    missing = [value for value in values if value not in index]
+    if not missing:
+        return index
+    # Each label is indexed by its value and by its value as text
+    if len(index) + 2 * len(missing) > MAX_LABELS:
+        index.clear()
+    lookup = '%s__in' % (field.to_field_name or 'pk')
+    try:
+        objs = list(field.queryset.filter(**{lookup: missing}))
+    except (ValueError, TypeError, ValidationError):
+        # Values that aren't valid keys have no choice
+        objs = ()
+    for value in missing:
+        index.setdefault(value, None)
+    for obj in objs:
+        value = field.prepare_value(obj)
+        index[value] = index[six.text_type(value)] = \
+            field.label_from_instance(obj)
+    return index
+
+
+def clear_model_choice_indexes(model=None):
+    """
+    Drops the labels of the model choices of ``model``, or of every model,
+    cached by the current thread.
+    """
+    if model is None:
+        _model_indexes().clear()
+    else:
+        _model_indexes().pop(model._meta.concrete_model, None)
+
+
+def model_changed(sender, **kwargs):
+    """
+    ``post_save``/``post_delete`` receiver dropping the cached labels of
+    the model choices of the saved or deleted instance's model.
+    """
+    if sender._meta.concrete_model in _model_indexes():
+        clear_model_choice_indexes(sender)
+
+
+def request_finished(sender, **kwargs):
+    """
+    ``request_finished`` receiver dropping the labels cached during the
+    request.
+    """
+    clear_model_choice_indexes()
+
+
+def get_choice_index(field, holder=None):
+    """
+    Returns the cached dict mapping the values of ``field``'s choices to
+    their labels, for plain choice fields (see ``get_model_choice_index``
+    for model choice fields).
+
+    The index of plain choice fields is stored on ``holder`` (``field``
+    itself by default); passing the field of the form class lets every form
+    instance share the index.
+    """
+    holder = field if holder is None else holder
+    source = field.choices
+    cached = holder.__dict__.get(INDEX_ATTR)
+    if cached is not None and (cached[1] is source or cached[1] == source):
+        index = cached[2]
+    else:
+        index = _choice_index(source)
+    holder.__dict__[INDEX_ATTR] = (holder, source, index)
+    return index
+
+
+def choice_label(field, value, default=None, holder=None):
+    """
+    Returns the label of the choice of ``field`` whose value is ``value``,
+    or ``default`` if there is no such choice.
+
+    A list of values (i.e. of a multiple choice field) gives its labels
+    joined by commas.
+    """
+    values = value if isinstance(value, (list, tuple)) else [value]
+    if isinstance(field, ModelChoiceField):
+        # Model instances are looked up by to_field_name
+        values = [field.prepare_value(item) for item in values]
+        try:
+            index = get_model_choice_index(field, values)
+        except TypeError:
+            # Unhashable values
+            return default
+    else:
+        index = get_choice_index(field, holder)
+    if isinstance(value, (list, tuple)):
+        labels = [six.text_type(_lookup(index, item, default))
+                  for item in values]
+        return ', '.join(labels) if labels else default
+    return _lookup(index, values[0], default)
+
+
+def bound_choice_label(bound_field, value, default=None):
+    """
+    Returns the label of ``value`` for a bound choice field, sharing the
+    index with all the instances of the form.
+    """
+    holder = type(bound_field.form).base_fields.get(bound_field.name)
+    return choice_label(bound_field.field, value, default, holder)
+
+
+def _lookup(index, value, default):
+    try:
+        label = index[value]
+    except (KeyError, TypeError):
+        return default
+    return default if label is None else label
@@ -0,0 +1,152 @@
+"""
+Read-only display of form fields, used by the ``verbose`` filter and the
+``form_display`` tag.
+
+How a value is displayed depends on the class of its field, and is decided
+by a converter looked up in a dispatch table. The converter of each field
+class is resolved once through its MRO and cached, and so is the converter
+of each field of a form class, so displaying a whole form costs a dict
+lookup and a single ``BoundField.value()`` call per field.
+
+Converters for custom fields are registered with ``register_converter``::
+
+    def money_converter(bound_field, value, default):
+        return format_currency(value) if value is not None else default
+
+    register_converter(MoneyField, money_converter)
+"""
+from weakref import WeakKeyDictionary
+from django.forms import (
+    BooleanField,
+    CharField,
+    ChoiceField,
+    DateField,
+    DateTimeField,
+    DecimalField,
+    IntegerField,
+)
+from django.utils import timezone
+from template_utils.choices import bound_choice_label
+
+NO_DATA_MESSAGE = 'Not Available'
+
+_converters = {}
+# Form and field classes created at runtime (i.e. by modelform_factory)
+# are only referenced weakly, so they can still be released
+_resolved = WeakKeyDictionary()
+_form_plans = WeakKeyDictionary()
+
+
+def register_converter(field_class, converter):
+    """
+    Displays the values of ``field_class`` fields (and of its subclasses
+    without a converter of their own) with ``converter``.
+
+    ``converter`` is called with the bound field, its value and the default
+    given to ``verbose``, which may be ``None``.
+    """
+    _converters[field_class] = converter
+    _resolved.clear()
+    _form_plans.clear()
+
+
+def get_converter(field_class):
+    """
+    Returns the converter of the closest class in ``field_class``'s MRO that
+    has one, or ``None``.
+    """
+    try:
+        return _resolved[field_class]
+    except KeyError:
+        pass
+    converter = None
+    for klass in field_class.__mro__:
+        if klass in _converters:
+            converter = _converters[klass]
+            break
+    _resolved[field_class] = converter
+    return converter
+
+
+def _form_plan(form_class):
+    """
+    Returns the converters of the fields of ``form_class`` by name, along
+    with the field class they were resolved for.
+    """
+    try:
+        return _form_plans[form_class]
+    except KeyError:
+        pass
+    plan = dict((name, (type(field), get_converter(type(field))))
+                for name, field in form_class.base_fields.items())
+    _form_plans[form_class] = plan
+    return plan
+
+
+def display_value(bound_field, default=None):
+    """
+    Returns the verbose value of a bound field.
+    """
+    converter = get_converter(type(bound_field.field))
+    if converter is None:
+        return None
+    return converter(bound_field, bound_field.value(), default)
+
+
+def display_form(form, default=None):
+    """
+    Returns a list of ``(bound_field, verbose_value)`` pairs for every field
+    of ``form``, in order.
+    """
+    plan = _form_plan(type(form))
+    result = []
+    for bound_field in form:
+        field_class = type(bound_field.field)
+        try:
+            planned_class, converter = plan[bound_field.name]
+        except KeyError:
+            planned_class = None
+        if planned_class is not field_class:
+            # A field added or replaced by the form instance
+            converter = get_converter(field_class)
+        value = None
+        if converter is not None:
+            value = converter(bound_field, bound_field.value(), default)
+        result.append((bound_field, value))
+    return result
+
+
+def plain_converter(bound_field, value, default):
+    # For text and numeric types, return the plain value
+    return value if value else (default or NO_DATA_MESSAGE)
+
+
+def boolean_converter(bound_field, value, default):
+    # For boolean type, return a verbose representation of the value
+    if value is None:
+        return default or 'Maybe'
+    return ('No', 'Yes')[value]
+
+
+def choice_converter(bound_field, value, default):
+    # For choices (including model choices), return the verbose value
+    return bound_choice_label(bound_field, value, default or NO_DATA_MESSAGE)
+
+
+def age_converter(bound_field, value, default):
+    # For date types, return the age until the current date.
+    if value is None:
+        return default or NO_DATA_MESSAGE
+    today = timezone.datetime.today()
+    if isinstance(bound_field.field, DateField):
+        today = today.date()
+    return (today - value).days / 365
+
+
+register_converter(CharField, plain_converter)
+register_converter(DecimalField, plain_converter)
+register_converter(IntegerField, plain_converter)
+register_converter(BooleanField, boolean_converter)
+register_converter(ChoiceField, choice_converter)
+register_converter(DateField, age_converter)
+register_converter(DateTimeField, age_converter)
@@ -0,0 +1,128 @@
+"""
+Parse-time folding of the literal arguments of filters.
+
+Django resolves a literal filter argument such as ``:4`` or ``:"es_MX"``
+once, but hands it to the filter as a new string on every call, so a filter
+in a loop validates and converts the same argument over and over again.
+
+Filters declare how their argument is converted with ``folds_argument``.
+``fold_arguments`` walks a compiled template and replaces the literal
+arguments of those filters with their converted value, raising
+``TemplateSyntaxError`` if a literal is invalid; the filters get the value
+ready to use through ``argument``. Variables, and the arguments of templates
+that weren't folded, are converted when the filter is called, as before.
+
+Templates loaded through ``template_utils.loaders.Loader`` are folded as
+they are loaded.
+"""
+from django.template.base import (
+    FilterExpression,
+    Node,
+    Template,
+    TemplateSyntaxError,
+)
+from django.template.smartif import TokenBase
+from django.utils import six
+from django.utils.safestring import SafeData
+
+
+class FoldedArgument(SafeData):
+    """
+    A converted literal argument. Being ``SafeData``, Django hands it to the
+    filter untouched.
+    """
+
+    def __init__(self, literal, value):
+        self.literal = literal
+        self.value = value
+
+    def __str__(self):
+        return str(self.literal)
+
+    def __repr__(self):
+        return '<FoldedArgument %r: %r>' % (self.literal, self.value)
+
+
+def folds_argument(convert):
+    """
+    Decorator declaring how to convert the argument of a filter.
+    ``convert`` is called with the literal and raises ``ValueError`` or
+    ``TypeError`` if it is invalid.
+    """
+    def decorator(func):
+        func.fold_argument = convert
+        return func
+    return decorator
+
+
+def argument(arg, convert=None):
+    """
+    Returns the converted argument of a filter: the folded value, or the
+    result of ``convert(arg)`` (``arg`` itself without ``convert``) if it
+    wasn't folded.
+    """
+    if isinstance(arg, FoldedArgument):
+        return arg.value
+    if convert is None:
+        return arg
+    return convert(arg)
+
+
+def fold_expression(expression):
+    """
+    Folds the literal arguments of the filters of a ``FilterExpression``.
+    """
+    for index, (func, args) in enumerate(expression.filters):
+        convert = getattr(func, 'fold_argument', None)
+        if convert is None or not args:
+            continue
+        lookup, arg = args[0]
+        if isinstance(arg, FoldedArgument):
+            continue
+        if lookup:
+            # Numbers are parsed as variables without lookups
+            if arg.lookups is not None:
+                continue
+            arg = arg.literal
+        try:
+            value = convert(arg)
+        except (TypeError, ValueError) as e:
+            raise TemplateSyntaxError(
+                "Invalid argument %r for filter '%s': %s"
+                % (arg, getattr(func, '__name__', func), e))
+        expression.filters[index] = (
+            func, [(False, FoldedArgument(arg, value))] + args[1:])
+
+
+def _expressions(obj, seen):
+    if id(obj) in seen:
+        return
+    seen.add(id(obj))
+    if isinstance(obj, FilterExpression):
+        yield obj
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            for expression in _expressions(item, seen):
+                yield expression
+    elif isinstance(obj, dict):
+        for item in obj.values():
+            for expression in _expressions(item, seen):
+                yield expression
+    elif isinstance(obj, (Node, Template, TokenBase)):
+        # Nodes keep their expressions, nodelists and conditions (whose
+        # operators are TokenBase instances) as attributes
+        for item in vars(obj).values():
+            if not isinstance(item, six.string_types):
+                for expression in _expressions(item, seen):
+                    yield expression
+
+
+def fold_arguments(template):
+    """
+    Folds the literal arguments of the filters used anywhere in
+    ``template``, which may be a ``Template`` or a node. Returns the
+    template.
+    """
+    for expression in _expressions(template, set()):
+        fold_expression(expression)
+    return template
@@ -0,0 +1,300 @@
+"""
+Locale-free number formatting used by the ``currency`` filter.
+
+Each locale's monetary conventions (symbol, grouping, separators, sign
+placement and rounding) are compiled once into a ``CurrencyFormat`` and
+cached, so formatting a value never calls ``locale.setlocale`` and never
+touches process-global state.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+import locale
+import sys
+import threading
+from template_utils.numeric import format_fixed
+
+DEFAULT_LOCALE = 'en_US'
+
+# The exact types the ``currency`` filter formats; anything else is returned
+# untouched.
+CURRENCY_TYPES = (int, float, Decimal)
+
+# ``localeconv()`` uses CHAR_MAX to mean "not available" / "no more grouping"
+CHAR_MAX = 127
+
+# Monetary conventions for the most common locales, as glibc reports them
+# through ``locale.localeconv()``. Locales not listed here are read from the
+# system once (see ``_system_conventions``) and cached as well.
+LOCALE_CONVENTIONS = {
+    'en_US': {
+        'currency_symbol': '$', 'mon_decimal_point': '.',
+        'mon_thousands_sep': ',', 'mon_grouping': [3, 3, 0],
+        'positive_sign': '', 'negative_sign': '-', 'frac_digits': 2,
+        'p_cs_precedes': 1, 'p_sep_by_space': 0, 'p_sign_posn': 1,
+        'n_cs_precedes': 1, 'n_sep_by_space': 0, 'n_sign_posn': 1,
+    },
+    'en_GB': {
+        'currency_symbol': u'\xa3', 'mon_decimal_point': '.',
+        'mon_thousands_sep': ',', 'mon_grouping': [3, 3, 0],
+        'positive_sign': '', 'negative_sign': '-', 'frac_digits': 2,
+        'p_cs_precedes': 1, 'p_sep_by_space': 0, 'p_sign_posn': 1,
+        'n_cs_precedes': 1, 'n_sep_by_space': 0, 'n_sign_posn': 1,
+    },
+    'es_MX': {
+        'currency_symbol': '$', 'mon_decimal_point': '.',
+        'mon_thousands_sep': ',', 'mon_grouping': [3, 3, 0],
+        'positive_sign': '', 'negative_sign': '-', 'frac_digits': 2,
+        'p_cs_precedes': 1, 'p_sep_by_space': 0, 'p_sign_posn': 1,
+        'n_cs_precedes': 1, 'n_sep_by_space': 0, 'n_sign_posn': 1,
+    },
+    'de_DE': {
+        'currency_symbol': u'\u20ac', 'mon_decimal_point': ',',
+        'mon_thousands_sep': '.', 'mon_grouping': [3, 3, 0],
+        'positive_sign': '', 'negative_sign': '-', 'frac_digits': 2,
+        'p_cs_precedes': 0, 'p_sep_by_space': 1, 'p_sign_posn': 1,
+        'n_cs_precedes': 0, 'n_sep_by_space': 1, 'n_sign_posn': 1,
+    },
+    'pt_BR': {
+        'currency_symbol': 'R$', 'mon_decimal_point': ',',
+        'mon_thousands_sep': '.', 'mon_grouping': [3, 3, 0],
+        'positive_sign': '', 'negative_sign': '-', 'frac_digits': 2,
+        'p_cs_precedes': 1, 'p_sep_by_space': 1, 'p_sign_posn': 1,
+        'n_cs_precedes': 1, 'n_sep_by_space': 1, 'n_sign_posn': 1,
+    },
+}
+
+_currency_formats = {}
+_setlocale_lock = threading.Lock()
+
+
+def _to_text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def _system_conventions(locale_name):
+    """
+    Reads the monetary conventions of ``locale_name`` from the system.
+
+    This is the only place where the process locale is switched, and it
+    happens once per locale: only ``LC_MONETARY`` is changed, under a lock,
+    and it is restored right after ``localeconv()`` is read.
+    """
+    with _setlocale_lock:
+        previous = locale.setlocale(locale.LC_MONETARY)
+        try:
+            try:
+                locale.setlocale(locale.LC_MONETARY, '%s.utf8' % locale_name)
+            except locale.Error:
+                locale.setlocale(locale.LC_MONETARY, '%s.UTF-8' % locale_name)
+            conventions = locale.localeconv()
+        finally:
+            locale.setlocale(locale.LC_MONETARY, previous)
+    return dict((key, _to_text(value)) for key, value in conventions.items())
+
+
+class CurrencyFormat(object):
+    """
+    The compiled monetary format of a single locale.
+
+    Sign and symbol placement are resolved into a (prefix, suffix) pair per
+    sign when the format is built, so ``format`` only has to round, group
+    and concatenate.
+    """
+
+    def __init__(self, conventions, rounding=ROUND_HALF_UP):
+        self.frac_digits = conventions['frac_digits']
+        if self.frac_digits == CHAR_MAX:
+            raise ValueError("Currency formatting is not possible using "
+                             "the 'C' locale.")
+        self.decimal_point = conventions['mon_decimal_point']
+        self.thousands_sep = conventions['mon_thousands_sep']
+        self.grouping = self._grouping_sizes(conventions['mon_grouping'])
+        self.rounding = rounding
+        # Most locales group by three, which the builtin format spec already
+        # does in C; only the separators need to be swapped afterwards.
+        self.builtin_grouping = self.grouping == ([3], True)
+        self.positive = self._affixes(conventions, 'p', 'positive_sign')
+        self.negative = self._affixes(conventions, 'n', 'negative_sign')
+
+    @staticmethod
+    def _grouping_sizes(mon_grouping):
+        # [3, 3, 0] means "3, then repeat the last size"; CHAR_MAX stops.
+        sizes = []
+        for size in mon_grouping:
+            if size == CHAR_MAX:
+                return sizes, False
+            if size == 0:
+                return sizes, True
+            sizes.append(size)
+        return sizes, False
+
+    @staticmethod
+    def _affixes(conventions, prefix, sign_key):
+        """
+        Mirrors ``locale.currency`` to find what goes around the number.
+        """
+        symbol = conventions['currency_symbol']
+        sign = conventions[sign_key]
+        separator = ' ' if conventions[prefix + '_sep_by_space'] else ''
+        # '\0' stands for the number; '<' and '>' mark where it starts/ends
+        s = '<\0>'
+        if conventions[prefix + '_cs_precedes']:
+            s = symbol + separator + s
+        else:
+            s = s + separator + symbol
+        sign_posn = conventions[prefix + '_sign_posn']
+        if sign_posn == 0:
+            s = '(' + s + ')'
+        elif sign_posn == 2:
+            s = s + sign
+        elif sign_posn == 3:
+            s = s.replace('<', sign)
+        elif sign_posn == 4:
+            s = s.replace('>', sign)
+        else:
+            s = sign + s
+        before, after = s.replace('<', '').replace('>', '').split('\0')
+        return before, after
+
+    def group(self, digits):
+        """
+        Inserts the thousands separator into a string of integer digits.
+        """
+        sizes, repeat = self.grouping
+        if not sizes or not self.thousands_sep:
+            return digits
+        groups = []
+        end = len(digits)
+        for size in sizes:
+            if end <= size:
+                break
+            groups.append(digits[end - size:end])
+            end -= size
+        else:
+            size = sizes[-1]
+            while repeat and end > size:
+                groups.append(digits[end - size:end])
+                end -= size
+        groups.append(digits[:end])
+        groups.reverse()
+        return self.thousands_sep.join(groups)
+
+    def _localize(self, number):
+        """
+        Swaps the C separators in ``number`` for the locale's ones.
+        """
+        if self.thousands_sep == ',' and self.decimal_point == '.':
+            return number
+        return number.replace(',', '\0').replace(
+            '.', self.decimal_point).replace('\0', self.thousands_sep)
+
+    def format_number(self, value):
+        """
+        Returns the rounded and grouped digits of a non-negative value,
+        without currency symbol nor sign.
+        """
+        if self.builtin_grouping:
+            return self._localize(format_fixed(
+                value, self.frac_digits, grouped=True, rounding=self.rounding))
+        number = format_fixed(value, self.frac_digits, rounding=self.rounding)
+        integer, _, fraction = number.partition('.')
+        number = self.group(integer)
+        if fraction:
+            number = number + self.decimal_point + fraction
+        return number
+
+    def format(self, value):
+        """
+        Returns ``value`` (an int, float or Decimal) formatted as currency.
+        """
+        before, after = self.negative if value < 0 else self.positive
+        return before + self.format_number(abs(value)) + after
+
+    def format_many(self, values):
+        """
+        Formats a whole sequence of values in one pass.
+
+        Values that the ``currency`` filter would not format are returned
+        untouched, so the result matches applying the filter to each value.
+        """
+        format_number = self.format_number
+        positive, negative = self.positive, self.negative
+        result = []
+        append = result.append
+        for value in values:
+            if type(value) not in CURRENCY_TYPES:
+                append(value)
+                continue
+            before, after = negative if value < 0 else positive
+            append(before + format_number(abs(value)) + after)
+        return result
+
+
+def get_currency_format(locale_name=None):
+    """
+    Returns the cached ``CurrencyFormat`` for ``locale_name``.
+
+    Raises ``locale.Error`` if the locale is neither built in nor installed
+    on the system.
+    """
+    locale_name = locale_name or DEFAULT_LOCALE
+    try:
+        return _currency_formats[locale_name]
+    except KeyError:
+        pass
+    conventions = LOCALE_CONVENTIONS.get(locale_name)
+    if conventions is None:
+        conventions = _system_conventions(locale_name)
+    currency_format = CurrencyFormat(conventions)
+    _currency_formats[locale_name] = currency_format
+    return currency_format
+
+
+def format_currency(value, locale_name=None):
+    """
+    Returns an int, float or Decimal value formatted as currency for the
+    given locale (``en_US`` by default).
+    """
+    return get_currency_format(locale_name).format(value)
+
+
+def format_currency_many(values, locale_name=None):
+    """
+    Formats a sequence of values as currency in one pass.
+
+    The output matches applying the ``currency`` filter to every value byte
+    for byte. A NumPy int or float array is converted to Python numbers
+    with ``tolist()`` first, and formatted one value at a time as well.
+    """
+    currency_format = get_currency_format(locale_name)
+    # Values can't be an array unless NumPy was imported already
+    numpy = sys.modules.get('numpy')
+    if numpy is not None and isinstance(values, numpy.ndarray) and \
+            values.dtype.kind in 'iuf':
+        values = values.ravel().tolist()
+    return currency_format.format_many(values)
+
+
+def get_field(row, field):
+    """
+    Returns ``row[field]`` for mappings and ``row.field`` otherwise.
+    """
+    if isinstance(row, dict):
+        return row[field]
+    return getattr(row, field)
+
+
+def format_currency_column(rows, field, locale_name=None):
+    """
+    Formats the ``field`` column of ``rows`` as currency in one pass, and
+    returns a list of ``(row, formatted value)`` pairs.
+
+    ``rows`` may be a sequence or an iterator of dicts or objects, or a
+    QuerySet; it is iterated only once (a QuerySet runs a single query, or
+    none if it was already evaluated), and the rows are left untouched.
+    """
+    rows = list(rows)
+    values = format_currency_many([get_field(row, field) for row in rows],
+                                  locale_name)
+    return list(zip(rows, values))
@@ -0,0 +1,105 @@
+"""
+Cached template fragments that vary on the current route and the user's
+role, for the ``cachefragment`` tag.
+
+Navigation menus and headers usually depend on nothing but the url the
+request resolves to (which entry is active) and the groups of the user
+(which entries are shown), so they are cached under a key built from the
+fragment name, the namespaced url name, the user's role and any extra
+values given to the tag. The role is whether the user is authenticated, a
+superuser or staff, the names of the user's groups and the user's
+permissions (which ``ifperm`` checks, and which may be granted directly
+rather than through a group). A fragment renders once per (route, role)
+instead of once per request.
+
+Changing a user's groups or permissions changes the key, so it needs no
+invalidation.
+Everything else can be invalidated by fragment name with
+``invalidate_fragment``: every fragment name has a version that is part of
+its keys, and invalidating it replaces the version, so all of its cached
+variations are dropped at once.
+"""
+import hashlib
+import uuid
+from django.conf import settings
+from django.utils import six
+from django.utils.encoding import force_bytes
+from django.utils.http import urlquote
+
+DEFAULT_TIMEOUT = 300
+# Memcached takes longer timeouts as timestamps
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+FRAGMENT_KEY = 'template_utils:fragment:%s:%s'
+VERSION_KEY = 'template_utils:fragment-version:%s'
+
+_caches = {}
+
+
+def fragment_cache():
+    """
+    Returns the cache backend fragments are stored in, the one named by
+    ``TEMPLATE_UTILS_FRAGMENT_CACHE`` (``"default"`` by default).
+    """
+    alias = getattr(settings, 'TEMPLATE_UTILS_FRAGMENT_CACHE', 'default')
+    try:
+        return _caches[alias]
+    except KeyError:
+        pass
+    try:
+        from django.core.cache import caches
+    except ImportError:
+        # Before Django 1.7 get_cache builds a new backend (i.e. a new
+        # memcached client) on every call, so it is only called once
+        from django.core.cache import get_cache
+        backend = _caches[alias] = get_cache(alias)
+        return backend
+    # Django's own handler keeps a backend per alias and thread
+    return caches[alias]
+
+
+def default_timeout():
+    return getattr(settings, 'TEMPLATE_UTILS_FRAGMENT_TIMEOUT',
+                   DEFAULT_TIMEOUT)
+
+
+def _version_key(name):
+    return VERSION_KEY % hashlib.md5(force_bytes(name)).hexdigest()
+
+
+def fragment_version(name, cache=None):
+    """
+    Returns the current version of the fragments named ``name``.
+    """
+    cache = cache or fragment_cache()
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def fragment_key(name, view_name, authenticated, group_names, vary_on=(),
+                 version='', superuser=False, staff=False, permissions=()):
+    """
+    Returns the cache key of a variation of the fragment ``name``.
+    """
+    parts = [version, view_name or '', authenticated and '1' or '0',
+             superuser and '1' or '0', staff and '1' or '0']
+    parts.extend(sorted(group_names))
+    parts.append('')
+    parts.extend(sorted(permissions))
+    parts.append('')
+    parts.extend(six.text_type(value) for value in vary_on)
+    digest = hashlib.md5(force_bytes(':'.join(urlquote(part)
+                                              for part in parts)))
+    return FRAGMENT_KEY % (urlquote(name), digest.hexdigest())
+
+
+def invalidate_fragment(*names):
+    """
+    Drops every cached variation of the fragments with the given names.
+    """
+    cache = fragment_cache()
+    cache.set_many(dict((_version_key(name), uuid.uuid4().hex)
+                        for name in names), VERSION_TIMEOUT)
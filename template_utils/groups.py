@@ -0,0 +1,239 @@
+"""
+Cached group membership and permissions for the ``ifmember`` and ``ifperm``
+tags.
+
+The names of the groups a user belongs to, and the permissions the user is
+granted (directly or through groups), are each loaded with a single query
+the first time they are needed and kept on the user object, which lives as
+long as the request. Optionally, they are also kept in Django's cache
+framework across requests (see ``TEMPLATE_UTILS_GROUP_CACHE_TIMEOUT``), and
+invalidated whenever a user's groups or permissions change, or a group is
+renamed, deleted or has its permissions changed.
+
+So that no query is made while rendering, they can be loaded beforehand,
+in the view with ``preload`` or for every request with
+``PreloadGroupsMiddleware``. With ``TEMPLATE_UTILS_REQUIRE_PRELOADED_GROUPS``
+the tags then refuse to load them, raising ``GroupsNotPreloaded``.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+
+GROUP_NAMES_ATTR = '_template_utils_group_names'
+PERMISSIONS_ATTR = '_template_utils_permissions'
+CACHE_KEY = 'template_utils:groups:%s'
+PERMISSIONS_CACHE_KEY = 'template_utils:perms:%s'
+
+
+def is_authenticated(user):
+    """
+    Supports ``is_authenticated`` both as a method and as a property.
+    """
+    authenticated = user.is_authenticated
+    if callable(authenticated):
+        authenticated = authenticated()
+    return authenticated
+
+
+class GroupsNotPreloaded(ImproperlyConfigured):
+    pass
+
+
+def require_preloaded():
+    """
+    Returns whether group names and permissions must have been preloaded
+    (see ``preload``) instead of being loaded when they are first checked,
+    ``TEMPLATE_UTILS_REQUIRE_PRELOADED_GROUPS`` (``False`` by default).
+    """
+    return getattr(settings, 'TEMPLATE_UTILS_REQUIRE_PRELOADED_GROUPS', False)
+
+
+def cache_timeout():
+    """
+    Returns the number of seconds group names and permissions are cached
+    across requests, or ``None`` if the cross-request cache is disabled
+    (the default).
+    """
+    return getattr(settings, 'TEMPLATE_UTILS_GROUP_CACHE_TIMEOUT', None)
+
+
+def _cached(user, attr, key, load, preloading=False):
+    """
+    Returns ``load(user)``, memoized on ``user`` as ``attr`` and in the
+    cross-request cache as ``key`` when it is enabled.
+    """
+    try:
+        return getattr(user, attr)
+    except AttributeError:
+        pass
+    if not is_authenticated(user):
+        value = frozenset()
+    elif not preloading and require_preloaded():
+        raise GroupsNotPreloaded(
+            'The groups and permissions of %r were not preloaded; call '
+            'template_utils.groups.preload or add PreloadGroupsMiddleware.'
+            % user)
+    else:
+        value = None
+        timeout = cache_timeout()
+        if timeout:
+            value = cache.get(key % user.pk)
+        if value is None:
+            value = load(user)
+            if timeout:
+                cache.set(key % user.pk, value, timeout)
+    setattr(user, attr, value)
+    return value
+
+
+def get_group_names(user, preloading=False):
+    """
+    Returns a frozenset with the names of the groups ``user`` belongs to.
+
+    Costs at most one query per user object: prefetched groups are used
+    when available, the result is stored on the user, and it is looked up in
+    the cross-request cache first when that is enabled.
+    """
+    prefetched = getattr(user, '_prefetched_objects_cache', {})
+    if 'groups' in prefetched and not hasattr(user, GROUP_NAMES_ATTR):
+        names = frozenset(group.name for group in prefetched['groups'])
+        setattr(user, GROUP_NAMES_ATTR, names)
+    return _cached(user, GROUP_NAMES_ATTR, CACHE_KEY, _load_group_names,
+                   preloading)
+
+
+def _load_group_names(user):
+    return frozenset(user.groups.values_list('name', flat=True))
+
+
+def get_permissions(user, preloading=False):
+    """
+    Returns a frozenset with the ``"app_label.codename"`` permissions
+    granted to ``user``, either directly or through its groups.
+
+    Same as ``get_group_names``, it costs at most one query per user
+    object. The permissions ``ModelBackend`` already cached on the user are
+    used when available. Inactive users have no permissions.
+    """
+    if not getattr(user, 'is_active', False):
+        return frozenset()
+    perm_cache = getattr(user, '_perm_cache', None)
+    if perm_cache is not None and not hasattr(user, PERMISSIONS_ATTR):
+        setattr(user, PERMISSIONS_ATTR, frozenset(perm_cache))
+    return _cached(user, PERMISSIONS_ATTR, PERMISSIONS_CACHE_KEY,
+                   _load_permissions, preloading)
+
+
+def _load_permissions(user):
+    opts = get_user_model()._meta
+    direct = opts.get_field('user_permissions').related_query_name()
+    groups = opts.get_field('groups').related_query_name()
+    permissions = Permission.objects.filter(
+        Q(**{direct: user.pk}) | Q(**{'group__%s' % groups: user.pk})
+    ).values_list('content_type__app_label', 'codename').distinct()
+    return frozenset('%s.%s' % permission for permission in permissions)
+
+
+def preload(user, permissions=False):
+    """
+    Loads the names of the groups of ``user``, and its permissions if
+    ``permissions``, so checking them while rendering makes no queries.
+    Returns the user.
+    """
+    get_group_names(user, preloading=True)
+    if permissions:
+        get_permissions(user, preloading=True)
+    return user
+
+
+class PreloadGroupsMiddleware(object):
+    """
+    Preloads the groups of the user of every request (and its permissions
+    with ``TEMPLATE_UTILS_PRELOAD_PERMISSIONS``) before the view is called.
+    It must come after ``AuthenticationMiddleware``.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        user = getattr(request, 'user', None)
+        if user is not None:
+            preload(user, getattr(settings,
+                                  'TEMPLATE_UTILS_PRELOAD_PERMISSIONS', False))
+
+
+def has_permissions(user, permissions, require_all=False):
+    """
+    Returns whether ``user`` has any (or all, if ``require_all``) of the
+    given permissions. Active superusers have every permission.
+    """
+    if getattr(user, 'is_active', False) and \
+            getattr(user, 'is_superuser', False):
+        return True
+    granted = get_permissions(user)
+    if require_all:
+        return frozenset(permissions) <= granted
+    return not granted.isdisjoint(permissions)
+
+
+def invalidate_group_names(user_pks):
+    """
+    Drops the cached group names and permissions of the given users.
+    """
+    if cache_timeout():
+        keys = []
+        for pk in user_pks:
+            keys.extend((CACHE_KEY % pk, PERMISSIONS_CACHE_KEY % pk))
+        cache.delete_many(keys)
+
+
+def _group_user_pks(group_pks):
+    return list(get_user_model().objects.filter(
+        groups__in=group_pks).values_list('pk', flat=True))
+
+
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    ``m2m_changed`` receiver invalidating the users whose groups or
+    permissions changed, including through their groups' permissions.
+    """
+    if not cache_timeout():
+        return
+    user_model = get_user_model()
+    if sender is user_model.groups.through:
+        field = 'groups'
+    elif sender is user_model.user_permissions.through:
+        field = 'user_permissions'
+    else:
+        field = None
+    if field is not None:
+        if not reverse:
+            if action.startswith('post_'):
+                invalidate_group_names([instance.pk])
+        elif action == 'pre_clear':
+            # The users are unknown once the relation is cleared
+            invalidate_group_names(list(user_model.objects.filter(
+                **{field: instance}).values_list('pk', flat=True)))
+        elif action in ('post_add', 'post_remove'):
+            invalidate_group_names(pk_set)
+    elif sender is Group.permissions.through:
+        if not reverse:
+            if action.startswith('post_'):
+                invalidate_group_names(_group_user_pks([instance.pk]))
+        elif action == 'pre_clear':
+            invalidate_group_names(_group_user_pks(
+                instance.group_set.values_list('pk', flat=True)))
+        elif action in ('post_add', 'post_remove'):
+            invalidate_group_names(_group_user_pks(pk_set))
+
+
+def group_changed(sender, instance, **kwargs):
+    """
+    ``post_save``/``pre_delete`` receiver for ``Group``, as renaming or
+    deleting a group changes the names of its users' groups.
+    """
+    if kwargs.get('created'):
+        return
+    if cache_timeout() and instance.pk is not None:
+        invalidate_group_names(_group_user_pks([instance.pk]))
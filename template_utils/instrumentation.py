@@ -0,0 +1,204 @@
+"""
+Opt-in per-request instrumentation of the template_utils tags and filters.
+
+With ``TEMPLATE_UTILS_INSTRUMENTATION = True`` and
+``template_utils.instrumentation.InstrumentationMiddleware`` in
+``MIDDLEWARE_CLASSES``, every tag and filter of the template_utils libraries
+records, for each request, how many times it was called, the total and
+maximum time it took and the queries it made. At the end of the request the
+middleware:
+
+- sends the ``request_instrumented`` signal with the request and the stats,
+  for APM integrations,
+- logs a summary to the ``template_utils.instrumentation`` logger,
+- and adds it to the response as the ``X-Template-Utils-Timing`` header
+  (see ``TEMPLATE_UTILS_INSTRUMENTATION_HEADER``; ``None`` disables it).
+
+The times of a block tag include the tags and filters inside it.
+
+The tags and filters are wrapped only when the middleware is enabled, so
+when it is not they are not touched at all. Templates compiled before the
+middleware is loaded are not instrumented.
+"""
+from functools import wraps
+import logging
+import threading
+from timeit import default_timer
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.dispatch import Signal
+from django.template.base import get_library
+
+LIBRARIES = ('templateutils_filters', 'templateutils_nav',
+             'templateutils_tags')
+
+DEFAULT_HEADER = 'X-Template-Utils-Timing'
+
+request_instrumented = Signal(providing_args=['request', 'stats'])
+
+logger = logging.getLogger('template_utils.instrumentation')
+
+_local = threading.local()
+_originals = []
+_install_lock = threading.Lock()
+
+
+class CallStats(object):
+    """
+    The calls of a tag or filter during a request. Times are in seconds.
+    """
+    __slots__ = ('calls', 'total', 'max', 'queries')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.queries = 0
+
+    def add(self, elapsed, queries):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.queries += queries
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __repr__(self):
+        return '<CallStats %r>' % self.as_dict()
+
+
+def enabled():
+    return getattr(settings, 'TEMPLATE_UTILS_INSTRUMENTATION', False)
+
+
+def start_recording():
+    """
+    Starts recording the calls made by the current thread.
+    """
+    _local.stats = {}
+
+
+def stop_recording():
+    """
+    Stops recording the calls made by the current thread and returns a dict
+    of ``CallStats`` by tag or filter name, or ``None`` if it wasn't
+    recording.
+    """
+    stats = getattr(_local, 'stats', None)
+    _local.stats = None
+    return stats
+
+
+def timed(name, func):
+    """
+    Wraps ``func`` to record its calls as ``name`` while recording.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return func(*args, **kwargs)
+        queries = len(connection.queries)
+        start = default_timer()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = default_timer() - start
+            try:
+                call_stats = stats[name]
+            except KeyError:
+                call_stats = stats[name] = CallStats()
+            call_stats.add(elapsed, len(connection.queries) - queries)
+    return wrapper
+
+
+def _timed_filter(name, func):
+    wrapper = timed(name, func)
+    # Argument checks inspect the undecorated filter
+    wrapper._decorated_function = getattr(func, '_decorated_function', func)
+    return wrapper
+
+
+def _timed_tag(name, compile_func):
+    def compile_timed(parser, token):
+        node = compile_func(parser, token)
+        node.render = timed(name, node.render)
+        return node
+    return compile_timed
+
+
+def install():
+    """
+    Wraps the tags and filters of the template_utils libraries to record
+    their calls. Calling it more than once has no further effect.
+    """
+    with _install_lock:
+        if _originals:
+            return
+        for library_name in LIBRARIES:
+            library = get_library(library_name)
+            for name, func in list(library.filters.items()):
+                _originals.append((library.filters, name, func))
+                library.filters[name] = _timed_filter(name, func)
+            for name, compile_func in list(library.tags.items()):
+                _originals.append((library.tags, name, compile_func))
+                library.tags[name] = _timed_tag(name, compile_func)
+
+
+def uninstall():
+    """
+    Restores the tags and filters wrapped by ``install``.
+    """
+    with _install_lock:
+        while _originals:
+            registry, name, func = _originals.pop()
+            registry[name] = func
+
+
+def format_stats(stats):
+    """
+    Returns a one-line summary of ``stats``, slowest first, in milliseconds.
+    """
+    ordered = sorted(stats.items(), key=lambda item: -item[1].total)
+    return ', '.join(
+        '%s;calls=%d;total=%.3f;max=%.3f;queries=%d' % (
+            name, call_stats.calls, call_stats.total * 1000,
+            call_stats.max * 1000, call_stats.queries)
+        for name, call_stats in ordered)
+
+
+class InstrumentationMiddleware(object):
+    """
+    Records the calls of the template_utils tags and filters of every
+    request when ``TEMPLATE_UTILS_INSTRUMENTATION`` is set, and reports them
+    at the end of the request.
+    """
+    def __init__(self):
+        if not enabled():
+            raise MiddlewareNotUsed
+        install()
+
+    def process_request(self, request):
+        # Queries are only counted when they are logged
+        request._template_utils_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        start_recording()
+
+    def process_response(self, request, response):
+        stats = stop_recording()
+        if stats is None:
+            return response
+        connection.use_debug_cursor = request._template_utils_debug_cursor
+        request_instrumented.send(sender=self.__class__, request=request,
+                                  stats=stats)
+        if stats:
+            summary = format_stats(stats)
+            logger.debug('%s %s', request.path, summary)
+            header = getattr(settings, 'TEMPLATE_UTILS_INSTRUMENTATION_HEADER',
+                             DEFAULT_HEADER)
+            if header:
+                response[header] = summary
+        return response
@@ -0,0 +1,210 @@
+"""
+Jinja2 support: the template_utils filters, tags and url functions as a
+Jinja2 extension.
+
+They are the same functions the Django template libraries use, sharing
+their caches, so the output is the same in both kinds of templates::
+
+    from jinja2 import Environment
+
+    env = Environment(
+        extensions=['template_utils.jinja.TemplateUtilsExtension'])
+
+or ``environment()``, which builds such an environment from the same
+options as ``jinja2.Environment``. Templates are then loaded through the
+environment's own loader, e.g. ``env.get_template('report.html')``.
+
+The extension adds:
+
+- The filters ``currency``, ``integer``, ``grouped``, ``percent``,
+  ``compact``, ``nolinebrs``, ``cleanup``, ``startswith``,
+  ``startswith_any``, ``prefix_map``, ``creditcard``, ``maskpans`` and
+  ``verbose``.
+- The tags ``{% ifmember %}`` and ``{% ifperm %}``, whose names have to be
+  quoted (unquoted names are variables), and ``{% mkrange %}``.
+- The tests ``member`` and ``perm``, i.e. ``user is member("Admins")``.
+- The globals ``active_url(request, url_name, ...)``,
+  ``current_url(request, url_name)``, ``active_section(request, section,
+  ...)`` and ``current_section(request)``.
+"""
+from jinja2 import Environment, nodes
+from jinja2.ext import Extension
+from jinja2.runtime import Undefined
+from markupsafe import Markup
+from template_utils.ranges import lazy_range, pagination_window
+from template_utils.templatetags import templateutils_filters as filters
+from template_utils.templatetags import templateutils_nav as nav
+
+
+def keep_markup(func):
+    """
+    Keeps markup safe through a filter, as Django does with its safe
+    strings.
+    """
+    def wrapper(value, *args):
+        result = func(value, *args)
+        if hasattr(value, '__html__'):
+            result = Markup(result)
+        return result
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def active_url(request, url_name, **kwargs):
+    return Markup(nav.active_url(request, url_name, **kwargs))
+
+
+def current_url(request, url_name):
+    return Markup(nav.current_url(request, url_name))
+
+
+def active_section(request, section, **kwargs):
+    return Markup(nav.active_section(request, section, **kwargs))
+
+
+def is_member(user, *names):
+    """
+    Jinja test: whether ``user`` belongs to any of the given groups.
+    """
+    return check_groups(user, names)
+
+
+def has_perm(user, *permissions):
+    """
+    Jinja test: whether ``user`` has any of the given permissions.
+    """
+    return check_permissions(user, permissions)
+
+
+def check_groups(user, names, require_all=False):
+    from template_utils.groups import get_group_names
+    if user is None or isinstance(user, Undefined):
+        return False
+    groups = get_group_names(user)
+    if require_all:
+        return frozenset(names) <= groups
+    return not groups.isdisjoint(names)
+
+
+def check_permissions(user, permissions, require_all=False):
+    from template_utils.groups import has_permissions
+    if user is None or isinstance(user, Undefined):
+        return False
+    return has_permissions(user, permissions, require_all)
+
+
+class TemplateUtilsExtension(Extension):
+    tags = set(['ifmember', 'ifperm', 'mkrange'])
+
+    def __init__(self, environment):
+        super(TemplateUtilsExtension, self).__init__(environment)
+        environment.filters.update({
+            'currency': filters.currency,
+            'integer': filters.integer,
+            'grouped': filters.grouped,
+            'percent': filters.percent,
+            'compact': filters.compact,
+            'nolinebrs': keep_markup(filters.nolinebrs),
+            'cleanup': keep_markup(filters.cleanup),
+            'startswith': filters.startswith,
+            'startswith_any': filters.startswith_any,
+            'prefix_map': filters.prefix_map,
+            'creditcard': filters.creditcard,
+            'maskpans': keep_markup(filters.maskpans),
+            'verbose': filters.verbose,
+        })
+        environment.tests.update({
+            'member': is_member,
+            'perm': has_perm,
+        })
+        environment.globals.update({
+            'active_url': active_url,
+            'current_url': current_url,
+            'active_section': active_section,
+            'current_section': nav.current_section,
+        })
+
+    def parse(self, parser):
+        token = next(parser.stream)
+        if token.value == 'mkrange':
+            return self.parse_mkrange(parser, token)
+        return self.parse_check(parser, token)
+
+    def parse_check(self, parser, token):
+        """
+        ``{% ifmember "A" [or|and "B" ...] %} ... [{% else %} ...]
+        {% endifmember %}``, and the same for ``ifperm``.
+        """
+        names = [parser.parse_primary()]
+        operators = set()
+        while parser.stream.current.test_any('name:or', 'name:and'):
+            operators.add(next(parser.stream).value)
+            names.append(parser.parse_primary())
+        if len(operators) > 1:
+            parser.fail("Tag '%s' accepts several names joined either by "
+                        "'and' or by 'or'." % token.value, token.lineno)
+        end_tag = 'name:end' + token.value
+        body = parser.parse_statements(('name:else', end_tag))
+        if next(parser.stream).test('name:else'):
+            else_ = parser.parse_statements((end_tag,), drop_needle=True)
+        else:
+            else_ = []
+        method = '_check_groups'
+        if token.value == 'ifperm':
+            method = '_check_permissions'
+        node = nodes.If(lineno=token.lineno)
+        node.test = self.call_method(method, [
+            nodes.Name('user', 'load'), nodes.List(names),
+            nodes.Const(operators == set(['and']))])
+        node.body = body
+        node.elif_ = []
+        node.else_ = else_
+        return node
+
+    def parse_mkrange(self, parser, token):
+        """
+        ``{% mkrange [start,] stop[, step] as name %}`` or
+        ``{% mkrange window current, last[, neighbours] as name %}``; the
+        commas are optional.
+        """
+        # "window" is a variable when it's the only argument
+        window = parser.stream.current.test('name:window') and \
+            not parser.stream.look().test_any('name:as', 'comma')
+        if window:
+            next(parser.stream)
+        args = []
+        while not parser.stream.current.test('name:as'):
+            if args:
+                parser.stream.skip_if('comma')
+            args.append(parser.parse_expression())
+        next(parser.stream)
+        target = parser.parse_assign_target(name_only=True)
+        if not 1 + window <= len(args) <= 3:
+            parser.fail('mkrange accepts from %d to 3 arguments.'
+                        % (1 + window), token.lineno)
+        call = self.call_method('_range', [nodes.Const(window),
+                                           nodes.List(args)])
+        return nodes.Assign(target, call, lineno=token.lineno)
+
+    def _check_groups(self, user, names, require_all):
+        return check_groups(user, names, require_all)
+
+    def _check_permissions(self, user, permissions, require_all):
+        return check_permissions(user, permissions, require_all)
+
+    def _range(self, window, args):
+        args = [int(arg) for arg in args]
+        if window:
+            return pagination_window(*args)
+        return lazy_range(*args)
+
+
+def environment(**options):
+    """
+    Returns a Jinja2 environment with the template_utils extension, taking
+    the same options as ``jinja2.Environment``.
+    """
+    extensions = list(options.pop('extensions', ()))
+    extensions.append(TemplateUtilsExtension)
+    return Environment(extensions=extensions, **options)
@@ -0,0 +1,24 @@
+"""
+A template loader folding the literal arguments of filters (see
+``template_utils.folding``) as templates are loaded.
+
+It works as Django's cached loader (of Django 1.7 and earlier, whose
+``find_template`` it extends), wrapping the given loaders::
+
+    TEMPLATE_LOADERS = (
+        ('template_utils.loaders.Loader', (
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        )),
+    )
+"""
+from django.template.loaders import cached
+from template_utils.folding import fold_arguments
+
+
+class Loader(cached.Loader):
+    def find_template(self, name, dirs=None):
+        template, origin = super(Loader, self).find_template(name, dirs)
+        if hasattr(template, 'render'):
+            fold_arguments(template)
+        return template, origin
@@ -0,0 +1,39 @@
+"""
+Reports what warming up the caches of template_utils takes and saves (see
+``template_utils.warmup``)::
+
+    python manage.py templateutils_warmup
+
+Every step is run twice in this process, cold and then warm; the
+difference approximates what warming up saves the first request of a
+worker, but nothing is measured in a forked worker. The size of the caches
+is approximate as well (see ``warmup.footprint``), and says nothing about
+how much of it stays shared between the workers.
+"""
+import time
+from django.core.management.base import NoArgsCommand
+from template_utils import warmup
+
+
+class Command(NoArgsCommand):
+    help = ('Warms up the url, choice and locale caches of template_utils '
+            'and reports their approximate size and the cold and warm time '
+            'of every step.')
+
+    def handle_noargs(self, **options):
+        saved = 0
+        for name, step in warmup.STEPS:
+            start = time.time()
+            count = step()
+            cold = time.time() - start
+            start = time.time()
+            step()
+            warm = time.time() - start
+            saved += cold - warm
+            self.stdout.write('%-8s %5d entries %10.2f ms cold %8.2f ms warm'
+                              % (name, count, cold * 1000, warm * 1000))
+        warmup.freeze()
+        self.stdout.write('approximate cache size      %.1f KB' % (
+            warmup.footprint() / 1024.0))
+        self.stdout.write('cold vs warm step time      %.2f ms' % (
+            saved * 1000))
@@ -0,0 +1,271 @@
+"""
+Masking of credit card and bank account numbers, used by the ``creditcard``
+and ``maskpans`` filters and usable on its own for bulk exports.
+
+``mask_rows`` and ``mask_csv`` are generators: rows are read, masked and
+handed over one at a time, so memory use stays constant no matter how many
+rows are exported::
+
+    with open('accounts.csv') as source, open('masked.csv', 'w') as target:
+        csv.writer(target).writerows(
+            mask_csv(source, ['account'], header=True, group=4))
+
+``mask_pans`` finds and masks the card numbers (PANs) in free text::
+
+    mask_pans('Paid with 4111 1111 1111 1111, thanks!')
+    # -> 'Paid with **** **** **** 1111, thanks!'
+"""
+import csv
+import re
+from django.utils import six
+
+
+class Masker(object):
+    """
+    Masks values so only their last ``visible`` characters are shown.
+
+    ``group`` optionally splits the masked value with ``separator``, either
+    in groups of the same size (i.e. ``4`` gives ``**** **** **** 3456``)
+    or of the given sizes (i.e. ``(4, 6, 5)`` gives ``**** ****** *0002``).
+    Values other than strings are masked as their text representation, but
+    ``None`` is returned untouched.
+    """
+
+    def __init__(self, visible=4, char='*', group=None, separator=' '):
+        self.visible = max(int(visible), 0)
+        self.char = char
+        self.separator = separator
+        if isinstance(group, six.integer_types):
+            group = (group,)
+        self.group_sizes = tuple(group or ())
+        self._masks = {}
+
+    def _mask(self, length):
+        # Masks are cached by length, as most values share a handful of them
+        try:
+            return self._masks[length]
+        except KeyError:
+            mask = self._masks[length] = self.char * length
+            return mask
+
+    def group(self, value):
+        """
+        Splits ``value`` with the separator according to the group sizes.
+        """
+        sizes = self.group_sizes
+        groups = []
+        start = 0
+        index = 0
+        length = len(value)
+        while start < length:
+            size = sizes[min(index, len(sizes) - 1)]
+            groups.append(value[start:start + size])
+            start += size
+            index += 1
+        return self.separator.join(groups)
+
+    def __call__(self, value):
+        if value is None:
+            return value
+        if not isinstance(value, six.string_types):
+            value = six.text_type(value)
+        hidden = max(len(value) - self.visible, 0)
+        masked = self._mask(hidden) + value[hidden:]
+        if self.group_sizes:
+            return self.group(masked)
+        return masked
+
+
+_maskers = {}
+
+
+def get_masker(visible=4):
+    """
+    Returns a cached ``Masker`` showing the last ``visible`` characters.
+    """
+    try:
+        return _maskers[visible]
+    except KeyError:
+        masker = _maskers[visible] = Masker(visible)
+        return masker
+
+
+def mask(value, visible=4, **options):
+    """
+    Masks a single value. See ``Masker`` for the options.
+    """
+    if options:
+        return Masker(visible, **options)(value)
+    return get_masker(visible)(value)
+
+
+def mask_rows(rows, columns, visible=4, **options):
+    """
+    Lazily masks the given columns of an iterable of rows.
+
+    Rows may be dicts, with ``columns`` being keys, or sequences, with
+    ``columns`` being indexes; a masked copy of each row is yielded and the
+    original rows are left untouched. See ``Masker`` for the options.
+    """
+    masker = Masker(visible, **options)
+    columns = list(columns)
+    for row in rows:
+        if isinstance(row, dict):
+            row = dict(row)
+            for column in columns:
+                if column in row:
+                    row[column] = masker(row[column])
+        else:
+            row = list(row)
+            for column in columns:
+                if column < len(row):
+                    row[column] = masker(row[column])
+        yield row
+
+
+def mask_csv(stream, columns, visible=4, header=False, dialect='excel',
+             **options):
+    """
+    Lazily reads CSV rows from a file-like ``stream`` and yields them with
+    the given columns masked.
+
+    If ``header`` is true, the first row is yielded untouched and columns
+    may be given by name as well as by index.
+    """
+    reader = csv.reader(stream, dialect)
+    columns = list(columns)
+    if header:
+        try:
+            names = next(reader)
+        except StopIteration:
+            return
+        yield names
+        columns = [names.index(column)
+                   if isinstance(column, six.string_types) else column
+                   for column in columns]
+    for row in mask_rows(reader, columns, visible, **options):
+        yield row
+
+
+# Runs of at least 13 digits, with single spaces or dashes between them.
+# A run that is matched is consumed whole, but one that fails before its
+# 13th digit is tried again from each of its later digits, so a character
+# is looked at up to 12 times (along with the separators around it): the
+# scan takes linear time, with a constant of about 12, not a single pass.
+PAN_RUN = re.compile(r'\d(?:[ -]?\d){12,}')
+MIN_PAN_LENGTH = 13
+MAX_PAN_LENGTH = 19
+
+_DIGIT = re.compile(r'\d')
+# The value of each digit, and the sum of the digits of each digit doubled
+_VALUES = dict((str(digit), digit) for digit in range(10))
+_DOUBLED = dict((str(digit), (0, 2, 4, 6, 8, 1, 3, 5, 7, 9)[digit])
+                for digit in range(10))
+
+
+def luhn_valid(digits):
+    """
+    Returns whether a string of digits passes the Luhn check, as every card
+    number does.
+    """
+    total = 0
+    for digit in digits[-1::-2]:
+        total += _VALUES[digit]
+    for digit in digits[-2::-2]:
+        total += _DOUBLED[digit]
+    return total % 10 == 0
+
+
+class PanMasker(object):
+    """
+    Masks the card numbers found in free text as ``Masker`` does, keeping
+    the spaces or dashes in them (i.e. ``4111-1111-1111-1111`` becomes
+    ``****-****-****-1111``).
+
+    A card number is a run of 13 to 19 digits passing the Luhn check, where
+    the digits may be separated by single spaces or dashes. If a longer run
+    contains several numbers, or a number followed by other digits (such as
+    an expiry date), the numbers are found among its groups of digits.
+    """
+
+    def __init__(self, visible=4, char='*'):
+        self.visible = max(int(visible), 0)
+        self.replacement = char.replace('\\', '\\\\')
+
+    def mask_run(self, run):
+        """
+        Masks the card numbers in a run of digits, spaces and dashes.
+        """
+        digits = run.replace(' ', '').replace('-', '')
+        if len(digits) <= MAX_PAN_LENGTH and luhn_valid(digits):
+            return self.mask_number(run)
+        # The (start, end) of every group of digits, and how many digits
+        # there are before each group
+        groups = [match.span() for match in re.finditer(r'\d+', run)]
+        before = [0]
+        for start, end in groups:
+            before.append(before[-1] + end - start)
+        bits = []
+        position = 0
+        first = 0
+        while first < len(groups):
+            # The longest number starting at the first group
+            found = None
+            for last in six.moves.xrange(first, len(groups)):
+                length = before[last + 1] - before[first]
+                if length > MAX_PAN_LENGTH:
+                    break
+                if length >= MIN_PAN_LENGTH and luhn_valid(
+                        digits[before[first]:before[last + 1]]):
+                    found = last
+            if found is None:
+                first += 1
+                continue
+            start, end = groups[first][0], groups[found][1]
+            bits.append(run[position:start])
+            bits.append(self.mask_number(run[start:end]))
+            position = end
+            first = found + 1
+        bits.append(run[position:])
+        return ''.join(bits)
+
+    def mask_number(self, number):
+        # Everything before the last visible digits is masked
+        end = len(number)
+        visible = self.visible
+        while visible and end:
+            end -= 1
+            if number[end] not in ' -':
+                visible -= 1
+        return _DIGIT.sub(self.replacement, number[:end]) + number[end:]
+
+    def __call__(self, text):
+        if text is None:
+            return text
+        if not isinstance(text, six.string_types):
+            text = six.text_type(text)
+        return PAN_RUN.sub(lambda match: self.mask_run(match.group()), text)
+
+
+_pan_maskers = {}
+
+
+def get_pan_masker(visible=4):
+    """
+    Returns a cached ``PanMasker`` showing the last ``visible`` digits.
+    """
+    try:
+        return _pan_maskers[visible]
+    except KeyError:
+        masker = _pan_maskers[visible] = PanMasker(visible)
+        return masker
+
+
+def mask_pans(text, visible=4, **options):
+    """
+    Masks the card numbers found in ``text``. See ``PanMasker`` for the
+    options.
+    """
+    if options:
+        return PanMasker(visible, **options)(text)
+    return get_pan_masker(visible)(text)
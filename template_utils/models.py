@@ -1,3 +1,78 @@
-from django.db import models
+import sys
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from template_utils.sections import sections_changed
+from template_utils.urlcache import urlconf_changed
 
-# Create your models here.
+# Django imports the models of every installed app at startup, so the
+# receivers below import template_utils.groups (and with it the auth
+# models and the cache framework) or template_utils.choices (and the
+# forms) only when there is something to invalidate.
+
+
+def _groups():
+    # Group names and permissions only outlive the request (and need to be
+    # invalidated) when the cross-request cache is enabled
+    if getattr(settings, 'TEMPLATE_UTILS_GROUP_CACHE_TIMEOUT', None):
+        from template_utils import groups
+        return groups
+    return None
+
+
+def user_groups_changed(sender, **kwargs):
+    groups = _groups()
+    if groups is not None:
+        groups.user_groups_changed(sender, **kwargs)
+
+
+def group_changed(sender, **kwargs):
+    groups = _groups()
+    if groups is not None and sender is groups.Group:
+        groups.group_changed(sender, **kwargs)
+
+
+def choice_model_changed(sender, **kwargs):
+    # Nothing is cached until template_utils.choices is loaded
+    choices = sys.modules.get('template_utils.choices')
+    if choices is not None:
+        choices.model_changed(sender, **kwargs)
+
+
+def choice_request_finished(sender, **kwargs):
+    choices = sys.modules.get('template_utils.choices')
+    if choices is not None:
+        choices.request_finished(sender, **kwargs)
+
+m2m_changed.connect(user_groups_changed,
+                    dispatch_uid='template_utils.user_groups_changed')
+post_save.connect(group_changed,
+                  dispatch_uid='template_utils.group_saved')
+pre_delete.connect(group_changed,
+                   dispatch_uid='template_utils.group_deleted')
+post_save.connect(choice_model_changed,
+                  dispatch_uid='template_utils.choice_model_saved')
+post_delete.connect(choice_model_changed,
+                    dispatch_uid='template_utils.choice_model_deleted')
+request_finished.connect(choice_request_finished,
+                         dispatch_uid='template_utils.choice_request_finished')
+
+try:
+    from django.core.signals import setting_changed
+except ImportError:
+    # Before Django 1.8 setting_changed belongs to the test framework, and
+    # is only sent by override_settings: its receivers are connected only
+    # if django.test is already loaded (by the test runner, or by the auth
+    # hashers), rather than importing it in every process.
+    setting_changed = getattr(sys.modules.get('django.test.signals'),
+                              'setting_changed', None)
+if setting_changed is not None:
+    setting_changed.connect(urlconf_changed,
+                            dispatch_uid='template_utils.urlconf_changed')
+    setting_changed.connect(sections_changed,
+                            dispatch_uid='template_utils.sections_changed')
@@ -0,0 +1,215 @@
+"""
+The number formatting shared by the ``integer``, ``currency``, ``grouped``,
+``percent`` and ``compact`` filters.
+
+Values are formatted in their own type, so none goes through ``float`` (or
+any other conversion) it doesn't need. Floats are rounded and formatted by
+the float formatting of C. Ints and Decimals are rounded half up exactly,
+with integer arithmetic on their digits (``str`` of a Decimal is cheap,
+unlike ``quantize`` and ``format``, which are pure Python on Python 2); other
+rounding modes use a quantizer cached per precision::
+
+    format_fixed(Decimal('1234567.891'), 2, grouped=True)  # '1,234,567.89'
+    format_percent(Decimal('0.1234'), 1)  # '12.3%'
+    format_compact(3400000)  # '3.4M'
+"""
+from decimal import Context, Decimal, InvalidOperation, ROUND_HALF_UP
+import math
+from django.utils import six
+
+# The exact types formatted; anything else is returned untouched.
+NUMBER_TYPES = six.integer_types + (float, Decimal)
+
+COMPACT_SUFFIXES = ('', 'k', 'M', 'B', 'T')
+_COMPACT_UNITS = tuple(1000 ** power
+                       for power in range(len(COMPACT_SUFFIXES)))
+
+_quantizers = {}
+_float_specs = {}
+_powers = {}
+
+
+def quantizer(places):
+    """
+    Returns the cached ``Decimal`` to quantize to ``places`` decimal places.
+    """
+    try:
+        return _quantizers[places]
+    except KeyError:
+        quantum = _quantizers[places] = Decimal(1).scaleb(-places)
+        return quantum
+
+
+def round_decimal(value, places, rounding=ROUND_HALF_UP):
+    """
+    Rounds a ``Decimal`` to ``places`` decimal places. Infinity and NaN are
+    returned untouched.
+    """
+    if not value.is_finite():
+        return value
+    try:
+        return value.quantize(quantizer(places), rounding)
+    except InvalidOperation:
+        # More digits than the precision of the current context
+        context = Context(prec=max(value.adjusted(), 0) + places + 1)
+        return value.quantize(quantizer(places), rounding, context)
+
+
+def places_argument(arg):
+    """
+    Converts the decimal places argument of a filter.
+    """
+    places = int(arg)
+    if places < 0:
+        raise ValueError('the decimal places must be a positive integer')
+    return places
+
+
+def _pow10(places):
+    try:
+        return _powers[places]
+    except KeyError:
+        power = _powers[places] = 10 ** places
+        return power
+
+
+def _scaled(value, shift):
+    """
+    Returns whether a finite int or ``Decimal`` is negative, and its absolute
+    value times ``10 ** shift`` rounded half up to an int.
+    """
+    if not isinstance(value, Decimal):
+        negative = value < 0
+        value = abs(value)
+        if shift >= 0:
+            return negative, value * _pow10(shift)
+        unit = _pow10(-shift)
+        scaled, remainder = divmod(value, unit)
+        return negative, scaled + (remainder * 2 >= unit)
+    digits = str(value)
+    negative = digits[0] == '-'
+    if negative:
+        digits = digits[1:]
+    if 'E' in digits:
+        # Exponent notation, for very big or very small values
+        digits = format(abs(value), 'f')
+    whole, _, fraction = digits.partition('.')
+    digits = whole + fraction
+    point = len(whole) + shift
+    if point >= len(digits):
+        return negative, int(digits) * _pow10(point - len(digits))
+    if point < 0:
+        return negative, 0
+    scaled = int(digits[:point]) if point else 0
+    return negative, scaled + (digits[point] >= '5')
+
+
+def _format_scaled(negative, scaled, places, grouped):
+    whole, fraction = divmod(scaled, _pow10(places))
+    number = format(whole, ',d' if grouped else 'd')
+    if places:
+        number = '%s.%0*d' % (number, places, fraction)
+    if negative and scaled:
+        # Not rounded to zero
+        number = '-' + number
+    return number
+
+
+def format_fixed(value, places=0, grouped=False, rounding=ROUND_HALF_UP):
+    """
+    Returns an int, float or ``Decimal`` with ``places`` decimal places, and
+    its integer part grouped by thousands with commas if ``grouped``.
+    Decimals are rounded with ``rounding``; floats are rounded by C.
+    """
+    if isinstance(value, float):
+        try:
+            spec = _float_specs[places, grouped]
+        except KeyError:
+            spec = _float_specs[places, grouped] = '%s.%df' % (
+                ',' if grouped else '', places)
+        number = format(value, spec)
+        if number[0] == '-' and not number.strip('-0.,'):
+            # Rounded to zero
+            number = number[1:]
+        return number
+    if isinstance(value, Decimal) and (
+            rounding != ROUND_HALF_UP or not value.is_finite()):
+        # Once rounded, rounding half up below leaves it as is
+        value = round_decimal(value, places, rounding)
+        if not value.is_finite():
+            return format(value)
+    negative, scaled = _scaled(value, places)
+    return _format_scaled(negative, scaled, places, grouped)
+
+
+def to_integer(value):
+    """
+    Returns ``value`` truncated to an int, or untouched if it can't be.
+    """
+    if type(value) in six.integer_types:
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        return value
+
+
+def format_grouped(value, places=0):
+    """
+    Returns a number grouped by thousands, i.e. ``1,234,567``.
+    """
+    if type(value) not in NUMBER_TYPES:
+        return value
+    return format_fixed(value, places, grouped=True)
+
+
+def format_percent(value, places=0):
+    """
+    Returns a ratio as a percentage, i.e. ``0.1234`` as ``12%``.
+    """
+    if type(value) not in NUMBER_TYPES:
+        return value
+    if isinstance(value, float):
+        return format_fixed(value * 100, places) + '%'
+    if isinstance(value, Decimal) and not value.is_finite():
+        return format(value) + '%'
+    negative, scaled = _scaled(value, places + 2)
+    return _format_scaled(negative, scaled, places, False) + '%'
+
+
+def _compact(value, power, places):
+    if isinstance(value, float):
+        return format_fixed(value / _COMPACT_UNITS[power], places)
+    negative, scaled = _scaled(value, places - 3 * power)
+    return _format_scaled(negative, scaled, places, False)
+
+
+def format_compact(value, places=1):
+    """
+    Returns a number abbreviated with a suffix, i.e. ``1234`` as ``1.2k``
+    and ``3400000`` as ``3.4M``, with at most ``places`` decimal places.
+    """
+    if type(value) not in NUMBER_TYPES:
+        return value
+    last = len(COMPACT_SUFFIXES) - 1
+    if isinstance(value, Decimal):
+        if not value.is_finite():
+            return format(value)
+        # Comparing Decimals is slow; their exponent gives the unit
+        power = min(max(value.adjusted(), 0) // 3, last)
+    else:
+        if isinstance(value, float) and (
+                math.isinf(value) or math.isnan(value)):
+            return format(value)
+        magnitude = abs(value)
+        power = 0
+        while power < last and magnitude >= _COMPACT_UNITS[power + 1]:
+            power += 1
+    number = _compact(value, power, places)
+    if power < last and len(number.lstrip('-').partition('.')[0]) > 3:
+        # Rounded up to the next unit, i.e. 999950 to 1000.0k
+        power += 1
+        number = _compact(value, power, places)
+    if '.' in number:
+        number = number.rstrip('0').rstrip('.')
+    return number + COMPACT_SUFFIXES[power]
@@ -0,0 +1,156 @@
+"""
+Prefix indexes for the ``startswith_any`` and ``prefix_map`` filters.
+
+A ``PrefixIndex`` is a trie of prefixes, so finding the longest prefix of a
+value takes one dict lookup per character of the value, no matter how many
+prefixes there are. Literal prefixes given to the filters are compiled once
+(when the template is loaded, see ``template_utils.folding``); prefixes
+given as tuples or frozensets are compiled the first time they are seen and
+cached by identity. Dicts, lists and sets can be modified in place, so they
+are compiled on every call: build a ``PrefixIndex`` once instead::
+
+    SKU_CLASSES = PrefixIndex({'A1': 'apparel', 'B7': 'books'})
+    SKU_CLASSES.get('A1-0042')  # -> 'apparel'
+"""
+from collections import OrderedDict
+import threading
+from django.utils import six
+
+# Number of prefix strings and of tuples or frozensets whose indexes are
+# cached
+MAXSIZE = 256
+COLLECTIONS_MAXSIZE = 16
+
+# Key of the (prefix, value) entry of a trie node; characters are strings
+_END = None
+
+
+class PrefixIndex(object):
+    """
+    A trie of prefixes, built from a mapping of prefixes to values or from
+    an iterable of prefixes (each mapped to itself).
+    """
+
+    def __init__(self, prefixes):
+        if isinstance(prefixes, dict):
+            items = prefixes.items()
+        else:
+            items = ((prefix, prefix) for prefix in prefixes)
+        self.root = {}
+        self.size = 0
+        for prefix, value in items:
+            prefix = six.text_type(prefix)
+            node = self.root
+            for char in prefix:
+                node = node.setdefault(char, {})
+            if _END not in node:
+                self.size += 1
+            node[_END] = (prefix, value)
+
+    def __len__(self):
+        return self.size
+
+    def match(self, value):
+        """
+        Returns the ``(prefix, value)`` entry of the longest prefix of
+        ``value``, or ``None``.
+        """
+        node = self.root
+        found = node.get(_END)
+        for char in value:
+            node = node.get(char)
+            if node is None:
+                break
+            found = node.get(_END, found)
+        return found
+
+    def prefix(self, value, default=''):
+        """
+        Returns the longest prefix of ``value``, or ``default``.
+        """
+        found = self.match(value)
+        return default if found is None else found[0]
+
+    def get(self, value, default=None):
+        """
+        Returns the value mapped to the longest prefix of ``value``, or
+        ``default``.
+        """
+        found = self.match(value)
+        return default if found is None else found[1]
+
+
+def parse_prefixes(text):
+    """
+    Parses comma separated prefixes, i.e. ``"A1,B7"``.
+    """
+    # Empty prefixes (i.e. of a trailing comma) would match any value
+    return [prefix for prefix in (bit.strip() for bit in text.split(','))
+            if prefix]
+
+
+def parse_prefix_map(text):
+    """
+    Parses comma separated ``prefix:value`` pairs, i.e.
+    ``"A1:apparel,B7:books"``.
+    """
+    mapping = {}
+    for pair in text.split(','):
+        if not pair.strip():
+            continue
+        prefix, separator, value = pair.partition(':')
+        if not separator:
+            raise ValueError('%r is not a prefix:value pair' % pair)
+        mapping[prefix.strip()] = value.strip()
+    return mapping
+
+
+_indexes = {}
+_collections = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_prefix_index(prefixes, mapping=False):
+    """
+    Returns a cached ``PrefixIndex`` of ``prefixes``: a ``PrefixIndex``, a
+    string of comma separated prefixes (``prefix:value`` pairs if
+    ``mapping``), a dict or any other iterable of prefixes.
+
+    Tuples and frozensets are cached by identity, so a cached index is
+    found in constant time whatever their size; only the last
+    ``COLLECTIONS_MAXSIZE`` of them are kept. Dicts, lists, sets and other
+    iterables aren't cached, as they may have changed since the last call:
+    their index is built on every call, at a cost proportional to their
+    size, so pass a ``PrefixIndex`` for anything but small collections.
+    """
+    if isinstance(prefixes, PrefixIndex):
+        return prefixes
+    if isinstance(prefixes, six.string_types):
+        key = (mapping, prefixes)
+        index = _indexes.get(key)
+        if index is None:
+            parse = parse_prefix_map if mapping else parse_prefixes
+            index = PrefixIndex(parse(prefixes))
+            with _lock:
+                if len(_indexes) >= MAXSIZE:
+                    _indexes.clear()
+                _indexes[key] = index
+        return index
+    if not isinstance(prefixes, (tuple, frozenset)):
+        # Mutable collections may have changed, and iterators can only be
+        # read once
+        return PrefixIndex(prefixes)
+    cached = _collections.get(id(prefixes))
+    if cached is not None and cached[0] is prefixes:
+        return cached[1]
+    index = PrefixIndex(prefixes)
+    with _lock:
+        # The collection is kept, so its id can't be reused while cached
+        _collections[id(prefixes)] = (prefixes, index)
+        while len(_collections) > COLLECTIONS_MAXSIZE:
+            _collections.popitem(last=False)
+    return index
+
+
+def get_prefix_map(prefixes):
+    return get_prefix_index(prefixes, mapping=True)
@@ -0,0 +1,138 @@
+"""
+Lazy ranges and pagination windows for the ``mkrange`` tag.
+
+``lazy_range`` behaves like Python 3's ``range``: it takes O(1) memory no
+matter how many items it spans, and supports ``len``, indexing, slicing,
+``in`` and iteration (and so ``{% for %}`` with its ``forloop``). On Python 3
+it is the builtin ``range`` itself.
+"""
+from django.utils import six
+
+
+class LazyRange(object):
+    """
+    An immutable arithmetic sequence, like Python 3's ``range``.
+    """
+    __slots__ = ('start', 'stop', 'step', '_len')
+
+    def __init__(self, *args):
+        if not 1 <= len(args) <= 3:
+            raise TypeError('range expected 1 to 3 arguments, got %d'
+                            % len(args))
+        start, stop, step = 0, None, 1
+        if len(args) == 1:
+            stop, = args
+        elif len(args) == 2:
+            start, stop = args
+        else:
+            start, stop, step = args
+        if step == 0:
+            raise ValueError('range() arg 3 must not be zero')
+        self.start, self.stop, self.step = start, stop, step
+        if step > 0:
+            length = (stop - start + step - 1) // step
+        else:
+            length = (start - stop - step - 1) // -step
+        self._len = max(length, 0)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        try:
+            return iter(six.moves.xrange(
+                self.start, self.start + self._len * self.step, self.step))
+        except OverflowError:
+            return self._iterate()
+
+    def _iterate(self):
+        value = self.start
+        for i in six.moves.xrange(self._len):
+            yield value
+            value += self.step
+
+    def __reversed__(self):
+        value = self.start + (self._len - 1) * self.step
+        for i in six.moves.xrange(self._len):
+            yield value
+            value -= self.step
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            length = len(LazyRange(start, stop, step))
+            new_start = self.start + start * self.step
+            new_step = self.step * step
+            return LazyRange(new_start, new_start + length * new_step,
+                             new_step)
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('range object index out of range')
+        return self.start + index * self.step
+
+    def __contains__(self, value):
+        if not isinstance(value, six.integer_types) or not self._len:
+            return value in iter(self)
+        offset = value - self.start
+        return offset % self.step == 0 and 0 <= offset // self.step < self._len
+
+    def __eq__(self, other):
+        if not isinstance(other, LazyRange):
+            return NotImplemented
+        if self._len != other._len:
+            return False
+        return not self._len or (self.start == other.start and (
+            self._len == 1 or self.step == other.step))
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash((self._len, self.start if self._len else None,
+                     self.step if self._len > 1 else None))
+
+    def __repr__(self):
+        if self.step == 1:
+            return 'range(%d, %d)' % (self.start, self.stop)
+        return 'range(%d, %d, %d)' % (self.start, self.stop, self.step)
+
+
+if six.PY3:
+    lazy_range = range
+else:
+    lazy_range = LazyRange
+
+
+def pagination_window(current, last, neighbours=2, first=1):
+    """
+    Returns the pages to show around ``current`` in a pagination of the
+    pages ``first`` to ``last``: the first and last pages, the ``neighbours``
+    pages at each side of ``current``, and ``None`` where pages are skipped.
+
+    Only the pages shown are computed, so it costs the same for 20 pages as
+    for 20 million. For example, ``pagination_window(9, 200)`` is
+    ``[1, None, 7, 8, 9, 10, 11, None, 200]``.
+    """
+    if last < first:
+        return []
+    current = min(max(current, first), last)
+    low = max(current - neighbours, first)
+    high = min(current + neighbours, last)
+    pages = []
+    if low > first:
+        pages.append(first)
+        if low > first + 2:
+            pages.append(None)
+        elif low == first + 2:
+            # Skipping a single page takes as much room as showing it
+            pages.append(first + 1)
+    pages.extend(six.moves.xrange(low, high + 1))
+    if high < last:
+        if high < last - 2:
+            pages.append(None)
+        elif high == last - 2:
+            pages.append(last - 1)
+        pages.append(last)
+    return pages
@@ -0,0 +1,212 @@
+"""
+Section-level matching of request paths, for the ``active_section`` tag.
+
+Sections are configured with ``TEMPLATE_UTILS_NAV_SECTIONS``, a dict
+mapping section names to the entries that make them active::
+
+    TEMPLATE_UTILS_NAV_SECTIONS = {
+        'home': ['home'],
+        'orders': ['orders', 'order_detail'],
+        'shop': ['shop:'],
+        'reports': ['/reports/'],
+        'featured': [('shop:product', ['featured'])],
+    }
+
+An entry is either:
+
+- A url name, optionally namespaced. Its arguments, if any, match any
+  value (``order_detail`` matches ``/orders/<anything>/``).
+- A url name with its arguments, as ``(name, args)`` or
+  ``(name, args, kwargs)``.
+- A namespace followed by a colon, matching every url included under it.
+- A path, starting with a slash.
+
+Entries match the paths they start (segment by segment, so ``/orders/``
+matches ``/orders/123/edit/`` but not ``/orders-archive/``), except the
+root url, which only matches itself. When several entries match, the
+longest one wins, and an exact segment wins over an argument.
+
+The entries are compiled into a trie of path segments once per urlconf,
+script prefix and language (urls reverse differently in every language
+under ``i18n_patterns``), so finding the section of a path is a single walk
+over its segments no matter how many entries there are.
+"""
+import threading
+from django.conf import settings
+from django.core.urlresolvers import (
+    get_resolver,
+    get_script_prefix,
+    get_urlconf,
+    NoReverseMatch,
+)
+from django.utils import six, translation
+from django.utils.regex_helper import normalize
+from template_utils.urlcache import cached_reverse
+
+SECTION_ATTR = '_template_utils_section'
+
+
+class _Node(object):
+    __slots__ = ('children', 'wildcard', 'section', 'exact')
+
+    def __init__(self):
+        self.children = {}
+        self.wildcard = None
+        self.section = None
+        # The section of the root url, which only matches itself
+        self.exact = None
+
+
+def split_path(path):
+    return [segment for segment in path.split('/') if segment]
+
+
+class SectionIndex(object):
+    """
+    A trie of the path segments of the entries of ``sections``, a dict
+    mapping section names to lists of entries.
+    """
+
+    def __init__(self, sections, urlconf=None, script_prefix=None):
+        self.urlconf = urlconf
+        if script_prefix is None:
+            script_prefix = get_script_prefix()
+        self.script_prefix = script_prefix
+        self.root_depth = len(split_path(script_prefix))
+        self.resolver = get_resolver(urlconf)
+        self.root = _Node()
+        for section, entries in sections.items():
+            for entry in entries:
+                for segments in self.entry_paths(entry):
+                    self.add(segments, section)
+
+    def add(self, segments, section):
+        """
+        Adds the path given by its ``segments`` (``None`` segments match
+        anything) to ``section``.
+        """
+        node = self.root
+        for segment in segments:
+            if segment is None:
+                if node.wildcard is None:
+                    node.wildcard = _Node()
+                node = node.wildcard
+            else:
+                node = node.children.setdefault(segment, _Node())
+        if len(segments) > self.root_depth:
+            node.section = section
+        else:
+            node.exact = section
+
+    def entry_paths(self, entry):
+        """
+        Returns the segments of the paths an entry of a section stands for.
+        """
+        if not isinstance(entry, six.string_types):
+            name, args = entry[0], entry[1]
+            kwargs = entry[2] if len(entry) > 2 else None
+            path = cached_reverse(name, self.urlconf, args, kwargs)
+            return [split_path(path)]
+        if entry.startswith('/'):
+            return [split_path(self.script_prefix + entry.lstrip('/'))]
+        namespaces = entry.split(':')
+        name = namespaces.pop()
+        resolver = self.resolver
+        prefix = self.script_prefix
+        for namespace in namespaces:
+            try:
+                pattern, resolver = resolver.namespace_dict[namespace]
+            except KeyError:
+                raise NoReverseMatch('%r is not a registered namespace'
+                                     % namespace)
+            # Namespace prefixes are regular expressions
+            prefix += normalize(pattern)[0][0]
+        if not name:
+            return [self.format_segments(prefix)]
+        possibilities = resolver.reverse_dict.getlist(name)
+        if not possibilities:
+            raise NoReverseMatch("Reverse for '%s' not found." % entry)
+        return [self.format_segments(prefix + result)
+                for possibility, pattern, defaults in possibilities
+                for result, params in possibility]
+
+    def format_segments(self, path_format):
+        # Reverse formats hold arguments as %(name)s and literal % as %%
+        return [None if '%(' in segment else segment.replace('%%', '%')
+                for segment in split_path(path_format)]
+
+    def match(self, path):
+        """
+        Returns the name of the section ``path`` belongs to, or ``None``.
+        """
+        segments = split_path(path)
+        found, found_depth = None, -1
+        length = len(segments)
+        stack = [(self.root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if depth > found_depth:
+                section = node.section
+                if depth == length and node.exact is not None:
+                    section = node.exact
+                if section is not None:
+                    found, found_depth = section, depth
+            if depth < length:
+                # Exact segments are walked first, so they win ties
+                if node.wildcard is not None:
+                    stack.append((node.wildcard, depth + 1))
+                child = node.children.get(segments[depth])
+                if child is not None:
+                    stack.append((child, depth + 1))
+        return found
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_section_index(urlconf=None):
+    """
+    Returns the ``SectionIndex`` of ``TEMPLATE_UTILS_NAV_SECTIONS`` for the
+    current urlconf, script prefix and language, built once and rebuilt
+    when the urlconf is reloaded.
+    """
+    if urlconf is None:
+        urlconf = get_urlconf()
+    script_prefix = get_script_prefix()
+    key = (urlconf, script_prefix, translation.get_language())
+    index = _indexes.get(key)
+    if index is None or index.resolver is not get_resolver(urlconf):
+        sections = getattr(settings, 'TEMPLATE_UTILS_NAV_SECTIONS', {})
+        index = SectionIndex(sections, urlconf, script_prefix)
+        with _lock:
+            _indexes[key] = index
+    return index
+
+
+def clear_section_indexes():
+    with _lock:
+        _indexes.clear()
+
+
+def current_section(request):
+    """
+    Returns the name of the section of the request's path, or ``None``.
+    It is looked up once per request.
+    """
+    try:
+        return getattr(request, SECTION_ATTR)
+    except AttributeError:
+        pass
+    section = get_section_index().match(request.path)
+    setattr(request, SECTION_ATTR, section)
+    return section
+
+
+def sections_changed(sender, setting, **kwargs):
+    """
+    ``setting_changed`` receiver dropping the indexes when the sections or
+    the urlconf are overridden.
+    """
+    if setting in ('TEMPLATE_UTILS_NAV_SECTIONS', 'ROOT_URLCONF'):
+        clear_section_indexes()
@@ -0,0 +1,321 @@
+"""
+Streaming rendering of templates, for ``StreamingHttpResponse``.
+
+``Template.render`` builds the whole page before returning it, so the first
+byte of a big report is sent only once its last row is rendered, and the
+memory taken grows with the page. ``stream_template`` yields the page in
+chunks instead, as its nodes render::
+
+    def sales_report(request):
+        return render_streaming(request, 'reports/sales.html',
+                                {'rows': Sale.objects.iterator()})
+
+Nodes are streamed through the nodes they contain when they know how to:
+the ``ifmember`` and ``ifperm`` tags (which define ``iter_render``), and
+the ``for``, ``if``, ``with``, ``autoescape``, ``block`` and ``extends``
+tags. A ``for`` loop over a lazy sequence (an ``mkrange`` range, a
+generator, a queryset's ``iterator()`` or a queryset not loaded yet) takes
+the same memory no matter how many rows it renders (see ``iter_for``).
+Every other node, such as ``include`` and ``spaceless``, is rendered as a
+whole, as usual.
+"""
+from django.conf import settings
+from django.template import RequestContext
+from django.template.base import Node, TextNode, VariableDoesNotExist
+from django.db.models.query import QuerySet
+from django.template.defaulttags import (
+    AutoEscapeControlNode,
+    ForNode,
+    IfNode,
+    WithNode,
+)
+from django.template.loader import get_template, select_template
+from django.template.loader_tags import (
+    BLOCK_CONTEXT_KEY,
+    BlockContext,
+    BlockNode,
+    ExtendsNode,
+)
+from django.utils import six
+from django.utils.encoding import force_text
+
+DEFAULT_CHUNK_SIZE = 8192
+
+
+def chunk_size():
+    """
+    Returns the minimum length of the chunks yielded by ``stream_template``,
+    ``TEMPLATE_UTILS_STREAM_CHUNK_SIZE`` (8192 characters by default).
+    """
+    return getattr(settings, 'TEMPLATE_UTILS_STREAM_CHUNK_SIZE',
+                   DEFAULT_CHUNK_SIZE)
+
+
+def iter_nodelist(nodelist, context):
+    """
+    Yields the output of the nodes of ``nodelist`` as they render.
+    """
+    for node in nodelist:
+        if not isinstance(node, Node):
+            yield force_text(node)
+            continue
+        if isinstance(node, TextNode):
+            yield node.s
+            continue
+        stream = getattr(node, 'iter_render', None)
+        if stream is None:
+            stream = STREAMERS.get(type(node))
+            if stream is None:
+                # NodeList.render_node annotates errors in TEMPLATE_DEBUG
+                render_node = getattr(nodelist, 'render_node', None)
+                if render_node is None:
+                    yield force_text(node.render(context))
+                else:
+                    yield force_text(render_node(node, context))
+                continue
+            stream = stream(node, context)
+        else:
+            stream = stream(context)
+        for bit in stream:
+            yield bit
+
+
+def _with_last(values):
+    """
+    Yields the items of an iterable and whether each one is the last,
+    looking ahead one item.
+    """
+    iterator = iter(values)
+    try:
+        item = next(iterator)
+    except StopIteration:
+        return
+    for following in iterator:
+        yield item, False
+        item = following
+    yield item, True
+
+
+def iter_for(node, context):
+    """
+    Streams a ``for`` loop, as ``ForNode.render`` renders it, but for a
+    sequence without a length (a generator, an iterator or a queryset not
+    loaded yet, unless it prefetches relations), which is iterated lazily:
+    ``forloop.last`` is found by looking ahead one item, and
+    ``forloop.revcounter`` and ``revcounter0`` aren't set.
+    """
+    parentloop = context['forloop'] if 'forloop' in context else {}
+    try:
+        values = node.sequence.resolve(context, True)
+    except VariableDoesNotExist:
+        values = []
+    if values is None:
+        values = []
+    if isinstance(values, QuerySet) and values._result_cache is None and \
+            not values._prefetch_related_lookups:
+        # len() would load every row and keep them in the queryset.
+        # iterator() ignores prefetch_related(), so querysets prefetching
+        # relations are loaded as usual rather than querying once per row
+        values = values.iterator()
+    if hasattr(values, '__len__'):
+        len_values = len(values)
+        if node.is_reversed:
+            values = reversed(values)
+        items = ((item, i == len_values - 1)
+                 for i, item in enumerate(values))
+    else:
+        len_values = None
+        if node.is_reversed:
+            # Reversing takes every item anyway
+            values = reversed(list(values))
+        items = _with_last(values)
+    empty = True
+    context.push()
+    try:
+        unpack = len(node.loopvars) > 1
+        loop_dict = context['forloop'] = {'parentloop': parentloop}
+        for i, (item, last) in enumerate(items):
+            empty = False
+            loop_dict['counter0'] = i
+            loop_dict['counter'] = i + 1
+            if len_values is not None:
+                loop_dict['revcounter'] = len_values - i
+                loop_dict['revcounter0'] = len_values - i - 1
+            loop_dict['first'] = (i == 0)
+            loop_dict['last'] = last
+            pop_context = False
+            if unpack:
+                try:
+                    unpacked_vars = dict(zip(node.loopvars, item))
+                except TypeError:
+                    pass
+                else:
+                    pop_context = True
+                    context.update(unpacked_vars)
+            else:
+                context[node.loopvars[0]] = item
+            for bit in iter_nodelist(node.nodelist_loop, context):
+                yield bit
+            if pop_context:
+                context.pop()
+    finally:
+        context.pop()
+    if empty:
+        for bit in iter_nodelist(node.nodelist_empty, context):
+            yield bit
+
+
+def iter_with(node, context):
+    """
+    Streams a ``with`` tag, as ``WithNode.render`` renders it.
+    """
+    values = dict((key, value.resolve(context))
+                  for key, value in six.iteritems(node.extra_context))
+    context.update(values)
+    try:
+        for bit in iter_nodelist(node.nodelist, context):
+            yield bit
+    finally:
+        context.pop()
+
+
+def iter_autoescape(node, context):
+    """
+    Streams an ``autoescape`` tag, as ``AutoEscapeControlNode.render``
+    renders it.
+    """
+    old_setting = context.autoescape
+    context.autoescape = node.setting
+    try:
+        for bit in iter_nodelist(node.nodelist, context):
+            yield bit
+    finally:
+        context.autoescape = old_setting
+
+
+def iter_if(node, context):
+    """
+    Streams the branch of an ``if`` tag whose condition is true.
+    """
+    for condition, nodelist in node.conditions_nodelists:
+        if condition is not None:
+            try:
+                match = condition.eval(context)
+            except VariableDoesNotExist:
+                match = None
+        else:
+            match = True
+        if match:
+            return iter_nodelist(nodelist, context)
+    return ()
+
+
+def iter_block(node, context):
+    """
+    Streams a ``block``, as ``BlockNode.render`` renders it.
+    """
+    block_context = context.render_context.get(BLOCK_CONTEXT_KEY)
+    context.push()
+    try:
+        if block_context is None:
+            context['block'] = node
+            for bit in iter_nodelist(node.nodelist, context):
+                yield bit
+        else:
+            push = block = block_context.pop(node.name)
+            if block is None:
+                block = node
+            # A new block keeps the context, as BlockNode.render does
+            block = BlockNode(block.name, block.nodelist)
+            block.context = context
+            context['block'] = block
+            try:
+                for bit in iter_nodelist(block.nodelist, context):
+                    yield bit
+            finally:
+                if push is not None:
+                    block_context.push(node.name, push)
+    finally:
+        context.pop()
+
+
+def iter_extends(node, context):
+    """
+    Streams the parent template of an ``extends`` tag, as
+    ``ExtendsNode.render`` renders it.
+    """
+    parent = node.get_parent(context)
+    if BLOCK_CONTEXT_KEY not in context.render_context:
+        context.render_context[BLOCK_CONTEXT_KEY] = BlockContext()
+    block_context = context.render_context[BLOCK_CONTEXT_KEY]
+    block_context.add_blocks(node.blocks)
+    for child in parent.nodelist:
+        # The root template's blocks are in the block context as well
+        if not isinstance(child, TextNode):
+            if not isinstance(child, ExtendsNode):
+                block_context.add_blocks(dict(
+                    (block.name, block) for block in
+                    parent.nodelist.get_nodes_by_type(BlockNode)))
+            break
+    return iter_nodelist(parent.nodelist, context)
+
+
+# Streamers of Django's nodes, by node class
+STREAMERS = {
+    ForNode: iter_for,
+    IfNode: iter_if,
+    WithNode: iter_with,
+    AutoEscapeControlNode: iter_autoescape,
+    BlockNode: iter_block,
+    ExtendsNode: iter_extends,
+}
+
+
+def iter_template(template, context):
+    """
+    Yields the output of ``template`` as it renders, like
+    ``Template.render``.
+    """
+    context.render_context.push()
+    try:
+        for bit in iter_nodelist(template.nodelist, context):
+            yield bit
+    finally:
+        context.render_context.pop()
+
+
+def stream_template(template, context, size=None):
+    """
+    Yields ``template`` rendered with ``context`` in chunks of at least
+    ``size`` characters (see ``chunk_size``), but the last one.
+
+    ``template`` may be a template, a template name or a list of names, as
+    ``select_template`` takes them.
+    """
+    if isinstance(template, six.string_types):
+        template = get_template(template)
+    elif isinstance(template, (list, tuple)):
+        template = select_template(template)
+    if size is None:
+        size = chunk_size()
+    bits, length = [], 0
+    for bit in iter_template(template, context):
+        bits.append(bit)
+        length += len(bit)
+        if length >= size:
+            yield ''.join(bits)
+            bits, length = [], 0
+    if bits:
+        yield ''.join(bits)
+
+
+def render_streaming(request, template_name, dictionary=None,
+                     response_class=None, **kwargs):
+    """
+    Same as the ``render`` shortcut, but returns a ``StreamingHttpResponse``
+    streaming the template (see ``stream_template``).
+    """
+    if response_class is None:
+        from django.http import StreamingHttpResponse as response_class
+    context = RequestContext(request, dictionary)
+    return response_class(stream_template(template_name, context), **kwargs)
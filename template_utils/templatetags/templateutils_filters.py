@@ -1,24 +1,44 @@
 from decimal import Decimal
 import locale
-import re
-from django.utils import timezone
 from django import template
+from django.template import TemplateSyntaxError
 from django.template.defaultfilters import stringfilter
-from django.forms import (
-    CharField,
-    TypedChoiceField,
-    DecimalField,
-    IntegerField,
-    BooleanField,
-    NullBooleanField,
-    DateField,
-    DateTimeField,
+from django.utils import six
+from django.utils.html import format_html, format_html_join
+from template_utils import text
+from template_utils.folding import argument, folds_argument
+from template_utils.formatting import (
+    format_currency_column,
+    get_currency_format,
 )
+from template_utils.masking import get_masker, get_pan_masker
+from template_utils.numeric import (
+    format_compact,
+    format_grouped,
+    format_percent,
+    places_argument,
+    to_integer,
+)
+from template_utils.prefixes import get_prefix_index, get_prefix_map
 
 register = template.Library()
 
 
+def currency_format(locale_name):
+    try:
+        return get_currency_format(locale_name)
+    except locale.Error:
+        raise ValueError('the locale is not available')
+
+
+def text_argument(arg):
+    if not isinstance(arg, six.string_types):
+        raise TypeError('a string is required')
+    return arg
+
+
 @register.filter
+@folds_argument(currency_format)
 def currency(value, other_locale=None):
     """
     Returns value represented as currency for the give locale.
@@ -31,16 +51,71 @@ def currency(value, other_locale=None):
 
     Produces:
     $13.00
+
+    The locale's format is built once and cached; rendering never changes
+    the process locale (see ``template_utils.formatting``). A literal locale
+    is looked up when the template is loaded (see
+    ``template_utils.folding``).
     """
     if type(value) in (int, float, Decimal):
-        try:
-            locale.setlocale(locale.LC_ALL, '%s.utf8' % (other_locale or 'en_US'))
-        except locale.Error:
-            locale.setlocale(locale.LC_ALL, '%s.UTF-8' % (other_locale or 'en_US'))
-        return locale.currency(value, grouping=True)
+        return argument(other_locale, get_currency_format).format(value)
     return value
 
 
+@register.tag
+def currencycolumn(parser, token):
+    """
+    Formats a whole column of rows as currency in one pass and stores the
+    rows, each paired with its formatted value, in the context, so
+    displaying thousands of values doesn't have to run the ``currency``
+    filter once per cell. The output is the same as the one of the
+    ``currency`` filter, and the rows are left untouched.
+
+    Usage:
+        {% currencycolumn rows field [locale] as var_name %}
+
+    For example:
+        {% currencycolumn products "price" as priced %}
+        {% for product, price in priced %}
+          <td>{{ product.name }}</td><td>{{ price }}</td>
+        {% endfor %}
+
+    ``rows`` may be a sequence or an iterator of dicts or objects, or a
+    QuerySet, and is iterated only once: loop over the pairs instead of
+    ``rows`` (see ``format_currency_column``).
+    """
+    bits = token.split_contents()
+    tag = bits.pop(0)
+    if len(bits) not in (4, 5) or bits[-2] != 'as':
+        raise TemplateSyntaxError('%s accepts the syntax: {%% %s rows field '
+                                  '[locale] as var_name %%}' % (tag, tag))
+    var_name = bits.pop()
+    bits.pop()
+    args = [parser.compile_filter(bit) for bit in bits]
+    return CurrencyColumnNode(var_name, *args)
+
+
+class CurrencyColumnNode(template.Node):
+    def __init__(self, var_name, rows, field, other_locale=None):
+        self.var_name = var_name
+        self.rows = rows
+        self.field = field
+        self.other_locale = other_locale
+
+    def render(self, context):
+        rows = self.rows.resolve(context)
+        field = self.field.resolve(context)
+        other_locale = None
+        if self.other_locale is not None:
+            other_locale = self.other_locale.resolve(context)
+        if rows is None or isinstance(rows, six.string_types):
+            # A missing variable; testing a QuerySet's truth would load it
+            rows = ()
+        context[self.var_name] = format_currency_column(rows, field,
+                                                        other_locale)
+        return ''
+
+
 @register.filter
 def integer(value):
     """
@@ -49,11 +124,57 @@ def integer(value):
     Usage::
     {{ value|int }}
     {% tag_that_requires_int value|int %}
+
+    Values that can't be converted are returned untouched.
     """
-    try:
-        return int(value)
-    except ValueError:
-        return value
+    return to_integer(value)
+
+
+@register.filter
+@folds_argument(places_argument)
+def grouped(value, places=0):
+    """
+    Returns a number with its thousands separated by commas, and the given
+    amount of decimal places (none by default).
+
+    Usage::
+    {{ value|grouped }} -> 1,234,568
+    {{ value|grouped:2 }} -> 1,234,567.89
+
+    Ints, floats and Decimals are formatted in their own type (see
+    ``template_utils.numeric``); anything else is returned untouched.
+    """
+    return format_grouped(value, argument(places, places_argument))
+
+
+@register.filter
+@folds_argument(places_argument)
+def percent(value, places=0):
+    """
+    Returns a ratio as a percentage, with the given amount of decimal places
+    (none by default).
+
+    Usage::
+    {{ value|percent }} -> 12%
+    {{ value|percent:1 }} -> 12.3%
+
+    Where value is 0.1234.
+    """
+    return format_percent(value, argument(places, places_argument))
+
+
+@register.filter
+@folds_argument(places_argument)
+def compact(value, places=1):
+    """
+    Returns a number abbreviated with a k, M, B or T suffix, with at most the
+    given amount of decimal places (1 by default).
+
+    Usage::
+    {{ value|compact }} -> 1.2k, 3.4M, 999, 5B
+    {{ value|compact:2 }} -> 1.23k
+    """
+    return format_compact(value, argument(places, places_argument))
 
 
 @register.filter
@@ -61,11 +182,32 @@ def nolinebrs(value):
     """
     Removes all <br> tags in the given string.
     """
-    return re.sub('<br\s*\/?>', '', value)
+    return text.cleanup(value, ('br',))
+
+
+@register.filter
+def cleanup(value, transforms=None):
+    """
+    Cleans up the given string in a single pass, applying any of these
+    transforms (all but tag stripping by default):
+
+    - br: removes <br> tags.
+    - paragraphs: removes empty <p> elements.
+    - whitespace: collapses runs of whitespace into a single space.
+    - Any other name is a tag to strip, keeping its content.
+
+    Safe strings are still safe after the cleanup.
+
+    Usage:
+    {{ value|cleanup }}
+    {{ value|cleanup:"br,paragraphs,span,font" }}
+    """
+    return text.cleanup(value, transforms or text.DEFAULT_TRANSFORMS)
 
 
 @register.filter
 @stringfilter
+@folds_argument(text_argument)
 def startswith(value, arg):
     """
     Returns whether the given value starts with the given string arg.
@@ -74,10 +216,47 @@ def startswith(value, arg):
     Usage:
     {{ value|startsvith:"arg" }}
     """
-    return value.startswith(arg)
+    return value.startswith(argument(arg))
+
+
+@register.filter
+@stringfilter
+@folds_argument(get_prefix_index)
+def startswith_any(value, prefixes):
+    """
+    Returns the longest of the given prefixes the value starts with, or an
+    empty string. The prefixes are compiled into a cached index, so a
+    lookup costs the same for 3 prefixes as for 3000.
+
+    <prefixes> may be a string of comma separated prefixes, or a variable
+    holding a list, set or ``template_utils.prefixes.PrefixIndex``.
+
+    Usage:
+    {% if sku|startswith_any:"A1,B7,C" %}...{% endif %}
+    """
+    return argument(prefixes, get_prefix_index).prefix(value)
+
+
+@register.filter
+@stringfilter
+@folds_argument(get_prefix_map)
+def prefix_map(value, mapping):
+    """
+    Returns the value mapped to the longest prefix the value starts with,
+    or an empty string, in a single lookup in a cached prefix index.
+
+    <mapping> may be a string of comma separated prefix:value pairs, or a
+    variable holding a dict or a ``template_utils.prefixes.PrefixIndex``.
+
+    Usage:
+    {{ sku|prefix_map:"A1:apparel,B7:books"|default:"other" }}
+    <tr class="{{ row.sku|prefix_map:sku_classes }}">
+    """
+    return argument(mapping, get_prefix_map).get(value, '')
 
 
 @register.filter
+@folds_argument(get_masker)
 def creditcard(value, arg=4):
     """
     Hides parts of strings such as credit card or bank account numbers to
@@ -91,8 +270,35 @@ def creditcard(value, arg=4):
 
     Produces:
     ************3456
+
+    To mask whole exports, or to group the masked digits, use the
+    ``template_utils.masking`` API this filter is built on.
+    """
+    return argument(arg, get_masker)(value)
+
+
+@register.filter(is_safe=True)
+@stringfilter
+@folds_argument(get_pan_masker)
+def maskpans(value, arg=4):
+    """
+    Masks the credit card numbers found in a text, such as user supplied
+    messages, showing only the last amount of numbers of each. Spaces and
+    dashes in the numbers are kept, and only numbers passing the Luhn check
+    are masked, so other long numbers are left alone.
+
+    Usage: {{ message|maskpans }} or {{ message|maskpans:2 }}
+
+    For example:
+    Assuming message is "Paid with 4111-1111-1111-1111, order 1234567"
+    {{ message|maskpans }}
+
+    Produces:
+    Paid with ****-****-****-1111, order 1234567
+
+    The text is scanned once (see ``template_utils.masking.mask_pans``).
     """
-    return '*' * len(value[:-int(arg)]) + value[-int(arg):]
+    return argument(arg, get_pan_masker)(value)
 
 
 @register.filter
@@ -114,28 +320,66 @@ def verbose(bound_field, default=None):
     {{ field|display }}
 
     Produces: The string 'Yes'
+
+    Choice labels, including the ones of model choice fields, are looked up
+    in an index cached on the field (see ``template_utils.choices``), and
+    converters for other field types can be registered (see
+    ``template_utils.display``).
+    """
+    from template_utils.display import display_value
+    return display_value(bound_field, default)
+
+
+@register.tag
+def form_display(parser, token):
+    """
+    Displays every field of a form as read-only, the same way ``verbose``
+    does, in a single pass.
+
+    Without "as", renders a definition list of labels and values. With it,
+    stores a list of (field, value) pairs in the context instead.
+
+    Usage:
+    {% form_display form [default] %}
+    {% form_display form [default] as fields %}
+
+    For example:
+    {% form_display form "N/A" as fields %}
+    {% for field, value in fields %}
+        {{ field.label }}: {{ value }}
+    {% endfor %}
     """
-    NO_DATA_MESSAGE = 'Not Available'
-    if default:
-        NO_DATA_MESSAGE = default
-
-    field = bound_field.field
-
-    # For text and numeric types, return the plain value
-    if isinstance(field, (CharField, DecimalField, IntegerField)):
-        return bound_field.value() if bound_field.value() else NO_DATA_MESSAGE
-    # For boolean type, return a verbose representation of the value
-    elif isinstance(field, (BooleanField, NullBooleanField)):
-        if bound_field.value() is None:
-            return default or 'Maybe'
-        return ('No', 'Yes')[bound_field.value()]
-    # For choices, return the verbose value
-    elif isinstance(field, TypedChoiceField):
-        return dict(field.choices).get(bound_field.value(), NO_DATA_MESSAGE)
-    # For date types, return the age until the current date.
-    if isinstance(field, (DateField, DateTimeField)):
-        today = timezone.datetime.today()
-        if isinstance(field, DateField):
-            today = today.date()
-        age = (today - bound_field.value()).days / 365
-        return age
+    bits = token.split_contents()
+    tag = bits.pop(0)
+    context_name = None
+    if len(bits) > 2 and bits[-2] == 'as':
+        context_name = bits.pop()
+        bits.pop()
+    if len(bits) not in (1, 2):
+        raise TemplateSyntaxError('%s accepts the syntax: {%% %s form '
+                                  '[default] [as context_name] %%}'
+                                  % (tag, tag))
+    args = [parser.compile_filter(bit) for bit in bits]
+    return FormDisplayNode(context_name, *args)
+
+
+class FormDisplayNode(template.Node):
+    def __init__(self, context_name, form, default=None):
+        self.context_name = context_name
+        self.form = form
+        self.default = default
+
+    def render(self, context):
+        from template_utils.display import display_form
+        form = self.form.resolve(context)
+        default = None
+        if self.default is not None:
+            default = self.default.resolve(context)
+        fields = display_form(form, default)
+        if self.context_name:
+            context[self.context_name] = fields
+            return ''
+        items = format_html_join('', '<dt>{0}</dt><dd>{1}</dd>',
+                                 ((field.label, value)
+                                  for field, value in fields))
+        return format_html('<dl>{0}</dl>', items)
@@ -0,0 +1,197 @@
+"""
+The navigation tags: ``active_url``, ``current_url``, ``active_section``,
+``current_section``, ``navmenu`` and ``navitem``.
+
+They are also part of ``templateutils_tags``, but loading this library
+alone doesn't import the auth models, the forms or the cache framework.
+"""
+from django import template
+from django.template import TemplateSyntaxError
+from django.template.base import token_kwargs
+from template_utils import sections
+from template_utils.urlcache import cached_reverse, current_view_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def active_url(request, url_name, **kwargs):
+    """
+    Returns a class to be assiged CSS styling that should make the chosen
+    element highlighted as responsible of being in the active url.
+
+    Usage: Assuming that the reversed url is the current url, this tag will act
+    as follows:
+
+    {% active_url request url_name %} -> class="ui-active-url"
+    {% active_url request url_name class_name=myclass %} -> class="myclass"
+    {% active_url request url_name use_class=False %} -> ui-active-url
+    {% active_url request url_name class_name=myclass use_class=False %} -> myclass
+
+    Where "urlname" is the name of the url to check;
+    this must be defined in your `URLCONF`, otherwise it will raise
+    a NoReverseMatch Error.
+
+    ``use_attr`` is accepted as an alias of ``use_class``.
+
+    Reversed urls are cached (see ``template_utils.urlcache``).
+    """
+    class_name = kwargs.get('class_name', 'ui-active-url')
+    use_class = _use_class(kwargs)
+
+    url = cached_reverse(url_name)
+    if request.path == url:
+        return active_class(class_name, use_class)
+    return ''
+
+
+def _use_class(kwargs):
+    # use_attr is the name active_url used to read
+    return kwargs.get('use_class', kwargs.get('use_attr', True))
+
+
+def active_class(class_name, use_class=True):
+    """
+    Returns the class name, or the whole class attribute if ``use_class``.
+    """
+    if not class_name:
+        return ''
+    return (class_name, ' class="%s"' % class_name)[use_class]
+
+
+@register.simple_tag
+def current_url(request, url_name):
+    """
+    Returns the reversed url only if it is NOT the current url.
+    Otherwise returns the character "`#`"
+
+    Usage:
+    <a href="{% current_url request url_name %}">Some link</a>
+    """
+    url = cached_reverse(url_name)
+    if request.path == url:
+        return '#'
+    return url
+
+
+@register.simple_tag
+def active_section(request, section, **kwargs):
+    """
+    Same as ``active_url``, but for a whole section of the site: the class
+    is returned if the current path belongs to the given section, as
+    configured in ``TEMPLATE_UTILS_NAV_SECTIONS`` (see
+    ``template_utils.sections``).
+
+    Usage:
+    {% active_section request "orders" %} -> class="ui-active-url"
+    {% active_section request "orders" class_name=myclass use_class=False %}
+    -> myclass
+
+    Where the current path is i.e. /orders/123/edit/, and the "orders"
+    section is configured as ['orders', 'order_detail'].
+    """
+    class_name = kwargs.get('class_name', 'ui-active-url')
+    use_class = _use_class(kwargs)
+    if sections.current_section(request) == section:
+        return active_class(class_name, use_class)
+    return ''
+
+
+@register.assignment_tag
+def current_section(request):
+    """
+    Stores the name of the section the current path belongs to, or None.
+
+    Usage:
+    {% current_section request as section %}
+    """
+    return sections.current_section(request)
+
+
+@register.tag
+def navmenu(parser, token):
+    """
+    Highlights the active entries of a whole menu, resolving the current url
+    only once instead of reversing the url of every entry.
+
+    Inside the block, ``{% navitem url_name [url_name ...] %}`` outputs the
+    class attribute of an entry: the active class if the current url is
+    named as any of the given (optionally namespaced) url names, the
+    inactive class otherwise.
+
+    Usage:
+        {% navmenu request [class_name=myclass] [inactive_class=other] %}
+            <li{% navitem "home" %}>...</li>
+            <li{% navitem "shop:orders" "shop:order_detail" %}>...</li>
+        {% endnavmenu %}
+
+    Produces:
+        <li>...</li>
+        <li class="ui-active-url">...</li>
+    """
+    bits = token.split_contents()
+    tag = bits.pop(0)
+    if not bits:
+        raise TemplateSyntaxError("Tag '%s' requires the request." % tag)
+    request = parser.compile_filter(bits.pop(0))
+    options = token_kwargs(bits, parser)
+    if bits or set(options) - set(['class_name', 'inactive_class']):
+        raise TemplateSyntaxError("Tag '%s' only accepts the class_name and "
+                                  "inactive_class options." % tag)
+    nodelist = parser.parse(('endnavmenu',))
+    parser.delete_first_token()
+    return NavMenuNode(request, options, nodelist)
+
+
+class NavMenuNode(template.Node):
+    def __init__(self, request, options, nodelist):
+        self.request = request
+        self.options = options
+        self.nodelist = nodelist
+
+    def render(self, context):
+        request = self.request.resolve(context)
+        options = dict((name, value.resolve(context))
+                       for name, value in self.options.items())
+        menu = {
+            'view_name': current_view_name(request),
+            'active': active_class(options.get('class_name', 'ui-active-url')),
+            'inactive': active_class(options.get('inactive_class')),
+        }
+        context.update({'navmenu': menu})
+        try:
+            return self.nodelist.render(context)
+        finally:
+            context.pop()
+
+
+@register.tag
+def navitem(parser, token):
+    """
+    Outputs the class attribute of an entry of a ``{% navmenu %}`` block.
+    See ``navmenu``.
+    """
+    bits = token.split_contents()
+    tag = bits.pop(0)
+    if not bits:
+        raise TemplateSyntaxError("Tag '%s' requires at least one url name."
+                                  % tag)
+    return NavItemNode([parser.compile_filter(bit) for bit in bits])
+
+
+class NavItemNode(template.Node):
+    def __init__(self, url_names):
+        self.url_names = url_names
+
+    def render(self, context):
+        try:
+            menu = context['navmenu']
+        except KeyError:
+            raise TemplateSyntaxError("'navitem' must be used inside a "
+                                      "'navmenu' block.")
+        if menu['view_name'] is None:
+            return menu['inactive']
+        for url_name in self.url_names:
+            if url_name.resolve(context) == menu['view_name']:
+                return menu['active']
+        return menu['inactive']
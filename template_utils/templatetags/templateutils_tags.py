@@ -1,95 +1,242 @@
 from django import template
 from django.template import resolve_variable, TemplateSyntaxError
-from django.contrib.auth.models import Group
-from django.core.urlresolvers import reverse
+from django.template.base import token_kwargs, Variable
+from django.utils import six
+from template_utils import fragments
+from template_utils.ranges import lazy_range, pagination_window
+from template_utils.templatetags import templateutils_nav
+# Still importable from this module
+from template_utils.templatetags.templateutils_nav import (
+    active_class,
+    active_section,
+    active_url,
+    current_section,
+    current_url,
+    NavItemNode,
+    NavMenuNode,
+)
+from template_utils.urlcache import current_view_name
 
 register = template.Library()
+register.tags.update(templateutils_nav.register.tags)
 
 
-@register.simple_tag
-def active_url(request, url_name, **kwargs):
+@register.tag()
+def ifmember(parser, token):
     """
-    Returns a class to be assiged CSS styling that should make the chosen
-    element highlighted as responsible of being in the active url.
+    Checks if the current user belongs to a specific group, or to any or all
+    of several groups.
 
-    Usage: Assuming that the reversed url is the current url, this tag will act
-    as follows:
+    - User must be looged in.
+    - Requires the Django authentication contrib app and middleware.
 
-    {% active_url request url_name %} -> class="ui-active-url"
-    {% active_url request url_name class_name=myclass %} -> class="myclass"
-    {% active_url request url_name use_class=False %} -> ui-active-url
-    {% active_url request url_name class_name=myclass use_class=False %} -> myclass
+    The names of the user's groups are loaded once per request, so any
+    amount of ifmember checks costs at most one query (none when they are
+    cached across requests, see ``template_utils.groups``).
 
-    Where "urlname" is the name of the url to check;
-    this must be defined in your `URLCONF`, otherwise it will raise
-    a NoReverseMatch Error.
+    Usage:
+        {% ifmember Admins %} ... {% endifmember %}
+        {% ifmember Admins or Editors %} ... {% else %} ... {% endifmember %}
+        {% ifmember Admins and "Site editors" %} ... {% endifmember %}
     """
-    class_name = kwargs.get('class_name', 'ui-active-url')
-    use_class = kwargs.get('use_attr', True)
-
-    url = reverse(url_name)
-    if request.path == url:
-        return (class_name, ' class="%s"' % class_name)[use_class]
-    return ''
+    return GroupCheckNode(*parse_check(parser, token))
 
 
-@register.simple_tag
-def current_url(request, url_name):
+@register.tag()
+def ifperm(parser, token):
     """
-    Returns the reversed url only if it is NOT the current url.
-    Otherwise returns the character "`#`"
+    Checks if the current user has a permission, or any or all of several
+    permissions, granted directly or through its groups. Active superusers
+    have every permission.
+
+    The user's permissions are loaded once per request, with a single query.
 
     Usage:
-    <a href="{% current_url request url_name %}">Some link</a>
+        {% ifperm shop.change_order %} ... {% endifperm %}
+        {% ifperm shop.add_order or shop.change_order %} ... {% else %}
+        ... {% endifperm %}
     """
-    url = reverse(url_name)
-    if request.path == url:
-        return '#'
-    return url
+    return PermissionCheckNode(*parse_check(parser, token))
 
 
-@register.tag()
-def ifmember(parser, token):
+def parse_check(parser, token):
     """
-    Checks if the current user belongs to a specific group.
-
-    - User must be looged in.
-    - Requires the Django authentication contrib app and middleware.
+    Parses the arguments and branches of ``ifmember`` and ``ifperm``.
 
-    Usage: {% ifmember Admins %} ... {% endifusergroup %}
+    Returns the names to check, the nodelists to render when the check
+    passes and when it does not, and whether all the names are required.
     """
-    try:
-        tag, group = token.split_contents()
-    except ValueError:
-        raise TemplateSyntaxError("Tag 'ifmember' requires 1 argument.")
-    nodelist = parser.parse(('endifmember',))
-    parser.delete_first_token()
-    return GroupCheckNode(group, nodelist)
+    bits = token.split_contents()
+    tag = bits.pop(0)
+    if not bits:
+        raise TemplateSyntaxError("Tag '%s' requires at least 1 argument."
+                                  % tag)
+    operators = set(bits[1::2])
+    if not len(bits) % 2 or len(operators) > 1 or \
+            not operators <= set(['and', 'or']):
+        raise TemplateSyntaxError("Tag '%s' accepts several names joined "
+                                  "either by 'and' or by 'or'." % tag)
+    names = [unquote(bit) for bit in bits[::2]]
+    end_tag = 'end' + tag
+    nodelist_true = parser.parse(('else', end_tag))
+    if parser.next_token().contents == 'else':
+        nodelist_false = parser.parse((end_tag,))
+        parser.delete_first_token()
+    else:
+        nodelist_false = template.NodeList()
+    return names, nodelist_true, nodelist_false, operators == set(['and'])
+
+
+def unquote(bit):
+    if len(bit) > 1 and bit[0] == bit[-1] and bit[0] in '"\'':
+        return bit[1:-1]
+    return bit
 
 
 class GroupCheckNode(template.Node):
-    def __init__(self, group, nodelist):
-        self.group = group
+    child_nodelists = ('nodelist', 'nodelist_false')
+
+    def __init__(self, names, nodelist, nodelist_false=None,
+                 require_all=False):
+        self.names = frozenset(names)
         self.nodelist = nodelist
+        self.nodelist_false = nodelist_false or template.NodeList()
+        self.require_all = require_all
+
+    def check(self, user):
+        from template_utils.groups import get_group_names
+        groups = get_group_names(user)
+        if self.require_all:
+            return self.names <= groups
+        return not self.names.isdisjoint(groups)
+
+    def branch(self, context):
+        """
+        Returns the nodelist to render for the user in the context.
+        """
+        user = resolve_variable('user', context)
+        if self.check(user):
+            return self.nodelist
+        return self.nodelist_false
 
     def render(self, context):
-        user = resolve_variable('user', context)
-        if not user.is_authenticated:
-            return ''
+        return self.branch(context).render(context)
+
+    def iter_render(self, context):
+        """
+        Yields the output of the branch as it renders (see
+        ``template_utils.streaming``).
+        """
+        from template_utils.streaming import iter_nodelist
+        return iter_nodelist(self.branch(context), context)
+
+
+class PermissionCheckNode(GroupCheckNode):
+    def check(self, user):
+        from template_utils.groups import has_permissions
+        return has_permissions(user, self.names, self.require_all)
+
+
+@register.tag
+def cachefragment(parser, token):
+    """
+    Caches the contents of the block for each route and role: the key is
+    built from the name of the url the request resolves to and the role of
+    the user (whether it is authenticated, a superuser or staff, its groups
+    and its permissions, so ``ifmember`` and ``ifperm`` can be used inside),
+    plus any other given values. Needs ``request`` and ``user`` in the
+    context.
+
+    The contents are kept for the given timeout in seconds, or for
+    ``TEMPLATE_UTILS_FRAGMENT_TIMEOUT`` (5 minutes by default), and can be
+    invalidated with ``template_utils.fragments.invalidate_fragment(name)``.
+
+    Usage:
+        {% cachefragment name [timeout=seconds] [vary_on ...] %}
+        ...
+        {% endcachefragment %}
+
+    For example:
+        {% cachefragment "nav" timeout=600 LANGUAGE_CODE %}
+            {% navmenu request %}...{% endnavmenu %}
+        {% endcachefragment %}
+    """
+    bits = token.split_contents()
+    tag = bits.pop(0)
+    if not bits:
+        raise TemplateSyntaxError("Tag '%s' requires a fragment name." % tag)
+    name = parser.compile_filter(bits.pop(0))
+    options = token_kwargs(bits, parser)
+    if set(options) - set(['timeout']):
+        raise TemplateSyntaxError("Tag '%s' only accepts the timeout option."
+                                  % tag)
+    vary_on = [parser.compile_filter(bit) for bit in bits]
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    return CacheFragmentNode(name, options.get('timeout'), vary_on, nodelist)
+
+
+class CacheFragmentNode(template.Node):
+    def __init__(self, name, timeout, vary_on, nodelist):
+        self.name = name
+        self.timeout = timeout
+        self.vary_on = vary_on
+        self.nodelist = nodelist
+
+    def resolve_timeout(self, context):
+        if self.timeout is None:
+            return fragments.default_timeout()
         try:
-            group = Group.objects.get(name=self.group)
-        except Group.DoesNotExist:
-            return ''
-        if group in user.groups.all():
-            return self.nodelist.render(context)
-        return ''
+            return int(self.timeout.resolve(context))
+        except (TypeError, ValueError):
+            raise TemplateSyntaxError("'cachefragment' timeout must be an "
+                                      "integer.")
+
+    def render(self, context):
+        from template_utils.groups import (
+            get_group_names,
+            get_permissions,
+            is_authenticated,
+        )
+        request = context.get('request')
+        user = context.get('user', getattr(request, 'user', None))
+        view_name = None
+        if request is not None:
+            view_name = current_view_name(request)
+        authenticated = user is not None and is_authenticated(user)
+        group_names = permissions = ()
+        superuser = staff = False
+        if authenticated:
+            group_names = get_group_names(user)
+            active = getattr(user, 'is_active', False)
+            superuser = active and getattr(user, 'is_superuser', False)
+            staff = getattr(user, 'is_staff', False)
+            if not superuser:
+                # Superusers have every permission
+                permissions = get_permissions(user)
+        name = self.name.resolve(context)
+        cache = fragments.fragment_cache()
+        key = fragments.fragment_key(
+            name, view_name, authenticated, group_names,
+            [value.resolve(context) for value in self.vary_on],
+            fragments.fragment_version(name, cache),
+            superuser, staff, permissions)
+        content = cache.get(key)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(key, content, self.resolve_timeout(context))
+        return content
 
 
 @register.tag
 def mkrange(parser, token):
     """
-    Accepts the same arguments as the 'range' builtin and creates
-    a list containing the result of 'range'.
+    Accepts the same arguments as the 'range' builtin and creates a lazy
+    range: it takes the same memory no matter how many items it spans, and
+    supports "len", slicing and the "for" tag (with "forloop").
+
+    The arguments can be integers (including negative ones), variables or
+    filtered expressions.
 
     Usage:
         {% mkrange [start, ]stop[, step] as context_name %}
@@ -104,33 +251,58 @@ def mkrange(parser, token):
         5: Something I want to repeat
         7: Something I want to repeat
         9: Something I want to repeat
+
+    With "window", it creates the pages to show around the current page of a
+    pagination instead: the first and last pages, the given amount of
+    neighbours (2 by default) at each side of the current page, and None
+    where pages are skipped. Only the pages shown are computed.
+
+    Usage:
+        {% mkrange window current last[, neighbours] as context_name %}
+
+    For example:
+        {% mkrange window 9 200 as pages %}
+        {% for page in pages %}{{ page|default:"..." }} {% endfor %}
+
+    Produces:
+        1 ... 7 8 9 10 11 ... 200
     """
 
     tokens = token.split_contents()
     fnctl = tokens.pop(0)
+    window = len(tokens) > 1 and tokens[0] == 'window'
+    if window:
+        tokens.pop(0)
 
     def raise_error():
-        raise TemplateSyntaxError('%s accepts the syntax: {%% %s [start,] ' + \
-            'stop[, step] as context_name %%}, where "start", "stop" ' + \
-            'and "step" must all be integers.' % (fnctl, fnctl))
+        if window:
+            syntax = 'window current last[, neighbours]'
+        else:
+            syntax = '[start,] stop[, step]'
+        raise TemplateSyntaxError(
+            '%s accepts the syntax: {%% %s %s as context_name %%}, where '
+            'all the arguments must be integers.' % (fnctl, fnctl, syntax))
+
+    if len(tokens) < 3 or tokens[-2] != 'as':
+        raise_error()
+    context_name = tokens.pop()
+    tokens.pop()
+    if not 1 + window <= len(tokens) <= 3:
+        raise_error()
 
     range_args = []
-
-    while True:
-        if len(tokens) < 2:
-            raise_error()
-        token = tokens.pop(0)
-        if token == "as":
-            break
-        if not token.isdigit():
+    for bit in tokens:
+        arg = parser.compile_filter(bit)
+        var = arg.var
+        if not arg.filters and (not isinstance(var, Variable) or (
+                var.lookups is None and
+                not isinstance(var.literal, six.integer_types))):
+            # Literals must be integers
             raise_error()
-        range_args.append(int(token))
-
-    if len(tokens) != 1:
-        raise_error()
-
-    context_name = tokens.pop()
+        range_args.append(arg)
 
+    if window:
+        return PaginationWindowNode(range_args, context_name)
     return RangeNode(range_args, context_name)
 
 
@@ -139,6 +311,23 @@ class RangeNode(template.Node):
         self.range_args = range_args
         self.context_name = context_name
 
+    def resolve_args(self, context):
+        try:
+            return [int(arg.resolve(context)) for arg in self.range_args]
+        except (TypeError, ValueError):
+            raise TemplateSyntaxError("'mkrange' arguments must be integers.")
+
+    def render(self, context):
+        args = self.resolve_args(context)
+        try:
+            context[self.context_name] = lazy_range(*args)
+        except ValueError as e:
+            raise TemplateSyntaxError("'mkrange': %s" % e)
+        return ''
+
+
+class PaginationWindowNode(RangeNode):
     def render(self, context):
-        context[self.context_name] = range(*self.range_args)
+        context[self.context_name] = pagination_window(
+            *self.resolve_args(context))
         return ''
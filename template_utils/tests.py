@@ -1,11 +1,66 @@
 from decimal import Decimal
+import gc
+import itertools
+import os
+import subprocess
+import sys
+import unittest
 from django import forms
+from django.contrib.auth.models import AnonymousUser, Group, Permission, User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_finished
+from django.http import HttpResponse
+from django.core.urlresolvers import clear_url_caches, NoReverseMatch
 from django.test import TestCase
-from django.template import Template, Context
-from django.utils import timezone
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.template import Template, Context, TemplateSyntaxError
+from django.template.loader import BaseLoader, get_template
+from django.utils import timezone, translation
+from django.utils.safestring import mark_safe, SafeData
 from django.utils.timezone import utc
+from template_utils import (
+    choices,
+    display,
+    folding,
+    formatting,
+    fragments,
+    groups,
+    instrumentation,
+    masking,
+    numeric,
+    prefixes,
+    ranges,
+    sections,
+    streaming,
+    urlcache,
+    warmup,
+)
 from template_utils.templatetags import templateutils_filters
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from template_utils import jinja
+except ImportError:
+    jinja = None
+
+
+class DictLoader(BaseLoader):
+    is_usable = True
+    templates = {}
+
+    def load_template_source(self, template_name, template_dirs=None):
+        from django.template import TemplateDoesNotExist
+        try:
+            return self.templates[template_name], template_name
+        except KeyError:
+            raise TemplateDoesNotExist(template_name)
+
 
 class MyForm(forms.Form):
     FORM_CHOICES = (
@@ -23,6 +78,10 @@ class MyForm(forms.Form):
     datetime = forms.DateTimeField()
 
 
+class MyModelChoiceForm(forms.Form):
+    group = forms.ModelChoiceField(Group.objects.all(), to_field_name='name')
+
+
 class TemplateWithFilter(object):
     def __init__(self):
         self.value = None
@@ -65,15 +124,56 @@ class TemplateFiltersTest(TestCase):
 
     def test_currency(self):
         self.text.render(12, 'currency')  # test with int
-        # assert self.text.equals('$12.00')
+        assert self.text.equals('$12.00')
         self.text.render(12.505, 'currency')  # test with float
         assert self.text.equals('$12.51')
         self.text.render(Decimal('12.505'), 'currency')  # test with decimal
         assert self.text.equals('$12.51')
+        self.text.render(1234567.891, 'currency')  # test grouping
+        assert self.text.equals('$1,234,567.89')
+        self.text.render(-1234, 'currency')  # test negative values
+        assert self.text.equals('-$1,234.00')
+        self.text.render(Decimal('1234.5'), 'currency', 'de_DE')
+        assert self.text.equals(u'1.234,50 \u20ac')
+        self.text.render(12, 'currency', 'pt_BR')
+        assert self.text.equals('R$ 12,00')
+        self.text.render('12', 'currency')  # non numeric values are kept
+        assert self.text.equals('12')
 
     def test_integer(self):
         self.text.render(1.5, 'integer')
         assert self.text.equals(1)
+        self.text.render(None, 'integer')
+        assert self.text.equals(None)
+
+    def test_grouped(self):
+        self.text.render(1234567, 'grouped')
+        assert self.text.equals('1,234,567')
+        self.text.render(Decimal('1234567.895'), 'grouped', 2)
+        assert self.text.equals('1,234,567.90')
+        self.text.render(-1234.5, 'grouped')
+        assert self.text.equals('-1,234')
+
+    def test_percent(self):
+        self.text.render(Decimal('0.1234'), 'percent')
+        assert self.text.equals('12%')
+        self.text.render(0.1234, 'percent', 1)
+        assert self.text.equals('12.3%')
+        self.text.render(2, 'percent')
+        assert self.text.equals('200%')
+        self.text.render('n/a', 'percent')
+        assert self.text.equals('n/a')
+
+    def test_compact(self):
+        for value, expected in ((999, '999'), (1000, '1k'), (1234, '1.2k'),
+                                (Decimal('3400000'), '3.4M'),
+                                (-1234567.0, '-1.2M'), (999950, '1M'),
+                                (5 * 10 ** 9, '5B'),
+                                (Decimal('12.34'), '12.3')):
+            self.text.render(value, 'compact')
+            assert self.text.equals(expected)
+        self.text.render(1234, 'compact', 2)
+        assert self.text.equals('1.23k')
 
     def test_nolinebrs(self):
         value = """
@@ -91,6 +191,28 @@ class TemplateFiltersTest(TestCase):
         self.text.render(value, 'nolinebrs')
         assert self.text.equals(expected)
 
+    def test_cleanup(self):
+        value = ('<p>Lorem   ipsum <br/>\n dolor <SPAN class="x">sit</SPAN>'
+                 '</p><p> &nbsp;<br> </p>\n<p>amet</p><b>bold</b>')
+        cleanup = templateutils_filters.cleanup
+        assert cleanup(value) == \
+            '<p>Lorem ipsum dolor <SPAN class="x">sit</SPAN></p> ' \
+            '<p>amet</p><b>bold</b>'
+        assert cleanup(value, 'br, span,b') == \
+            '<p>Lorem   ipsum \n dolor sit</p><p> &nbsp; </p>\n' \
+            '<p>amet</p>bold'
+        self.text.render('a <br />\n\t b', 'cleanup', 'whitespace,br')
+        assert self.text.equals('a b')
+
+    def test_cleanup_keeps_safe_data(self):
+        value = mark_safe('<b>a</b><br>')
+        assert isinstance(templateutils_filters.nolinebrs(value), SafeData)
+        assert templateutils_filters.nolinebrs(value) == '<b>a</b>'
+        tpl = Template('{% load templateutils_filters %}'
+                       '{{ value|cleanup:"b" }}{{ unsafe|cleanup:"b" }}')
+        result = tpl.render(Context({'value': value, 'unsafe': '<b><i>'}))
+        assert result == 'a<br>&lt;i&gt;'
+
     def test_startswith(self):
         value = 'Lorem ipsum dolor sit amet, consectetur adipisicing elit,'
         self.text.render(value, 'startswith', arg='Lorem')
@@ -108,6 +230,141 @@ class TemplateFiltersTest(TestCase):
         assert self.text.equals(expected_3)
 
 
+class MaskingTest(TestCase):
+    def test_mask(self):
+        assert masking.mask('5000000000003456') == '************3456'
+        assert masking.mask(5000000000003456, 2) == '**************56'
+        assert masking.mask('123', 4) == '123'
+        assert masking.mask('123', 0) == '***'
+        assert masking.mask(None) is None
+        assert masking.mask('5000000000003456', group=4) == \
+            '**** **** **** 3456'
+        assert masking.mask('370000000000002', group=(4, 6, 5),
+                            separator='-') == '****-******-*0002'
+
+    def test_mask_rows_is_lazy(self):
+        def rows():
+            for i in itertools.count():
+                yield {'name': 'row %d' % i, 'account': '1234567%d' % i}
+        masked = masking.mask_rows(rows(), ['account'], visible=2)
+        assert next(masked) == {'name': 'row 0', 'account': '******70'}
+        assert next(masked) == {'name': 'row 1', 'account': '******71'}
+        masked = masking.mask_rows([('a', '123456')], [1, 5])
+        assert list(masked) == [['a', '**3456']]
+
+    def test_mask_pans(self):
+        assert masking.luhn_valid('4111111111111111')
+        assert not masking.luhn_valid('4111111111111112')
+        assert masking.mask_pans('Paid with 4111 1111 1111 1111, thanks') == \
+            'Paid with **** **** **** 1111, thanks'
+        assert masking.mask_pans('4111-1111-1111-1111 12-25') == \
+            '****-****-****-1111 12-25'
+        assert masking.mask_pans('5500000000000004 4111111111111111', 2) == \
+            '**************04 **************11'
+        assert masking.mask_pans('order 4111111111111112, call 555 1234') == \
+            'order 4111111111111112, call 555 1234'
+        assert masking.mask_pans('4111111111111111', char='#') == \
+            '############1111'
+        assert masking.mask_pans(None) is None
+        tpl = Template('{% load templateutils_filters %}{{ v|maskpans }} '
+                       '{{ v|maskpans:2 }}')
+        assert tpl.render(Context({'v': '<b>4111 1111 1111 1111</b>'})) == \
+            ('&lt;b&gt;**** **** **** 1111&lt;/b&gt; '
+             '&lt;b&gt;**** **** **** **11&lt;/b&gt;')
+
+    def test_mask_csv(self):
+        from io import BytesIO
+        stream = BytesIO(b'name,account\r\njohn,5000000000003456\r\n')
+        rows = list(masking.mask_csv(stream, ['account'], header=True,
+                                     group=4))
+        assert rows == [['name', 'account'], ['john', '**** **** **** 3456']]
+
+
+class NumericFormatTest(TestCase):
+    def test_format_fixed(self):
+        assert numeric.format_fixed(12, 2) == '12.00'
+        assert numeric.format_fixed(10 ** 20, grouped=True) == \
+            '100,000,000,000,000,000,000'
+        assert numeric.format_fixed(Decimal('2.675'), 2) == '2.68'
+        assert numeric.format_fixed(Decimal('-0.001'), 2) == '0.00'
+        assert numeric.format_fixed(Decimal('1E+30'), 1, grouped=True) == \
+            '1,000,000,000,000,000,000,000,000,000,000.0'
+        assert numeric.quantizer(2) is numeric.quantizer(2)
+
+    def test_non_finite(self):
+        assert numeric.format_compact(Decimal('NaN')) == 'NaN'
+        assert numeric.format_compact(float('inf')) == 'inf'
+        assert numeric.to_integer(float('inf')) == float('inf')
+
+
+class CurrencyFormatTest(TestCase):
+    def test_format_is_cached(self):
+        assert formatting.get_currency_format() is \
+            formatting.get_currency_format('en_US')
+
+    def test_grouping(self):
+        fmt = formatting.get_currency_format('en_US')
+        assert fmt.group('1') == '1'
+        assert fmt.group('123') == '123'
+        assert fmt.group('1234') == '1,234'
+        assert fmt.group('1234567890') == '1,234,567,890'
+
+    def test_format_many_matches_filter(self):
+        values = [12, -12.505, Decimal('1234567.895'), 0, None, '12', 1.5]
+        for locale_name in (None, 'de_DE'):
+            expected = [templateutils_filters.currency(value, locale_name)
+                        for value in values]
+            assert formatting.format_currency_many(values, locale_name) == \
+                expected
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_format_array_matches_filter(self):
+        for values in ([1.005, -2.675, 1234567.891, -0.0, 0.125],
+                       [0, -5, 1000, 123456789]):
+            expected = [templateutils_filters.currency(value)
+                        for value in values]
+            result = formatting.format_currency_many(numpy.array(values))
+            assert result == expected
+
+    def test_currencycolumn(self):
+        rows = [{'name': 'a', 'price': 1234.5},
+                {'name': 'b', 'price': Decimal('-3')},
+                {'name': 'c', 'price': 'n/a'}]
+        tpl = Template(
+            '{% load templateutils_filters %}'
+            '{% currencycolumn rows "price" as priced %}'
+            '{% for row, price in priced %}{{ row.name }} {{ price }};'
+            '{% endfor %}'
+            '{% currencycolumn rows "price" "de_DE" as priced %}'
+            '{% for row, price in priced %}{{ price }};{% endfor %}')
+        result = tpl.render(Context({'rows': rows}))
+        assert result == u'a $1,234.50;b -$3.00;c n/a;' \
+            u'1.234,50 \u20ac;-3,00 \u20ac;n/a;'
+        assert rows[0] == {'name': 'a', 'price': 1234.5}
+        result = tpl.render(Context({'rows': (row for row in rows)}))
+        assert result.startswith(u'a $1,234.50;b -$3.00;c n/a;')
+        assert tpl.render(Context()) == ''
+
+    def test_currencycolumn_queryset(self):
+        Group.objects.create(name='Admins')
+        Group.objects.create(name='Staff')
+        tpl = Template(
+            '{% load templateutils_filters %}'
+            '{% currencycolumn groups "id" as priced %}'
+            '{% for group, id in priced %}{{ group.name }} {{ id }};'
+            '{% endfor %}')
+        groups = Group.objects.order_by('-name')
+        with self.assertNumQueries(1):
+            result = tpl.render(Context({'groups': groups}))
+        ids = [group.pk for group in groups]
+        assert result == 'Staff $%d.00;Admins $%d.00;' % tuple(ids)
+
+    def test_c_locale_is_rejected(self):
+        conventions = dict(formatting.LOCALE_CONVENTIONS['en_US'],
+                           frac_digits=formatting.CHAR_MAX)
+        self.assertRaises(ValueError, formatting.CurrencyFormat, conventions)
+
+
 class DisplayFieldFilterTest(TestCase):
     SOME_BIRTHDATE = timezone.datetime(1989, 7, 27, 3, 2, tzinfo=utc)
     NOW = timezone.now()
@@ -129,6 +386,102 @@ class DisplayFieldFilterTest(TestCase):
         self.text.render(field, 'verbose')
         assert self.text.equals(expected_value)
 
+    def test_choice_index_is_cached(self):
+        field = self.form['choice'].field
+        base_field = MyForm.base_fields['choice']
+        index = choices.get_choice_index(field, base_field)
+        assert choices.get_choice_index(field, base_field) is index
+        # Each form instance has its own copy of the fields and choices
+        assert choices.get_choice_index(MyForm()['choice'].field,
+                                        base_field) is index
+        field.choices = (('foo', 'Foo'), ('qux', 'Qux'))
+        assert choices.get_choice_index(field, base_field) is not index
+        self.get_display_value(self.form['choice'], 'Not Available')
+        self.form.initial['choice'] = 'qux'
+        self.get_display_value(self.form['choice'], 'Qux')
+
+    def test_choice_index_optgroups(self):
+        field = forms.TypedChoiceField(coerce=int, choices=(
+            ('Odd', ((1, 'One'), (3, 'Three'))),
+            ('Even', ((2, 'Two'),)),
+        ))
+        assert choices.choice_label(field, 3) == 'Three'
+        assert choices.choice_label(field, '2') == 'Two'
+        assert choices.choice_label(field, 4, 'None') == 'None'
+        assert choices.choice_label(field, [1, 2]) == 'One, Two'
+
+    def test_model_choices(self):
+        admins = Group.objects.create(name='Admins')
+        editors = Group.objects.create(name='Editors')
+
+        class GroupsForm(forms.Form):
+            group = forms.ModelChoiceField(Group.objects.all())
+            groups = forms.ModelMultipleChoiceField(Group.objects.all())
+
+        form = GroupsForm(initial={'group': editors.pk,
+                                   'groups': [admins, editors]})
+        self.get_display_value(form['group'], 'Editors')
+        with self.assertNumQueries(1):
+            for i in range(10):
+                self.get_display_value(form['groups'], 'Admins, Editors')
+        form = GroupsForm(initial={'group': 'x', 'groups': [admins.pk, 0]})
+        self.get_display_value(form['group'], 'Not Available')
+        self.get_display_value(form['groups'], 'Admins, Not Available')
+
+    def test_model_choices_are_shared_by_forms(self):
+        admins = Group.objects.create(name='Admins')
+        editors = Group.objects.create(name='Editors')
+
+        class GroupsForm(forms.Form):
+            group = forms.ModelChoiceField(Group.objects.all())
+
+        with self.assertNumQueries(1):
+            for i in range(5):
+                form = GroupsForm(initial={'group': admins.pk})
+                self.get_display_value(form['group'], 'Admins')
+        with self.assertNumQueries(1):
+            for i in range(5):
+                form = GroupsForm(initial={'group': editors.pk})
+                self.get_display_value(form['group'], 'Editors')
+        editors.name = 'Writers'
+        editors.save()
+        form = GroupsForm(initial={'group': editors.pk})
+        self.get_display_value(form['group'], 'Writers')
+        form.fields['group'].queryset = Group.objects.exclude(pk=editors.pk)
+        self.get_display_value(form['group'], 'Not Available')
+
+    def test_model_choices_last_for_the_request(self):
+        Group.objects.create(name='Admins')
+        form = MyModelChoiceForm(initial={'group': 'Admins'})
+        with self.assertNumQueries(1):
+            self.get_display_value(form['group'], 'Admins')
+            self.get_display_value(form['group'], 'Admins')
+        # Renamed behind the back of the signals, i.e. by another process
+        Group.objects.update(name='Staff')
+        request_finished.send(sender=None)
+        form = MyModelChoiceForm(initial={'group': 'Admins'})
+        with self.assertNumQueries(1):
+            self.get_display_value(form['group'], 'Not Available')
+
+    def test_model_choices_to_field_name(self):
+        admins = Group.objects.create(name='Admins')
+
+        class GroupChoiceField(forms.ModelChoiceField):
+            def label_from_instance(self, obj):
+                return 'Group %s' % obj.name
+
+        class GroupForm(forms.Form):
+            group = GroupChoiceField(Group.objects.all(), to_field_name='name')
+
+        form = GroupForm(initial={'group': 'Admins'})
+        with self.assertNumQueries(1):
+            self.get_display_value(form['group'], 'Group Admins')
+            self.get_display_value(form['group'], 'Group Admins')
+        form = GroupForm(initial={'group': admins})
+        self.get_display_value(form['group'], 'Group Admins')
+        form = GroupForm(initial={'group': admins.pk})
+        self.get_display_value(form['group'], 'Not Available')
+
     def test_get_display(self):
         EXPECTED_AGE = (self.NOW - self.SOME_BIRTHDATE).days / 365
         self.get_display_value(self.form['char'], 'foo')
@@ -139,3 +492,944 @@ class DisplayFieldFilterTest(TestCase):
         self.get_display_value(self.form['date'], EXPECTED_AGE)
         self.get_display_value(self.form['datetime'], EXPECTED_AGE)
         self.get_display_value(self.form['choice'], 'BAR')
+
+
+class URLTagsTest(TestCase):
+    urls = 'template_utils.testurls'
+
+    def setUp(self):
+        urlcache.clear_reverse_cache()
+        self.request = RequestFactory().get('/about/')
+
+    def render(self, tpl):
+        tpl = Template('{% load templateutils_tags %}' + tpl)
+        return tpl.render(Context({'request': self.request}))
+
+    def test_active_url(self):
+        assert self.render('{% active_url request "about" %}') == \
+            ' class="ui-active-url"'
+        assert self.render('{% active_url request "home" %}') == ''
+
+    def test_use_class(self):
+        for name in ('use_class', 'use_attr'):
+            assert self.render('{%% active_url request "about" %s=False %%}'
+                               % name) == 'ui-active-url'
+            assert self.render('{%% active_section request None %s=False %%}'
+                               % name) == 'ui-active-url'
+
+    def test_current_url(self):
+        assert self.render('{% current_url request "about" %}') == '#'
+        assert self.render('{% current_url request "home" %}') == '/'
+
+    def test_reverse_is_cached(self):
+        for i in range(3):
+            self.render('{% active_url request "about" %}'
+                        '{% current_url request "home" %}')
+        info = urlcache.reverse_cache_info()
+        assert (info.hits, info.misses, info.currsize) == (4, 2, 2)
+        self.assertEqual(urlcache.cached_reverse('order_detail',
+                                                 kwargs={'pk': 1}),
+                         '/orders/1/')
+        self.assertEqual(urlcache.cached_reverse('order_detail',
+                                                 kwargs={'pk': 2}),
+                         '/orders/2/')
+
+    def test_navmenu(self):
+        menu = ('{% navmenu request %}'
+                '<li{% navitem "home" %}></li>'
+                '<li{% navitem "about" "orders" %}></li>'
+                '{% endnavmenu %}')
+        assert self.render(menu) == '<li></li><li class="ui-active-url"></li>'
+        self.request = RequestFactory().get('/shop/orders/')
+        menu = ('{% navmenu request class_name="on" inactive_class="off" %}'
+                '<li{% navitem "orders" %}></li>'
+                '<li{% navitem "shop:orders" %}></li>'
+                '{% endnavmenu %}')
+        assert self.render(menu) == '<li class="off"></li><li class="on"></li>'
+
+    def test_navmenu_resolves_once(self):
+        self.render('{% navmenu request %}{% navitem "home" %}{% endnavmenu %}')
+        assert self.request._template_utils_view_name == 'about'
+        self.request._template_utils_view_name = 'home'
+        assert self.render('{% navmenu request %}{% navitem "home" %}'
+                           '{% endnavmenu %}') == ' class="ui-active-url"'
+
+    def test_navitem_outside_navmenu(self):
+        self.assertRaises(TemplateSyntaxError, self.render,
+                          '{% navitem "home" %}')
+
+    def test_cache_is_bounded(self):
+        cache = urlcache.ReverseCache(maxsize=2)
+        cache.reverse('home')
+        cache.reverse('about')
+        cache.reverse('home')
+        cache.reverse('orders')  # evicts "about", the least recently used
+        assert list(key[0] for key in cache.urls) == ['home', 'orders']
+
+    def test_cache_is_cleared_with_url_caches(self):
+        urlcache.cached_reverse('home')
+        clear_url_caches()
+        urlcache.cached_reverse('about')
+        info = urlcache.reverse_cache_info()
+        assert (info.misses, info.currsize) == (2, 1)
+
+    def test_frozen_cache(self):
+        cache = urlcache.ReverseCache(maxsize=1)
+        cache.reverse('home')
+        cache.freeze()
+        cache.reverse('about')
+        cache.reverse('orders')
+        assert cache.frozen == {('home', None, '/', 'en-us', None, (), ()): '/'}
+        assert cache.reverse('home') == '/'
+        assert cache.cache_info() == (1, 3, 1, 2)
+        clear_url_caches()
+        cache.reverse('about')
+        assert cache.frozen == {}
+
+
+@override_settings(LANGUAGES=(('en', 'English'), ('es', 'Spanish')))
+class I18nURLTagsTest(TestCase):
+    urls = 'template_utils.testurls_i18n'
+
+    def setUp(self):
+        urlcache.clear_reverse_cache()
+
+    def render(self, tpl, path):
+        tpl = Template('{% load templateutils_tags %}' + tpl)
+        request = RequestFactory().get(path)
+        return tpl.render(Context({'request': request}))
+
+    def test_reverse_per_language(self):
+        tpl = '{% active_url request "about" %}{% current_url request "home" %}'
+        for language in ('en', 'es', 'en'):
+            with translation.override(language):
+                assert urlcache.cached_reverse('about') == \
+                    '/%s/about/' % language
+                assert self.render(tpl, '/%s/about/' % language) == \
+                    ' class="ui-active-url"/%s/' % language
+        info = urlcache.reverse_cache_info()
+        assert (info.misses, info.currsize) == (4, 4)
+
+    @override_settings(TEMPLATE_UTILS_NAV_SECTIONS={'about': ['about']})
+    def test_sections_per_language(self):
+        for language in ('en', 'es', 'en'):
+            with translation.override(language):
+                request = RequestFactory().get('/%s/about/' % language)
+                assert sections.current_section(request) == 'about'
+
+
+class IfMemberTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admins = Group.objects.create(name='Admins')
+        self.editors = Group.objects.create(name='Editors')
+        self.user = User.objects.create_user('john', 'john@example.com', 'x')
+        self.user.groups.add(self.admins)
+
+    def render(self, tpl, user=None):
+        tpl = Template('{% load templateutils_tags %}' + tpl)
+        return tpl.render(Context({'user': user or self.user}))
+
+    def test_ifmember(self):
+        assert self.render('{% ifmember Admins %}yes{% endifmember %}') == \
+            'yes'
+        assert self.render('{% ifmember Editors %}yes{% endifmember %}') == ''
+        assert self.render('{% ifmember Nobody %}yes{% endifmember %}') == ''
+        assert self.render('{% ifmember Admins %}yes{% endifmember %}',
+                           AnonymousUser()) == ''
+
+    def test_ifmember_many_groups(self):
+        tpl = '{% ifmember Admins or Editors %}yes{% else %}no{% endifmember %}'
+        assert self.render(tpl) == 'yes'
+        tpl = '{% ifmember Admins and Editors %}yes{% else %}no{% endifmember %}'
+        assert self.render(tpl) == 'no'
+        self.user.groups.add(self.editors)
+        assert self.render(tpl, User.objects.get(pk=self.user.pk)) == 'yes'
+        self.assertRaises(TemplateSyntaxError, self.render,
+                          '{% ifmember A or B and C %}{% endifmember %}')
+        self.assertRaises(TemplateSyntaxError, self.render,
+                          '{% ifmember A B %}{% endifmember %}')
+
+    def test_ifperm(self):
+        change_group = Permission.objects.get(codename='change_group')
+        add_user = Permission.objects.get(codename='add_user')
+        self.admins.permissions.add(change_group)
+        self.user.user_permissions.add(add_user)
+        user = User.objects.get(pk=self.user.pk)
+        tpl = ('{% ifperm auth.change_group %}a{% endifperm %}'
+               '{% ifperm auth.delete_user or auth.add_user %}b{% endifperm %}'
+               '{% ifperm auth.add_user and auth.delete_user %}c{% else %}'
+               'd{% endifperm %}')
+        with self.assertNumQueries(1):
+            assert self.render(tpl, user) == 'abd'
+        user.is_superuser = True
+        assert self.render('{% ifperm auth.delete_user %}yes{% endifperm %}',
+                           user) == 'yes'
+        assert self.render('{% ifperm auth.add_user %}yes{% endifperm %}',
+                           AnonymousUser()) == ''
+
+    def test_one_query_per_request(self):
+        tpl = '{% ifmember Admins %}a{% endifmember %}' \
+              '{% ifmember Editors %}e{% endifmember %}' * 50
+        with self.assertNumQueries(1):
+            assert self.render(tpl) == 'a' * 50
+
+    def test_prefetched_groups(self):
+        user = User.objects.prefetch_related('groups').get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            assert self.render('{% ifmember Admins %}yes{% endifmember %}',
+                               user) == 'yes'
+
+    @override_settings(TEMPLATE_UTILS_GROUP_CACHE_TIMEOUT=60)
+    def test_cross_request_cache(self):
+        tpl = '{% ifmember Editors %}yes{% endifmember %}'
+        assert self.render(tpl, User.objects.get(pk=self.user.pk)) == ''
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            assert self.render(tpl, user) == ''
+
+        # Changes to the user's groups invalidate the cache
+        self.user.groups.add(self.editors)
+        assert self.render(tpl, User.objects.get(pk=self.user.pk)) == 'yes'
+        self.editors.user_set.clear()
+        assert self.render(tpl, User.objects.get(pk=self.user.pk)) == ''
+
+        # And so does renaming or deleting a group
+        tpl = '{% ifmember Staff %}yes{% endifmember %}'
+        assert self.render(tpl, User.objects.get(pk=self.user.pk)) == ''
+        self.admins.name = 'Staff'
+        self.admins.save()
+        assert self.render(tpl, User.objects.get(pk=self.user.pk)) == 'yes'
+        self.admins.delete()
+        assert self.render(tpl, User.objects.get(pk=self.user.pk)) == ''
+
+    @override_settings(TEMPLATE_UTILS_GROUP_CACHE_TIMEOUT=60)
+    def test_cross_request_permissions_cache(self):
+        tpl = '{% ifperm auth.change_group %}yes{% endifperm %}'
+        assert self.render(tpl, User.objects.get(pk=self.user.pk)) == ''
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            assert self.render(tpl, user) == ''
+        self.admins.permissions.add(
+            Permission.objects.get(codename='change_group'))
+        assert self.render(tpl, User.objects.get(pk=self.user.pk)) == 'yes'
+
+    @override_settings(TEMPLATE_UTILS_REQUIRE_PRELOADED_GROUPS=True)
+    def test_preload(self):
+        tpl = ('{% ifmember Admins %}a{% endifmember %}'
+               '{% ifperm auth.add_user %}b{% endifperm %}')
+        user = User.objects.get(pk=self.user.pk)
+        self.assertRaises(groups.GroupsNotPreloaded, self.render, tpl, user)
+        assert self.render(tpl, AnonymousUser()) == ''
+        with self.assertNumQueries(2):
+            groups.preload(user, permissions=True)
+        with self.assertNumQueries(0):
+            assert self.render(tpl, user) == 'a'
+
+    @override_settings(TEMPLATE_UTILS_REQUIRE_PRELOADED_GROUPS=True)
+    def test_preload_middleware(self):
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            groups.PreloadGroupsMiddleware().process_view(
+                request, None, (), {})
+        with self.assertNumQueries(0):
+            assert self.render('{% ifmember Admins %}a{% endifmember %}',
+                               request.user) == 'a'
+
+
+class FragmentCacheTest(TestCase):
+    urls = 'template_utils.testurls'
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.renders = 0
+        self.user = User.objects.create_user('john', 'john@example.com', 'x')
+        self.user.groups.add(Group.objects.create(name='Admins'))
+
+    def render(self, path='/', user=None, tpl=None):
+        def count():
+            self.renders += 1
+            return self.renders
+        tpl = Template('{% load templateutils_tags %}' + (tpl or
+                       '{% cachefragment "nav" %}{{ count }}'
+                       '{% endcachefragment %}'))
+        return tpl.render(Context({'request': self.factory.get(path),
+                                   'user': user or self.user,
+                                   'count': count}))
+
+    def test_varies_on_route_and_groups(self):
+        assert self.render() == '1'
+        assert self.render() == '1'
+        assert self.render('/about/') == '2'
+        assert self.render('/about/') == '2'
+        assert self.render(user=AnonymousUser()) == '3'
+        editor = User.objects.create_user('jane', 'jane@example.com', 'x')
+        editor.groups.add(Group.objects.create(name='Editors'))
+        assert self.render(user=editor) == '4'
+        other_admin = User.objects.create_user('jim', 'jim@example.com', 'x')
+        other_admin.groups.add(Group.objects.get(name='Admins'))
+        assert self.render(user=other_admin) == '1'
+
+    def test_varies_on_permissions(self):
+        tpl = ('{% cachefragment "nav" %}{{ count }}'
+               '{% ifperm auth.add_user %}+{% endifperm %}'
+               '{% endcachefragment %}')
+        assert self.render(tpl=tpl) == '1'
+        admin = User.objects.create_superuser('root', 'root@example.com',
+                                              'x')
+        admin.groups.add(Group.objects.get(name='Admins'))
+        assert self.render(tpl=tpl, user=admin) == '2+'
+        granted = User.objects.create_user('jim', 'jim@example.com', 'x')
+        granted.groups.add(Group.objects.get(name='Admins'))
+        granted.user_permissions.add(
+            Permission.objects.get(codename='add_user'))
+        assert self.render(tpl=tpl, user=granted) == '3+'
+        other_admin = User.objects.create_user('joe', 'joe@example.com', 'x')
+        other_admin.groups.add(Group.objects.get(name='Admins'))
+        assert self.render(tpl=tpl, user=other_admin) == '1'
+
+    def test_vary_on_and_timeout(self):
+        tpl = ('{% cachefragment "nav" timeout=60 "a" 1 %}{{ count }}'
+               '{% endcachefragment %}')
+        assert self.render(tpl=tpl) == '1'
+        assert self.render(tpl=tpl) == '1'
+        assert self.render(tpl=tpl.replace('"a"', '"b"')) == '2'
+        self.assertRaises(TemplateSyntaxError, self.render, tpl=(
+            '{% cachefragment "nav" timeout="x" %}{% endcachefragment %}'))
+        self.assertRaises(TemplateSyntaxError, self.render, tpl=(
+            '{% cachefragment "nav" ttl=1 %}{% endcachefragment %}'))
+        self.assertRaises(TemplateSyntaxError, self.render,
+                          tpl='{% cachefragment %}{% endcachefragment %}')
+
+    def test_backend_is_created_once(self):
+        assert fragments.fragment_cache() is fragments.fragment_cache()
+
+    def test_invalidate(self):
+        assert self.render() == '1'
+        assert self.render('/about/') == '2'
+        fragments.invalidate_fragment('other')
+        assert self.render() == '1'
+        fragments.invalidate_fragment('nav')
+        assert self.render() == '3'
+        assert self.render('/about/') == '4'
+
+
+class FormDisplayTest(TestCase):
+    def setUp(self):
+        self.form = MyForm(initial={
+            'char': 'foo',
+            'integer': 11,
+            'boolean': False,
+            'choice': 'baz',
+        })
+
+    def test_display_form(self):
+        fields = display.display_form(self.form, 'N/A')
+        values = dict((field.name, value) for field, value in fields)
+        assert [field.name for field, value in fields] == \
+            list(self.form.fields)
+        assert values['char'] == 'foo'
+        assert values['decimal_'] == 'N/A'
+        assert values['boolean'] == 'No'
+        assert values['null_boolean'] == 'N/A'
+        assert values['choice'] == 'BAZ'
+        assert values['date'] == 'N/A'
+
+    def test_form_display_tag(self):
+        form = MyForm(initial={'char': '<b>', 'choice': 'foo'})
+        del form.fields['date'], form.fields['datetime']
+        tpl = Template('{% load templateutils_filters %}'
+                       '{% form_display form %}')
+        result = tpl.render(Context({'form': form}))
+        assert result.startswith('<dl><dt>Char</dt><dd>&lt;b&gt;</dd>')
+        assert '<dt>Choice</dt><dd>FOO</dd>' in result
+        tpl = Template('{% load templateutils_filters %}'
+                       '{% form_display form "-" as fields %}'
+                       '{% for field, value in fields %}{{ value }};'
+                       '{% endfor %}')
+        result = tpl.render(Context({'form': form}))
+        assert result == '&lt;b&gt;;-;-;-;-;FOO;'
+
+    def test_form_classes_are_released(self):
+        form_class = type('RuntimeForm', (forms.Form,),
+                          {'name': forms.CharField()})
+        display.display_form(form_class(initial={'name': 'foo'}))
+        assert form_class in display._form_plans
+        count = len(display._form_plans)
+        del form_class
+        gc.collect()
+        assert len(display._form_plans) == count - 1
+
+    def test_register_converter(self):
+        class UpperField(forms.CharField):
+            pass
+
+        class UpperForm(forms.Form):
+            name = UpperField()
+
+        def upper_converter(bound_field, value, default):
+            return value.upper()
+
+        form = UpperForm(initial={'name': 'foo'})
+        assert display.display_value(form['name']) == 'foo'
+        display.register_converter(UpperField, upper_converter)
+        try:
+            assert display.display_value(form['name']) == 'FOO'
+            assert display.display_form(form)[0][1] == 'FOO'
+        finally:
+            del display._converters[UpperField]
+            display._resolved.clear()
+            display._form_plans.clear()
+
+
+class RangeTest(TestCase):
+    def render(self, tpl, **context):
+        tpl = Template('{% load templateutils_tags %}' + tpl)
+        return tpl.render(Context(context))
+
+    def test_mkrange(self):
+        tpl = ('{% mkrange 5 10 2 as some_range %}'
+               '{% for i in some_range %}{{ i }}{% endfor %}')
+        assert self.render(tpl) == '579'
+        tpl = ('{% mkrange start stop|add:1 -1 as r %}'
+               '{% for i in r %}{{ forloop.counter }}:{{ i }} {% endfor %}')
+        assert self.render(tpl, start=3, stop=-2) == '1:3 2:2 3:1 4:0 '
+        tpl = ('{% mkrange 1000000000 as r %}{{ r|length }} '
+               '{% for i in r|slice:"-3:" %}{{ i }} {% endfor %}')
+        assert self.render(tpl) == '1000000000 999999997 999999998 999999999 '
+
+    def test_mkrange_syntax(self):
+        for tpl in ('{% mkrange as r %}', '{% mkrange 1 2 3 4 as r %}',
+                    '{% mkrange 1.5 as r %}', '{% mkrange "a" as r %}',
+                    '{% mkrange 1 2 %}', '{% mkrange window 1 as r %}'):
+            self.assertRaises(TemplateSyntaxError, self.render, tpl)
+        self.assertRaises(TemplateSyntaxError, self.render,
+                          '{% mkrange stop as r %}', stop='x')
+
+    def test_lazy_range(self):
+        for args in ((10,), (2, 10), (2, 11, 3), (10, -3, -4), (5, 5),
+                     (5, 1), (0, 20, 7)):
+            lazy = ranges.LazyRange(*args)
+            expected = list(range(*args))
+            assert list(lazy) == expected
+            assert len(lazy) == len(expected)
+            assert list(reversed(lazy)) == expected[::-1]
+            for index in (slice(None), slice(1, -1), slice(None, None, -2),
+                          slice(-3, None)):
+                assert list(lazy[index]) == expected[index]
+            for value in range(-5, 15):
+                assert (value in lazy) == (value in expected)
+        assert ranges.LazyRange(0, 10, 3)[-1] == 9
+        self.assertRaises(IndexError, lambda: ranges.LazyRange(3)[3])
+        self.assertRaises(ValueError, ranges.LazyRange, 1, 2, 0)
+
+    def test_pagination_window(self):
+        window = ranges.pagination_window
+        assert window(9, 200) == [1, None, 7, 8, 9, 10, 11, None, 200]
+        assert window(1, 200) == [1, 2, 3, None, 200]
+        assert window(4, 200) == [1, 2, 3, 4, 5, 6, None, 200]
+        assert window(200, 200, 1) == [1, None, 199, 200]
+        assert window(2, 3) == [1, 2, 3]
+        assert window(1, 0) == []
+        tpl = ('{% mkrange window page 200 as pages %}'
+               '{% for p in pages %}{{ p|default:"..." }} {% endfor %}')
+        assert self.render(tpl, page=9) == '1 ... 7 8 9 10 11 ... 200 '
+
+
+class InstrumentationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('john', 'john@example.com', 'x')
+        self.user.groups.add(Group.objects.create(name='Admins'))
+
+    def tearDown(self):
+        instrumentation.uninstall()
+
+    def test_disabled(self):
+        self.assertRaises(MiddlewareNotUsed,
+                          instrumentation.InstrumentationMiddleware)
+        library = templateutils_filters.register
+        assert library.filters['currency'] is templateutils_filters.currency
+
+    @override_settings(TEMPLATE_UTILS_INSTRUMENTATION=True)
+    def test_request_stats(self):
+        middleware = instrumentation.InstrumentationMiddleware()
+        received = []
+
+        def receiver(sender, request, stats, **kwargs):
+            received.append(stats)
+        instrumentation.request_instrumented.connect(receiver)
+        self.addCleanup(instrumentation.request_instrumented.disconnect,
+                        receiver)
+
+        request = RequestFactory().get('/')
+        middleware.process_request(request)
+        tpl = Template('{% load templateutils_filters templateutils_tags %}'
+                       '{% ifmember Admins %}{% for p in prices %}'
+                       '{{ p|currency }} {% endfor %}{% endifmember %}'
+                       '{{ "x"|startswith:"x" }}')
+        output = tpl.render(Context({'user': self.user, 'prices': [1, 2]}))
+        response = middleware.process_response(request, HttpResponse(output))
+
+        assert output == '$1.00 $2.00 True'
+        stats, = received
+        assert stats['currency'].calls == 2
+        assert stats['currency'].queries == 0
+        assert stats['ifmember'].calls == 1
+        assert stats['ifmember'].queries == 1
+        assert stats['ifmember'].total >= stats['currency'].total
+        assert stats['startswith'].calls == 1
+        header = response[instrumentation.DEFAULT_HEADER]
+        assert 'currency;calls=2;' in header
+
+        # Nothing is recorded outside of a request
+        tpl.render(Context({'user': self.user, 'prices': [1]}))
+        assert len(received) == 1
+
+
+class LibraryImportTest(TestCase):
+    def imported_modules(self, library=None):
+        code = 'import sys, django.template\n'
+        if library is None:
+            # Django loads the models of every installed app at startup
+            code += ('if hasattr(django, "setup"):\n'
+                     '    django.setup()\n'
+                     'else:\n'
+                     '    from django.db.models import get_models\n'
+                     '    get_models()\n')
+        else:
+            code += 'import template_utils.templatetags.%s\n' % library
+        code += 'print("\\n".join(sys.modules))'
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         env=env, universal_newlines=True)
+        return set(output.split())
+
+    def test_heavy_dependencies_are_deferred(self):
+        # Only the modules of this package are checked: which Django
+        # modules Django itself loads (i.e. the forms, loaded by the url
+        # resolvers since Django 1.7) depends on its version
+        modules = self.imported_modules('templateutils_nav')
+        for module in ('groups', 'choices', 'display', 'fragments'):
+            assert 'template_utils.%s' % module not in modules
+        modules = self.imported_modules('templateutils_tags')
+        for module in ('groups', 'choices', 'display'):
+            assert 'template_utils.%s' % module not in modules
+        modules = self.imported_modules('templateutils_filters')
+        for module in ('choices', 'display'):
+            assert 'template_utils.%s' % module not in modules
+        assert 'numpy' not in modules
+        modules = self.imported_modules()
+        assert 'template_utils.models' in modules
+        for module in ('groups', 'choices', 'display'):
+            assert 'template_utils.%s' % module not in modules
+
+    def test_nav_library(self):
+        request = RequestFactory().get('/about/')
+        tpl = Template('{% load templateutils_nav %}'
+                       '{% navmenu request %}<li{% navitem "about" %}>'
+                       '{% endnavmenu %}')
+        with override_settings(ROOT_URLCONF='template_utils.testurls'):
+            assert tpl.render(Context({'request': request})) == \
+                '<li class="ui-active-url">'
+
+
+@unittest.skipIf(jinja is None, 'Jinja2 is not installed')
+class JinjaExtensionTest(TestCase):
+    urls = 'template_utils.testurls'
+
+    def setUp(self):
+        self.env = jinja.environment(autoescape=True)
+        self.user = User.objects.create_user('john', 'john@example.com', 'x')
+        self.user.groups.add(Group.objects.create(name='Admins'))
+
+    def render(self, source, **context):
+        return self.env.from_string(source).render(**context)
+
+    def test_filters_match_django(self):
+        cases = [
+            ('currency', Decimal('1234.5'), None),
+            ('currency', -12, '"de_DE"'),
+            ('integer', '12', None),
+            ('nolinebrs', 'a<br>b<br />c', None),
+            ('startswith', 'template', '"temp"'),
+            ('creditcard', '5000000000003456', '4'),
+        ]
+        for name, value, arg in cases:
+            arg_django = ':%s' % arg if arg else ''
+            arg_jinja = '(%s)' % arg if arg else ''
+            django_output = Template(
+                '{%% load templateutils_filters %%}{{ value|%s%s }}'
+                % (name, arg_django)).render(Context({'value': value}))
+            jinja_output = self.render('{{ value|%s%s }}' % (name, arg_jinja),
+                                       value=value)
+            assert jinja_output == django_output, (name, jinja_output)
+        form = MyForm({'choice': 'bar'})
+        assert self.render('{{ form.choice|verbose }}', form=form) == 'BAR'
+        assert self.render('{{ value|nolinebrs }}',
+                           value=jinja.Markup('<b>a</b><br>')) == '<b>a</b>'
+
+    def test_ifmember(self):
+        tpl = ('{% ifmember "Admins" or "Editors" %}yes{% else %}no'
+               '{% endifmember %}')
+        assert self.render(tpl, user=self.user) == 'yes'
+        assert self.render(tpl, user=AnonymousUser()) == 'no'
+        assert self.render(tpl) == 'no'
+        tpl = '{% ifmember "Admins" and group %}yes{% endifmember %}'
+        assert self.render(tpl, user=self.user, group='Editors') == ''
+        assert self.render('{{ user is member("Editors", "Admins") }}',
+                           user=self.user) == 'True'
+        assert self.render('{% ifperm "auth.add_user" %}yes{% endifperm %}',
+                           user=self.user) == ''
+
+    def test_mkrange(self):
+        assert self.render('{% mkrange 5 10 2 as r %}{{ r|list }}') == \
+            '[5, 7, 9]'
+        assert self.render('{% mkrange 1, n as r %}{{ r|length }}',
+                           n=10 ** 12) == str(10 ** 12 - 1)
+        assert self.render('{% mkrange window 9 200 as pages %}'
+                           '{{ pages|join(" ") }}') == \
+            '1 None 7 8 9 10 11 None 200'
+        assert self.render('{% mkrange window as r %}{{ r|list }}',
+                           window=2) == '[0, 1]'
+
+    def test_url_globals(self):
+        request = RequestFactory().get('/about/')
+        assert self.render('{{ active_url(request, "about") }}',
+                           request=request) == ' class="ui-active-url"'
+        assert self.render('{{ current_url(request, "home") }}',
+                           request=request) == '/'
+
+
+class ArgumentFoldingTest(TestCase):
+    def template(self, source):
+        return folding.fold_arguments(
+            Template('{% load templateutils_filters %}' + source))
+
+    def folded(self, template):
+        return [arg for node in template.nodelist
+                for expression in [getattr(node, 'filter_expression', None)]
+                if expression is not None
+                for func, args in expression.filters
+                for lookup, arg in args]
+
+    def test_literals_are_folded(self):
+        tpl = self.template('{{ v|creditcard:4 }} {{ v|startswith:"12" }} '
+                            '{{ n|currency:"de_DE" }} {{ v|creditcard:x }}')
+        arg, prefix, currency, variable = self.folded(tpl)
+        assert isinstance(arg, folding.FoldedArgument)
+        assert isinstance(arg.value, masking.Masker)
+        assert prefix.value == '12'
+        assert isinstance(currency.value, formatting.CurrencyFormat)
+        assert not isinstance(variable, folding.FoldedArgument)
+        output = tpl.render(Context({'v': '1234567890', 'n': 1234.5, 'x': 2}))
+        assert output == u'******7890 True 1.234,50 \u20ac ********90'
+
+    def test_filters_in_tags(self):
+        tpl = self.template(
+            '{% for v in values %}{% if v|startswith:"A1" %}'
+            '{{ v|creditcard:2 }}{% endif %}{% endfor %}')
+        assert tpl.render(Context({'values': ['A123', 'B123']})) == '**23'
+        self.assertRaises(TemplateSyntaxError, self.template,
+                          '{% if v|startswith:1 %}{% endif %}')
+
+    def test_invalid_literals(self):
+        for source in ('{{ v|creditcard:"x" }}', '{{ v|startswith:12 }}',
+                       '{{ v|currency:"xx_XX" }}',
+                       '{% with a=v|creditcard:"x" %}{% endwith %}'):
+            self.assertRaises(TemplateSyntaxError, self.template, source)
+        # Not folded, the filters behave as they always did
+        tpl = Template('{% load templateutils_filters %}'
+                       '{{ v|creditcard:"2" }}')
+        assert tpl.render(Context({'v': '1234'})) == '**34'
+
+    @override_settings(TEMPLATE_LOADERS=(
+        ('template_utils.loaders.Loader',
+         ('template_utils.tests.DictLoader',)),))
+    def test_loader(self):
+        DictLoader.templates = {
+            'ok.html': '{% load templateutils_filters %}{{ v|creditcard:2 }}',
+            'bad.html': '{% load templateutils_filters %}'
+                        '{{ v|creditcard:"?" }}',
+        }
+        from django.template import loader
+        loader.template_source_loaders = None
+        self.addCleanup(setattr, loader, 'template_source_loaders', None)
+        assert get_template('ok.html').render(Context({'v': '1234'})) == \
+            '**34'
+        self.assertRaises(TemplateSyntaxError, get_template, 'bad.html')
+
+
+class PrefixFiltersTest(TestCase):
+    def render(self, source, **context):
+        return folding.fold_arguments(
+            Template('{% load templateutils_filters %}' + source)
+        ).render(Context(context))
+
+    def test_prefix_index(self):
+        index = prefixes.PrefixIndex({'A': 1, 'A1': 2, 'A12': 3, 'B7': 4})
+        assert len(index) == 4
+        assert index.get('A123') == 3
+        assert index.get('A1') == 2
+        assert index.get('A2') == 1
+        assert index.get('B1') is None
+        assert index.prefix('B77') == 'B7'
+        assert index.prefix('') == ''
+        assert prefixes.PrefixIndex(['', 'x']).prefix('y') == ''
+
+    def test_startswith_any(self):
+        tpl = ('{% for sku in skus %}{% if sku|startswith_any:"A1, B7" %}'
+               '{{ sku|startswith_any:"A1,B7" }}{% else %}-{% endif %}'
+               '{% endfor %}')
+        assert self.render(tpl, skus=['A100', 'B7', 'C1', 7]) == 'A1B7--'
+        assert self.render('{{ sku|startswith_any:known }}', sku='xyz',
+                           known=set(['x', 'xy'])) == 'xy'
+        assert self.render('{{ sku|startswith_any:"A1,B7," }}',
+                           sku='C1') == ''
+        known = ('x', 'xy')
+        assert self.render('{{ sku|startswith_any:known }}', sku='xyz',
+                           known=known) == 'xy'
+        known = ('x', 'xyz')
+        assert self.render('{{ sku|startswith_any:known }}', sku='xyz',
+                           known=known) == 'xyz'
+        self.assertRaises(TemplateSyntaxError, self.render,
+                          '{{ sku|startswith_any:12 }}')
+
+    def test_immutable_collections_are_cached(self):
+        class Prefixes(tuple):
+            def __eq__(self, other):
+                raise AssertionError('compared')
+
+        known = Prefixes(['A1', 'B7'])
+        index = prefixes.get_prefix_index(known)
+        assert prefixes.get_prefix_index(known) is index
+        assert self.render('{% for sku in skus %}'
+                           '{{ sku|startswith_any:known }}{% endfor %}',
+                           skus=['A10', 'B70', 'C'], known=known) == 'A1B7'
+        for i in range(prefixes.COLLECTIONS_MAXSIZE):
+            prefixes.get_prefix_index(('x%d' % i,))
+        assert prefixes.get_prefix_index(known) is not index
+
+    def test_mutable_collections_are_rebuilt(self):
+        known = ['x', 'xy']
+        assert self.render('{{ sku|startswith_any:known }}', sku='xyz',
+                           known=known) == 'xy'
+        known[1] = 'xyz'
+        assert self.render('{{ sku|startswith_any:known }}', sku='xyz',
+                           known=known) == 'xyz'
+        classes = {'A': 'a', 'A1': 'a1'}
+        assert self.render('{{ sku|prefix_map:classes }}', sku='A10',
+                           classes=classes) == 'a1'
+        classes['A1'] = 'one'
+        assert self.render('{{ sku|prefix_map:classes }}', sku='A10',
+                           classes=classes) == 'one'
+
+    def test_prefix_map(self):
+        tpl = '{{ sku|prefix_map:"A1:apparel, B7:books"|default:"other" }}'
+        assert self.render(tpl, sku='B7-1') == 'books'
+        assert self.render(tpl, sku='C7-1') == 'other'
+        classes = {'A': 'a', 'A1': 'a1'}
+        assert self.render('{{ sku|prefix_map:classes }}', sku='A10',
+                           classes=classes) == 'a1'
+        classes = dict(classes, A10='a10')
+        assert self.render('{{ sku|prefix_map:classes }}', sku='A10',
+                           classes=classes) == 'a10'
+        assert self.render('{{ sku|prefix_map:"A1:apparel," }}',
+                           sku='A10') == 'apparel'
+        self.assertRaises(TemplateSyntaxError, self.render,
+                          '{{ sku|prefix_map:"A1" }}')
+
+
+class SectionTest(TestCase):
+    urls = 'template_utils.testurls'
+    sections = {
+        'home': ['home'],
+        'orders': ['orders', 'order_detail'],
+        'shop': ['shop:'],
+        'stores': ['stores:'],
+        'products': ['stores:product'],
+        'featured': [('stores:product', (), {'store': 'main',
+                                             'slug': 'featured'})],
+        'reports': ['/reports/'],
+    }
+
+    def setUp(self):
+        self.index = sections.SectionIndex(self.sections)
+
+    def test_match(self):
+        match = self.index.match
+        assert match('/') == 'home'
+        assert match('/about/') is None
+        assert match('/orders/') == 'orders'
+        assert match('/orders/123/edit/') == 'orders'
+        assert match('/orders-archive/') is None
+        assert match('/shop/orders/') == 'shop'
+        assert match('/stores/north/') == 'stores'
+        assert match('/stores/north/products/shoes/') == 'products'
+        assert match('/stores/north/products/shoes/reviews/') == 'products'
+        assert match('/stores/main/products/featured/') == 'featured'
+        assert match('/reports/2013/') == 'reports'
+        self.assertRaises(NoReverseMatch, sections.SectionIndex,
+                          {'x': ['nope']})
+
+    def test_tags(self):
+        tpl = Template('{% load templateutils_nav %}'
+                       '<a{% active_section request "orders" %}></a>'
+                       '<a{% active_section request "home" %}></a>'
+                       '{% current_section request as section %}{{ section }}')
+        with override_settings(TEMPLATE_UTILS_NAV_SECTIONS=self.sections):
+            request = RequestFactory().get('/orders/7/')
+            assert tpl.render(Context({'request': request})) == \
+                '<a class="ui-active-url"></a><a></a>orders'
+            request = RequestFactory().get('/')
+            assert tpl.render(Context({'request': request})) == \
+                '<a></a><a class="ui-active-url"></a>home'
+
+
+class StreamingTest(TestCase):
+    templates = {
+        'base.html': '<h1>{% block title %}Report{% endblock %}</h1>'
+                     '{% block content %}{% endblock %}',
+        'report.html': '{% extends "base.html" %}{% load templateutils_tags %}'
+                       '{% block title %}{{ block.super }} 1{% endblock %}'
+                       '{% block content %}{% mkrange 3 as rows %}'
+                       '{% for row in rows %}'
+                       '{% ifmember Admins %}<p>{{ forloop.counter }}</p>'
+                       '{% else %}-{% endifmember %}'
+                       '{% if forloop.last %}end{% endif %}'
+                       '{% empty %}none{% endfor %}{% endblock %}',
+    }
+
+    def setUp(self):
+        from django.template import loader
+        DictLoader.templates = self.templates
+        loader.template_source_loaders = None
+        self.addCleanup(setattr, loader, 'template_source_loaders', None)
+        self.user = User.objects.create_user('john', 'john@example.com', 'x')
+        self.user.groups.add(Group.objects.create(name='Admins'))
+
+    @override_settings(TEMPLATE_LOADERS=('template_utils.tests.DictLoader',))
+    def test_same_output(self):
+        for user, expected in (
+                (self.user, '<h1>Report 1</h1><p>1</p><p>2</p><p>3</p>end'),
+                (AnonymousUser(), '<h1>Report 1</h1>---end')):
+            chunks = list(streaming.stream_template(
+                'report.html', Context({'user': user}), size=1))
+            assert len(chunks) > 1
+            assert ''.join(chunks) == expected
+            assert get_template('report.html').render(
+                Context({'user': user})) == expected
+
+    @override_settings(TEMPLATE_LOADERS=('template_utils.tests.DictLoader',))
+    def test_streams_rows(self):
+        rendered = []
+
+        class Rows(object):
+            def __len__(self):
+                return 1000
+
+            def __iter__(self):
+                for i in range(1000):
+                    rendered.append(i)
+                    yield i
+
+        tpl = Template('{% load templateutils_tags %}{% for row in rows %}'
+                       '{% ifmember Admins %}{{ row }},{% endifmember %}'
+                       '{% endfor %}')
+        context = Context({'user': self.user, 'rows': Rows()})
+        depth = len(context.dicts)
+        chunks = streaming.stream_template(tpl, context, size=10)
+        assert next(chunks) == '0,1,2,3,4,'
+        assert len(rendered) == 5
+        assert ''.join(chunks) == ''.join('%d,' % i for i in range(5, 1000))
+        assert len(rendered) == 1000
+        assert len(context.dicts) == depth
+
+    def test_streams_generator(self):
+        rendered = []
+
+        def rows(count):
+            for i in range(count):
+                rendered.append(i)
+                yield i
+
+        tpl = Template('{% with sep="," %}{% autoescape off %}'
+                       '{% for row in rows %}{{ row }}'
+                       '{% if forloop.last %}.{% else %}{{ sep }}{% endif %}'
+                       '{{ forloop.revcounter }}{% empty %}none'
+                       '{% endfor %}{% endautoescape %}{% endwith %}')
+        chunks = streaming.stream_template(
+            tpl, Context({'rows': rows(10000)}), size=10)
+        assert next(chunks) == '0,1,2,3,4,'
+        assert len(rendered) == 6
+        assert ''.join(chunks).endswith('9998,9999.')
+        assert ''.join(streaming.stream_template(
+            tpl, Context({'rows': rows(0)}))) == 'none'
+
+    def test_streams_queryset(self):
+        Group.objects.create(name='Staff')
+        groups = Group.objects.order_by('name')
+        tpl = Template('{% for group in groups %}{{ group.name }}'
+                       '{% if not forloop.last %},{% endif %}{% endfor %}')
+        output = ''.join(streaming.stream_template(
+            tpl, Context({'groups': groups})))
+        assert output == 'Admins,Staff'
+        assert groups._result_cache is None
+        list(groups)
+        assert ''.join(streaming.stream_template(
+            tpl, Context({'groups': groups}))) == output
+
+    def test_streams_prefetched_queryset(self):
+        Group.objects.get(name='Admins').permissions.add(
+            *Permission.objects.filter(codename__startswith='add_')[:3])
+        Group.objects.create(name='Staff')
+        tpl = Template('{% for group in groups %}{{ group.name }}:'
+                       '{% for p in group.permissions.all %}{{ p.codename }},'
+                       '{% endfor %}{% endfor %}')
+        groups = Group.objects.prefetch_related('permissions')
+        with self.assertNumQueries(2):
+            expected = tpl.render(Context({'groups': groups.all()}))
+        with self.assertNumQueries(2):
+            output = ''.join(streaming.stream_template(
+                tpl, Context({'groups': groups.all()})))
+        assert output == expected
+        assert expected.count(',') == 3
+
+    @override_settings(TEMPLATE_LOADERS=('template_utils.tests.DictLoader',))
+    def test_render_streaming(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        response = streaming.render_streaming(request, 'report.html')
+        assert response.streaming
+        assert b''.join(response.streaming_content) == \
+            b'<h1>Report 1</h1><p>1</p><p>2</p><p>3</p>end'
+
+
+class WarmupTest(TestCase):
+    urls = 'template_utils.testurls'
+
+    def setUp(self):
+        urlcache.clear_reverse_cache()
+        MyForm.base_fields['choice'].__dict__.pop(choices.INDEX_ATTR, None)
+
+    def test_reversible_url_names(self):
+        assert sorted(warmup.reversible_url_names()) == \
+            ['about', 'home', 'orders', 'shop:orders']
+
+    @override_settings(
+        TEMPLATE_UTILS_WARMUP_FORMS=['template_utils.tests.MyForm'],
+        TEMPLATE_UTILS_WARMUP_LOCALES=['en_US', 'de_DE'])
+    def test_warm_up(self):
+        assert warmup.warm_up(freeze_caches=False) == \
+            {'urls': 4, 'choices': 1, 'locales': 2}
+        urlcache.reverse_cache.freeze()
+        assert len(urlcache.reverse_cache.frozen) == 4
+        assert choices.INDEX_ATTR in MyForm.base_fields['choice'].__dict__
+        assert warmup.footprint() > 0
+        request = RequestFactory().get('/orders/')
+        tpl = Template('{% load templateutils_nav %}'
+                       '{% active_url request "orders" %}')
+        assert tpl.render(Context({'request': request})) == \
+            ' class="ui-active-url"'
+        assert urlcache.reverse_cache_info().misses == 4
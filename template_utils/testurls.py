@@ -0,0 +1,21 @@
+from django.conf.urls import patterns, include, url
+from django.http import HttpResponse
+
+
+def view(request, *args, **kwargs):
+    return HttpResponse('')
+
+
+urlpatterns = patterns('',
+    url(r'^$', view, name='home'),
+    url(r'^about/$', view, name='about'),
+    url(r'^orders/$', view, name='orders'),
+    url(r'^orders/(?P<pk>\d+)/$', view, name='order_detail'),
+    url(r'^shop/', include(patterns('',
+        url(r'^orders/$', view, name='orders'),
+    ), namespace='shop')),
+    url(r'^stores/(?P<store>\w+)/', include(patterns('',
+        url(r'^$', view, name='home'),
+        url(r'^products/(?P<slug>[\w-]+)/$', view, name='product'),
+    ), namespace='stores')),
+)
@@ -0,0 +1,9 @@
+from django.conf.urls import patterns, url
+from django.conf.urls.i18n import i18n_patterns
+from template_utils.testurls import view
+
+
+urlpatterns = i18n_patterns('',
+    url(r'^$', view, name='home'),
+    url(r'^about/$', view, name='about'),
+)
@@ -0,0 +1,171 @@
+"""
+A bounded LRU cache in front of ``reverse``.
+
+``active_url`` and ``current_url`` reverse the same handful of URL names on
+every request; the result depends on the URL name, its arguments, the active
+urlconf, the script prefix and the active language (``i18n_patterns`` and
+translated url regexes reverse differently in every language), so it is
+cached under that key.
+"""
+from collections import namedtuple, OrderedDict
+import threading
+from django.conf import settings
+from django.core.urlresolvers import (
+    get_resolver,
+    get_script_prefix,
+    get_urlconf,
+    resolve,
+    reverse,
+    Resolver404,
+)
+from django.utils import translation
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+DEFAULT_MAXSIZE = 1024
+
+
+class ReverseCache(object):
+    """
+    Least recently used cache of reversed URLs.
+
+    The cache is emptied whenever the resolver of a urlconf changes, which is
+    what happens when Django's URL caches are cleared (i.e. when the urlconf
+    is reloaded or swapped in tests), and when ``ROOT_URLCONF`` is changed
+    through ``override_settings``.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.urls = OrderedDict()
+            self.frozen = {}
+            self.resolvers = {}
+            self.hits = self.misses = 0
+
+    def freeze(self):
+        """
+        Moves the cached URLs out of the LRU order into a dict that is only
+        read from then on, so that hits don't reorder it in the processes
+        forked afterwards (see ``template_utils.warmup``). Frozen
+        URLs are never evicted, but they are dropped with the rest of the
+        cache when the resolver changes.
+        """
+        with self.lock:
+            frozen = dict(self.frozen)
+            frozen.update(self.urls)
+            self.frozen = frozen
+            self.urls = OrderedDict()
+
+    def cache_info(self):
+        """
+        Returns the hit/miss statistics, like ``functools.lru_cache`` does.
+        """
+        return CacheInfo(self.hits, self.misses, self.maxsize,
+                         len(self.urls) + len(self.frozen))
+
+    def reverse(self, viewname, urlconf=None, args=None, kwargs=None,
+                current_app=None):
+        """
+        Same as ``django.core.urlresolvers.reverse``, but cached.
+        """
+        if urlconf is None:
+            urlconf = get_urlconf()
+        resolver = get_resolver(urlconf)
+        try:
+            key = (viewname, urlconf, get_script_prefix(),
+                   translation.get_language(), current_app, tuple(args or ()),
+                   tuple(sorted((kwargs or {}).items())))
+            hash(key)
+        except TypeError:
+            # Unhashable arguments can't be cached
+            return reverse(viewname, urlconf, args, kwargs,
+                           current_app=current_app)
+
+        with self.lock:
+            previous = self.resolvers.get(urlconf)
+            if previous is not resolver:
+                if previous is not None:
+                    self.urls.clear()
+                    self.frozen = {}
+                self.resolvers[urlconf] = resolver
+            url = self.frozen.get(key)
+            if url is not None:
+                self.hits += 1
+                return url
+            url = self.urls.pop(key, None)
+            if url is not None:
+                self.hits += 1
+                self.urls[key] = url
+                return url
+            self.misses += 1
+
+        url = reverse(viewname, urlconf, args, kwargs, current_app=current_app)
+        with self.lock:
+            self.urls[key] = url
+            if len(self.urls) > self.maxsize:
+                self.urls.popitem(last=False)
+        return url
+
+
+reverse_cache = ReverseCache(
+    getattr(settings, 'TEMPLATE_UTILS_REVERSE_CACHE_SIZE', DEFAULT_MAXSIZE))
+
+
+def cached_reverse(viewname, urlconf=None, args=None, kwargs=None,
+                   current_app=None):
+    """
+    Reverses ``viewname`` through the shared ``reverse_cache``.
+    """
+    return reverse_cache.reverse(viewname, urlconf, args, kwargs, current_app)
+
+
+def reverse_cache_info():
+    """
+    Returns the hits, misses, maxsize and current size of the cache.
+    """
+    return reverse_cache.cache_info()
+
+
+def clear_reverse_cache():
+    reverse_cache.clear()
+
+
+def current_view_name(request):
+    """
+    Returns the namespaced name (i.e. ``"shop:orders"``) of the url
+    the request's path resolves to, or ``None`` if it does not resolve or the
+    url has no name.
+
+    The path is resolved at most once per request: the ``resolver_match``
+    Django sets on the request is used when available, and the result is
+    stored on the request otherwise.
+    """
+    try:
+        return request._template_utils_view_name
+    except AttributeError:
+        pass
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            match = None
+    view_name = None
+    if match is not None and match.url_name:
+        view_name = ':'.join(list(match.namespaces) + [match.url_name])
+    request._template_utils_view_name = view_name
+    return view_name
+
+
+def urlconf_changed(sender, setting, **kwargs):
+    """
+    ``setting_changed`` receiver emptying the cache when ``ROOT_URLCONF``
+    is overridden.
+    """
+    if setting == 'ROOT_URLCONF':
+        clear_reverse_cache()
@@ -0,0 +1,201 @@
+"""
+Warm-up of the caches of template_utils before a preforking server forks.
+
+The first request each worker serves otherwise pays for reversing the
+urls of the navigation, building the choice indexes of ``verbose`` and
+loading the conventions of the ``currency`` locales, and every worker then
+keeps its own copy of them. Built once in the master process, before the
+workers are forked, they start out shared by all of them copy-on-write:
+the reversed urls are moved into a dict that is only read from (see
+``ReverseCache.freeze``) and, on Python 3.7+, every object built so far is
+moved out of the garbage collector's reach with ``gc.freeze``. Reading
+them still writes reference counts (and the hit counters of the url
+cache), so the pages a worker reads from get copied as it uses them; what
+is always saved is building the caches on every worker's first request.
+
+With gunicorn's ``preload_app``, warm up at the end of the WSGI module::
+
+    application = get_wsgi_application()
+
+    from template_utils.warmup import warm_up
+    warm_up()
+
+What is warmed up is configured with:
+
+- ``TEMPLATE_UTILS_WARMUP_URLS``: the url names to reverse, by default
+  every url name (namespaced ones too) that takes no arguments.
+- ``TEMPLATE_UTILS_WARMUP_FORMS``: dotted paths of the form classes whose
+  choices are indexed, none by default. Model choice fields are skipped, as
+  they are indexed with a query per form instance.
+- ``TEMPLATE_UTILS_WARMUP_LOCALES``: the currency locales to load, the
+  built-in ones by default.
+
+The ``templateutils_warmup`` management command reports the approximate
+size of the caches and the time every step takes cold and warm.
+"""
+import gc
+import sys
+import types
+from importlib import import_module
+from django.conf import settings
+from django.core.urlresolvers import get_resolver, get_urlconf
+from django.utils import six
+from django.utils.regex_helper import normalize
+from template_utils import formatting, sections
+from template_utils.urlcache import cached_reverse, reverse_cache
+
+
+def reversible_url_names(resolver=None, namespace=''):
+    """
+    Yields the (namespaced) names of the urls that can be reversed without
+    arguments.
+    """
+    if resolver is None:
+        resolver = get_resolver(get_urlconf())
+    for name in resolver.reverse_dict.keys():
+        if not isinstance(name, six.string_types):
+            # Urls are also indexed by their view
+            continue
+        if any(not params
+               for possibility, pattern, defaults
+               in resolver.reverse_dict.getlist(name)
+               for result, params in possibility):
+            yield namespace + name
+    for name, (pattern, child) in resolver.namespace_dict.items():
+        # Namespaces whose prefix takes arguments are skipped as a whole
+        if not normalize(pattern)[0][1]:
+            for url_name in reversible_url_names(child,
+                                                 namespace + name + ':'):
+                yield url_name
+
+
+def warm_urls(names=None):
+    """
+    Reverses the given url names (see ``TEMPLATE_UTILS_WARMUP_URLS``) into
+    the cache of ``active_url`` and ``current_url``, and builds the section
+    index of ``active_section``. Returns the number of urls reversed.
+    """
+    if names is None:
+        names = getattr(settings, 'TEMPLATE_UTILS_WARMUP_URLS', None)
+    if names is None:
+        names = list(reversible_url_names())
+    for name in names:
+        cached_reverse(name)
+    if getattr(settings, 'TEMPLATE_UTILS_NAV_SECTIONS', None):
+        sections.get_section_index()
+    return len(names)
+
+
+def warm_choices(form_classes=None):
+    """
+    Builds the choice indexes of the given form classes (see
+    ``TEMPLATE_UTILS_WARMUP_FORMS``), classes or dotted paths. Returns the
+    number of fields indexed.
+    """
+    from template_utils.choices import get_choice_index
+    count = 0
+    for field in _choice_fields(form_classes):
+        get_choice_index(field)
+        count += 1
+    return count
+
+
+def _choice_fields(form_classes=None):
+    from django.forms import ChoiceField, ModelChoiceField
+    if form_classes is None:
+        form_classes = getattr(settings, 'TEMPLATE_UTILS_WARMUP_FORMS', ())
+    for form_class in form_classes:
+        if isinstance(form_class, six.string_types):
+            module, name = form_class.rsplit('.', 1)
+            form_class = getattr(import_module(module), name)
+        for field in form_class.base_fields.values():
+            if isinstance(field, ChoiceField) and \
+                    not isinstance(field, ModelChoiceField):
+                yield field
+
+
+def warm_locales(locales=None):
+    """
+    Loads the conventions of the given currency locales (see
+    ``TEMPLATE_UTILS_WARMUP_LOCALES``). Returns the number of locales.
+    """
+    if locales is None:
+        locales = getattr(settings, 'TEMPLATE_UTILS_WARMUP_LOCALES',
+                          sorted(formatting.LOCALE_CONVENTIONS))
+    for locale_name in locales:
+        formatting.get_currency_format(locale_name)
+    return len(locales)
+
+
+STEPS = (
+    ('urls', warm_urls),
+    ('choices', warm_choices),
+    ('locales', warm_locales),
+)
+
+
+def freeze():
+    """
+    Keeps the warmed up caches from being written to, so they stay shared
+    between forked processes.
+    """
+    reverse_cache.freeze()
+    if hasattr(gc, 'freeze'):
+        gc.collect()
+        gc.freeze()
+
+
+def warm_up(freeze_caches=True):
+    """
+    Warms up every cache, and freezes them (see ``freeze``) unless
+    ``freeze_caches`` is false. Returns a dict with the amount of entries
+    warmed up by each step.
+    """
+    counts = dict((name, step()) for name, step in STEPS)
+    if freeze_caches:
+        freeze()
+    return counts
+
+
+def sizeof(obj, seen=None):
+    """
+    Returns the approximate number of bytes taken by ``obj`` and everything
+    it refers to, counting shared objects once.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += sizeof(key, seen) + sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += sizeof(item, seen)
+    elif not isinstance(obj, six.string_types + (
+            six.binary_type, type, types.ModuleType, types.FunctionType)):
+        if hasattr(obj, '__dict__'):
+            size += sizeof(vars(obj), seen)
+        for slot in getattr(type(obj), '__slots__', ()):
+            size += sizeof(getattr(obj, slot, None), seen)
+    return size
+
+
+def footprint():
+    """
+    Returns the approximate number of bytes taken by the warmed up caches:
+    the ``sys.getsizeof`` of their objects, summed. Whether those bytes stay
+    shared between forked workers isn't measured.
+    """
+    from template_utils.choices import INDEX_ATTR
+    caches = [reverse_cache.frozen, reverse_cache.urls,
+              formatting._currency_formats]
+    # Not the resolvers they refer to
+    caches.extend(index.root for index in sections._indexes.values())
+    for field in _choice_fields():
+        cached = field.__dict__.get(INDEX_ATTR)
+        if cached is not None:
+            caches.append(cached[2])
+    return sizeof(caches) - sys.getsizeof(caches)
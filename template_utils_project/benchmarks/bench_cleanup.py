@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Compares the fused ``cleanup`` pipeline with chaining one ``re.sub``
+per transform, on multi-megabyte CMS-like bodies.
+
+Run it from the ``template_utils_project`` directory::
+
+    python benchmarks/bench_cleanup.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'template_utils_project.settings')
+
+from template_utils.text import get_pipeline
+
+REPEAT = 3
+SIZES_MB = (1, 4)
+TRANSFORMS = ('br', 'paragraphs', 'whitespace', 'span', 'font')
+
+PARAGRAPH = (
+    '<p>Lorem ipsum dolor sit amet,   consectetur adipisicing elit,<br />\n'
+    '    sed do <span class="x">eiusmod</span> tempor incididunt ut labore'
+    '<br>\n <font color="red">et dolore</font> magna aliqua.</p>\n'
+    '<p> &nbsp; <br/> </p>\n'
+)
+
+
+def chained(value):
+    """ One pass (and one copy) of the text per transform. """
+    value = re.sub(r'<p(?:\s[^>]*)?>(?:\s|&nbsp;|<br\s*/?>)*</p>', '', value)
+    value = re.sub(r'<br\s*/?>', '', value)
+    value = re.sub(r'</?(?:span|font)(?:\s[^>]*)?/?>', '', value)
+    return re.sub(r'\s+', ' ', value)
+
+
+def main():
+    pipeline = get_pipeline(TRANSFORMS)
+    for size in SIZES_MB:
+        body = PARAGRAPH * (size * 1024 * 1024 // len(PARAGRAPH))
+        for name, func in (('chained re.sub', chained),
+                           ('cleanup pipeline', pipeline)):
+            seconds = min(timeit.repeat(lambda: func(body), number=1,
+                                        repeat=REPEAT))
+            print('%3d MB %-20s %10.1f ms %8.1f MB/s' % (
+                size, name, seconds * 1000, len(body) / seconds / 1024 ** 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Measures the per-value cost of the ``currency`` filter on a 10k-row price
+table, both called directly and through ``Template.render``.
+
+Run it from the ``template_utils_project`` directory::
+
+    python benchmarks/bench_currency.py
+"""
+from decimal import Decimal
+import locale
+import os
+import random
+import sys
+import timeit
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'template_utils_project.settings')
+
+import django
+if hasattr(django, 'setup'):
+    # Since Django 1.7 the app registry has to be populated first
+    django.setup()
+from django.template import Template, Context
+from template_utils import formatting
+from template_utils.templatetags.templateutils_filters import currency
+
+ROWS = 10000
+REPEAT = 5
+
+
+def make_prices(rows=ROWS):
+    rnd = random.Random(0)
+    prices = []
+    for i in range(rows):
+        value = rnd.uniform(-10000, 1000000)
+        prices.append((int(value), value, Decimal('%.3f' % value))[i % 3])
+    return prices
+
+
+def legacy_currency(value, other_locale=None):
+    """ The ``setlocale`` based implementation ``currency`` used to have. """
+    try:
+        locale.setlocale(locale.LC_ALL, '%s.utf8' % (other_locale or 'en_US'))
+    except locale.Error:
+        locale.setlocale(locale.LC_ALL, '%s.UTF-8' % (other_locale or 'en_US'))
+    return locale.currency(value, grouping=True)
+
+
+def best_of(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT))
+
+
+def report(name, seconds, rows=ROWS):
+    print('%-32s %10.3f ms total %8.2f us/value' % (
+        name, seconds * 1000, seconds * 1e6 / rows))
+
+
+def main():
+    prices = make_prices()
+    tpl = Template('{% load templateutils_filters %}<table>'
+                   '{% for price in prices %}<tr><td>{{ price|currency }}'
+                   '</td></tr>{% endfor %}</table>')
+    context = Context({'prices': prices})
+
+    report('currency (direct call)',
+           best_of(lambda: [currency(p) for p in prices]))
+    report('currency (Template.render)', best_of(lambda: tpl.render(context)))
+    report('format_currency_many',
+           best_of(lambda: formatting.format_currency_many(prices)))
+
+    column_tpl = Template(
+        '{% load templateutils_filters %}<table>'
+        '{% currencycolumn rows "price" as priced %}'
+        '{% for row, price in priced %}<tr><td>{{ price }}'
+        '</td></tr>{% endfor %}</table>')
+    column_context = Context({'rows': [{'price': p} for p in prices]})
+    report('currencycolumn (Template.render)',
+           best_of(lambda: column_tpl.render(column_context)))
+
+    if numpy is not None:
+        floats = numpy.array([float(p) for p in prices])
+        report('format_currency_many (NumPy array)',
+               best_of(lambda: formatting.format_currency_many(floats)))
+
+    try:
+        legacy_currency(1)
+    except locale.Error:
+        print('legacy setlocale currency: skipped, en_US locale not installed')
+    else:
+        report('legacy setlocale currency',
+               best_of(lambda: [legacy_currency(p) for p in prices]))
+
+
+if __name__ == '__main__':
+    main()
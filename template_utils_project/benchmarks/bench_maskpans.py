@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Compares ``mask_pans`` with a typical regex-plus-Python-loop scrubber on
+multi-megabyte bodies: support messages full of numbers, and mostly prose
+with a card number here and there.
+
+Run it from the ``template_utils_project`` directory::
+
+    python benchmarks/bench_maskpans.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'template_utils_project.settings')
+
+from template_utils.masking import mask_pans
+
+REPEAT = 3
+SIZES_MB = (1, 4)
+
+MESSAGE = (
+    'Hi, order 20131204-5531 for $1,234.50 was charged to my card '
+    '4111 1111 1111 1111 (exp 12/25) but I was billed twice on '
+    '2013-12-04. Please call me at 555-0134-221 or use my other card '
+    '5500-0000-0000-0004. Tracking: 1Z999AA10123456784.\n'
+)
+
+PROSE = (
+    'Lorem ipsum dolor sit amet, order 12345 on 2013-12-04, consectetur '
+    'adipisicing elit, sed do eiusmod tempor incididunt ut labore. ' * 10 +
+    'Card: 4111 1111 1111 1111\n'
+)
+
+NAIVE_RUN = re.compile(r'(?:\d[ -]*?){13,19}')
+
+
+def naive(value):
+    """ Matches candidates with a backtracking regex, checks each in a loop. """
+    def replace(match):
+        candidate = match.group()
+        digits = [int(char) for char in candidate if char.isdigit()]
+        total = 0
+        for index, digit in enumerate(reversed(digits)):
+            if index % 2:
+                digit *= 2
+                if digit > 9:
+                    digit -= 9
+            total += digit
+        if total % 10:
+            return candidate
+        hidden = len(digits) - 4
+        masked = []
+        for char in candidate:
+            if char.isdigit():
+                masked.append('*' if hidden > 0 else char)
+                hidden -= 1
+            else:
+                masked.append(char)
+        return ''.join(masked)
+    return NAIVE_RUN.sub(replace, value)
+
+
+def main():
+    for text_name, text in (('messages', MESSAGE), ('prose', PROSE)):
+        for size in SIZES_MB:
+            body = text * (size * 1024 * 1024 // len(text))
+            assert naive(body) == mask_pans(body)
+            for name, func in (('regex + loop', naive),
+                               ('mask_pans', mask_pans)):
+                seconds = min(timeit.repeat(lambda: func(body), number=1,
+                                            repeat=REPEAT))
+                print('%-8s %3d MB %-14s %10.1f ms %8.1f MB/s' % (
+                    text_name, size, name, seconds * 1000,
+                    len(body) / seconds / 1024 ** 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Compares the ``compact``, ``percent`` and ``grouped`` filters with the two
+usual custom filters, on 100k values (a third each of Decimals, ints and
+floats, as a Decimal-heavy queryset of amounts, counts and ratios gives
+them): converting every value through ``float``, which is fast but rounds
+Decimals wrong, and converting every value to ``Decimal`` and rounding it
+with ``quantize``, which is exact but slow. The number of Decimals each one
+formats differently from the filters is reported too (negative zeros, such
+as ``-0.00%``, count as different).
+
+Run it from the ``template_utils_project`` directory::
+
+    python benchmarks/bench_numbers.py
+"""
+from decimal import Decimal, ROUND_HALF_UP
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'template_utils_project.settings')
+
+from template_utils.templatetags.templateutils_filters import (
+    compact,
+    grouped,
+    percent,
+)
+
+VALUES = 100000
+REPEAT = 3
+
+
+def make_values(count=VALUES, scale=10 ** 7):
+    rnd = random.Random(0)
+    values = []
+    for i in range(count):
+        value = rnd.uniform(-scale / 10, scale)
+        values.append((Decimal('%.3f' % value), int(value), value)[i % 3])
+    return values
+
+
+def naive_compact(value, places=1):
+    """ Converts through float and walks the suffixes. """
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return value
+    for suffix in ('', 'k', 'M', 'B'):
+        if abs(value) < 1000:
+            break
+        value /= 1000
+    else:
+        suffix = 'T'
+    number = '%.*f' % (places, value)
+    if '.' in number:
+        number = number.rstrip('0').rstrip('.')
+    return number + suffix
+
+
+def naive_percent(value, places=0):
+    """ Converts through float and formats the product. """
+    try:
+        return '%.*f%%' % (places, float(value) * 100)
+    except (TypeError, ValueError):
+        return value
+
+
+def naive_grouped(value, places=0):
+    """ Converts through float and formats it with commas. """
+    try:
+        return '{0:,.{1}f}'.format(float(value), places)
+    except (TypeError, ValueError):
+        return value
+
+
+def _to_decimal(value):
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def decimal_compact(value, places=1):
+    """ Converts to Decimal, compares it with every unit and quantizes. """
+    try:
+        value = _to_decimal(value)
+    except (TypeError, ValueError, ArithmeticError):
+        return value
+    for power, suffix in enumerate(('', 'k', 'M', 'B')):
+        if abs(value) < 1000 ** (power + 1):
+            break
+    else:
+        power, suffix = 4, 'T'
+    value = (value / 1000 ** power).quantize(Decimal(1).scaleb(-places),
+                                             ROUND_HALF_UP)
+    number = format(value, 'f')
+    if '.' in number:
+        number = number.rstrip('0').rstrip('.')
+    return number + suffix
+
+
+def decimal_percent(value, places=0):
+    """ Converts to Decimal and quantizes the product. """
+    try:
+        value = _to_decimal(value) * 100
+    except (TypeError, ValueError, ArithmeticError):
+        return value
+    return format(value.quantize(Decimal(1).scaleb(-places), ROUND_HALF_UP),
+                  'f') + '%'
+
+
+def decimal_grouped(value, places=0):
+    """ Converts to Decimal, quantizes it and formats it with commas. """
+    try:
+        value = _to_decimal(value)
+    except (TypeError, ValueError, ArithmeticError):
+        return value
+    return format(value.quantize(Decimal(1).scaleb(-places), ROUND_HALF_UP),
+                  ',f')
+
+
+def main():
+    amounts = make_values()
+    ratios = make_values(scale=1)
+    for name, values, funcs in (
+            ('compact', amounts, (naive_compact, decimal_compact, compact)),
+            ('percent', ratios, (naive_percent, decimal_percent, percent)),
+            ('grouped', amounts, (naive_grouped, decimal_grouped, grouped))):
+        for label, func in zip(('float', 'decimal', 'numeric'), funcs):
+            seconds = min(timeit.repeat(
+                lambda: [func(value, 2) for value in values],
+                number=1, repeat=REPEAT))
+            differ = sum(func(value, 2) != funcs[-1](value, 2)
+                        for value in values if isinstance(value, Decimal))
+            print('%-8s %-8s %8.1f ms %8.2f us/value %6d Decimals differ' % (
+                name, label, seconds * 1000, seconds / len(values) * 1e6,
+                differ))
+
+
+if __name__ == '__main__':
+    main()
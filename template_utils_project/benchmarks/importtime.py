@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Checks the import time of the template libraries against a budget.
+
+Every library is imported in a fresh interpreter, after ``django.template``
+(which ``{% load %}`` needs anyway) and ``django.core.urlresolvers`` (which
+handling any request loads first), so the time measured is the one the
+library itself adds. On Python 3.7+ it is the cumulative time reported by
+``python -X importtime``; on older versions, the wall-clock time of the
+import. The best of several runs is compared against the budget, and the
+heavy modules a library must not import are checked as well.
+
+Run it from the ``template_utils_project`` directory::
+
+    python benchmarks/importtime.py
+
+The exit status is 1 if any library is over budget or imports a module it
+shouldn't.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = 'template_utils.templatetags.'
+REPEAT = 5
+
+# Library: (budget in milliseconds, modules it must not import). Since
+# Django 1.7 the url resolvers import django.forms themselves, so the forms
+# of the url libraries are checked through the modules of template_utils
+# that need them.
+BUDGETS = {
+    'templateutils_nav': (50, ('django.contrib.auth.models',
+                               'django.core.cache', 'django.test',
+                               'template_utils.choices',
+                               'template_utils.display',
+                               'template_utils.fragments',
+                               'template_utils.groups', 'numpy')),
+    'templateutils_tags': (70, ('django.contrib.auth.models', 'django.test',
+                                'template_utils.choices',
+                                'template_utils.display',
+                                'template_utils.groups', 'numpy')),
+    'templateutils_filters': (20, ('django.contrib.auth.models',
+                                   'django.db.models', 'django.forms',
+                                   'django.test', 'template_utils.choices',
+                                   'template_utils.display', 'numpy')),
+}
+
+CHILD = """
+import json, sys, time
+import django.core.urlresolvers, django.template
+before = set(sys.modules)
+start = time.time()
+import %s
+elapsed = time.time() - start
+print(json.dumps({'ms': elapsed * 1000,
+                  'modules': sorted(set(sys.modules) - before)}))
+"""
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)$')
+
+
+def import_library(name):
+    """
+    Imports the library in a new interpreter and returns the milliseconds it
+    took and the modules it imported (that weren't imported already).
+    """
+    module = PACKAGE + name
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'template_utils_project.settings')
+    env['PYTHONPATH'] = os.pathsep.join([PROJECT_DIR] + sys.path)
+    command = [sys.executable]
+    importtime = sys.version_info >= (3, 7)
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-c', CHILD % module]
+    process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    stdout, stderr = process.communicate()
+    if process.returncode:
+        raise RuntimeError('Importing %s failed:\n%s' % (module, stderr))
+    result = json.loads(stdout.splitlines()[-1])
+    if importtime:
+        for line in stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match and match.group(2) == module:
+                result['ms'] = int(match.group(1)) / 1000.0
+    return result['ms'], set(result['modules'])
+
+
+def check(name):
+    """
+    Returns the best import time of the library and a list of its problems.
+    """
+    budget, forbidden = BUDGETS[name]
+    problems = []
+    times = []
+    for i in range(REPEAT):
+        ms, modules = import_library(name)
+        times.append(ms)
+    best = min(times)
+    if best > budget:
+        problems.append('takes %.1f ms, over its %d ms budget'
+                        % (best, budget))
+    for module in forbidden:
+        if module in modules:
+            problems.append('imports %s' % module)
+    return best, problems
+
+
+def main():
+    failed = False
+    for name in sorted(BUDGETS):
+        best, problems = check(name)
+        print('%-24s %8.1f ms  (budget %d ms)'
+              % (name, best, BUDGETS[name][0]))
+        for problem in problems:
+            print('  FAIL %s' % problem)
+        failed = failed or bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+"""
+Micro-benchmarks of every filter and tag of template_utils.
+
+Each benchmark measures the cost of calling the filter (or the function
+behind the tag) directly and the cost of a full ``Template.render`` using
+it, and reports:
+
+- ops/sec: the best of several timed runs.
+- allocations: the peak of memory allocated by a single operation, in
+  bytes, measured with ``tracemalloc`` (Python 3.4+). Without it (i.e. on
+  Python 2), the number of objects tracked by the garbage collector that a
+  single operation leaves allocated, cyclic garbage included, is reported
+  instead, marked "obj".
+- queries: the database queries made by a single operation.
+
+It runs offline, with an in-memory SQLite test database and the urls of
+``template_utils.testurls``. Run it from the ``template_utils_project``
+directory::
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --compare results.json --tolerance 0.15
+    python benchmarks/suite.py currency mkrange
+
+With ``--compare`` the exit status is 1 if any benchmark got slower than
+the tolerance allows, allocates more, or makes more queries than in the
+given results.
+"""
+from decimal import Decimal
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'template_utils_project.settings')
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import django
+if hasattr(django, 'setup'):
+    # Since Django 1.7 the app registry has to be populated first
+    django.setup()
+from django.conf import settings
+from django.db import connection
+from django.template import Context, Template
+from template_utils.folding import fold_arguments
+
+MIN_TIME = 0.2
+REPEAT = 3
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """
+    Registers a benchmark. ``func`` sets up its data and returns the
+    function to call directly, the template to render and the context to
+    render it with.
+    """
+    BENCHMARKS.append(func)
+    return func
+
+
+@benchmark
+def currency():
+    from template_utils.templatetags.templateutils_filters import currency
+    value = Decimal('1234567.891')
+    return (lambda: currency(value),
+            '{{ value|currency }}', {'value': value})
+
+
+@benchmark
+def compact():
+    from template_utils.templatetags.templateutils_filters import compact
+    value = Decimal('3456789.12')
+    return (lambda: compact(value),
+            '{{ value|compact }}', {'value': value})
+
+
+@benchmark
+def nolinebrs():
+    from template_utils.templatetags.templateutils_filters import nolinebrs
+    value = 'Some text<br>with line breaks<br />in it. ' * 50
+    return (lambda: nolinebrs(value),
+            '{{ value|nolinebrs }}', {'value': value})
+
+
+@benchmark
+def prefix_map():
+    from template_utils.prefixes import PrefixIndex
+    from template_utils.templatetags.templateutils_filters import prefix_map
+    classes = PrefixIndex(dict(('%s%03d' % (letter, i), 'class-%s' % letter)
+                               for letter in 'ABCDEFGHIJ' for i in range(100)))
+    value = 'J099-0042'
+    return (lambda: prefix_map(value, classes),
+            '{{ value|prefix_map:classes }}',
+            {'value': value, 'classes': classes})
+
+
+@benchmark
+def creditcard():
+    from template_utils.templatetags.templateutils_filters import creditcard
+    value = '5000000000003456'
+    return (lambda: creditcard(value, 4),
+            '{{ value|creditcard:4 }}', {'value': value})
+
+
+@benchmark
+def maskpans():
+    from template_utils.templatetags.templateutils_filters import maskpans
+    value = ('Charged twice to 4111 1111 1111 1111 on 2013-12-04, '
+             'order 20131204-5531. ') * 20
+    return (lambda: maskpans(value),
+            '{{ value|maskpans }}', {'value': value})
+
+
+@benchmark
+def verbose():
+    from django import forms
+    from template_utils.templatetags.templateutils_filters import verbose
+
+    class OrderForm(forms.Form):
+        status = forms.ChoiceField(choices=[(i, 'Status %d' % i)
+                                            for i in range(50)])
+
+    form = OrderForm({'status': '42'})
+    return (lambda: verbose(form['status']),
+            '{{ form.status|verbose }}', {'form': form})
+
+
+@benchmark
+def active_url():
+    from django.test.client import RequestFactory
+    from template_utils.templatetags.templateutils_tags import active_url
+    request = RequestFactory().get('/orders/')
+    return (lambda: active_url(request, 'orders'),
+            '{% active_url request "orders" %}', {'request': request})
+
+
+@benchmark
+def ifmember():
+    from django.contrib.auth.models import Group, User
+    from template_utils import groups
+
+    user = User.objects.create_user('bench', 'bench@example.com', 'bench')
+    for name in ('Admins', 'Editors', 'Staff'):
+        user.groups.add(Group.objects.get_or_create(name=name)[0])
+
+    def new_request():
+        # The groups are loaded once per request, so every operation is
+        # measured as the first check of a request.
+        user.__dict__.pop(groups.GROUP_NAMES_ATTR, None)
+        return user
+
+    # Templates call callables, so every render gets a "new request" user
+    return (lambda: 'Editors' in groups.get_group_names(new_request()),
+            '{% ifmember Editors %}yes{% endifmember %}',
+            {'user': new_request})
+
+
+@benchmark
+def mkrange():
+    from template_utils.ranges import lazy_range
+    return (lambda: [i for i in lazy_range(0, 100, 2)],
+            '{% mkrange 0 100 2 as items %}{% for i in items %}{{ i }}'
+            '{% endfor %}', {})
+
+
+def render_function(source, context):
+    library = ('{% load templateutils_filters %}'
+               '{% load templateutils_tags %}')
+    # As loaded by template_utils.loaders.Loader
+    template = fold_arguments(Template(library + source))
+    return lambda: template.render(Context(context))
+
+
+def ops_per_second(func):
+    number = 1
+    while True:
+        seconds = timeit.timeit(func, number=number)
+        if seconds >= MIN_TIME:
+            break
+        number *= 10
+    best = min(timeit.repeat(func, number=number, repeat=REPEAT))
+    return number / best
+
+
+def allocated_bytes(func):
+    if tracemalloc is None:
+        return None
+    func()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        func()
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+
+def allocated_objects(func):
+    """
+    Returns the number of objects tracked by the garbage collector (lists,
+    dicts, instances...) left allocated by ``func``, for Pythons without
+    ``tracemalloc``. The collector is disabled meanwhile, so the cyclic
+    garbage ``func`` creates is counted as well.
+    """
+    if tracemalloc is not None:
+        return None
+    func()
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        func()
+        return len(gc.get_objects()) - before
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def query_count(func):
+    use_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    try:
+        before = len(connection.queries)
+        func()
+        return len(connection.queries) - before
+    finally:
+        connection.use_debug_cursor = use_debug_cursor
+
+
+def measure(func):
+    return {
+        'ops_per_sec': ops_per_second(func),
+        'alloc_bytes': allocated_bytes(func),
+        'alloc_objects': allocated_objects(func),
+        'queries': query_count(func),
+    }
+
+
+def run(names=None):
+    results = {}
+    for setup in BENCHMARKS:
+        if names and setup.__name__ not in names:
+            continue
+        direct, source, context = setup()
+        results[setup.__name__] = {
+            'direct': measure(direct),
+            'render': measure(render_function(source, context)),
+        }
+    return results
+
+
+def format_allocations(result):
+    if result.get('alloc_bytes') is not None:
+        return '%d B' % result['alloc_bytes']
+    if result.get('alloc_objects') is not None:
+        return '%d obj' % result['alloc_objects']
+    return '-'
+
+
+def report(results):
+    print('%-12s %-7s %14s %12s %8s' % (
+        'benchmark', 'mode', 'ops/sec', 'allocations', 'queries'))
+    for name in sorted(results):
+        for mode in ('direct', 'render'):
+            result = results[name][mode]
+            print('%-12s %-7s %14.0f %12s %8d' % (
+                name, mode, result['ops_per_sec'],
+                format_allocations(result), result['queries']))
+    if tracemalloc is None:
+        print('allocations: tracemalloc is not available on Python %s, '
+              'objects left allocated by the garbage collector are counted '
+              'instead' % platform.python_version())
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a description of every regression of ``results`` against
+    ``baseline``.
+    """
+    regressions = []
+    for name in sorted(results):
+        for mode in ('direct', 'render'):
+            try:
+                old = baseline[name][mode]
+            except KeyError:
+                continue
+            new = results[name][mode]
+            label = '%s (%s)' % (name, mode)
+            if new['ops_per_sec'] < old['ops_per_sec'] * (1 - tolerance):
+                regressions.append('%s: %.0f ops/sec, was %.0f' % (
+                    label, new['ops_per_sec'], old['ops_per_sec']))
+            # Only allocations measured the same way can be compared
+            new_bytes, old_bytes = new['alloc_bytes'], old.get('alloc_bytes')
+            if None not in (new_bytes, old_bytes) and \
+                    new_bytes > old_bytes * (1 + tolerance):
+                regressions.append('%s: allocates %d bytes, was %d' % (
+                    label, new_bytes, old_bytes))
+            new_objects = new['alloc_objects']
+            old_objects = old.get('alloc_objects')
+            if None not in (new_objects, old_objects) and \
+                    new_objects > old_objects:
+                regressions.append('%s: leaves %d objects, was %d' % (
+                    label, new_objects, old_objects))
+            if new['queries'] > old['queries']:
+                regressions.append('%s: %d queries, was %d' % (
+                    label, new['queries'], old['queries']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the filters and tags of template_utils.')
+    parser.add_argument('names', nargs='*', metavar='benchmark',
+                        help='benchmarks to run (all of them by default): %s'
+                        % ', '.join(setup.__name__ for setup in BENCHMARKS))
+    parser.add_argument('--output', help='saves the results as JSON')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='fails on regressions against saved results')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='slowdown tolerated by --compare (0.1 = 10%%)')
+    options = parser.parse_args(argv)
+
+    settings.ROOT_URLCONF = 'template_utils.testurls'
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        results = run(options.names)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+    report(results)
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump({
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'results': results,
+            }, output, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as saved:
+            baseline = json.load(saved)['results']
+        regressions = compare(results, baseline, options.tolerance)
+        for regression in regressions:
+            print('REGRESSION %s' % regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+Load-tests the template_utils tags and filters under concurrency.
+
+A synthetic heavy page (a big navigation menu, many ``ifmember`` blocks, a
+form rendered with ``verbose`` and currency tables) is rendered by a pool
+of processes, each running a pool of threads, against the local SQLite
+database. Every render is made as the first one of a new request: the user
+is fetched again, so its groups are loaded again by ``ifmember``.
+
+Usage::
+
+    python manage.py loadtest
+    python manage.py loadtest --processes 4 --threads 8 --renders 200
+
+It reports the throughput, the latency percentiles of a render and the
+queries made by a render.
+"""
+from decimal import Decimal
+from optparse import make_option
+import multiprocessing
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.template import Context, Template
+from template_utils.folding import fold_arguments
+
+USERNAME = 'loadtest'
+GROUPS = ('Staff', 'Editors')
+NAV_URLS = ('home', 'about', 'orders', 'shop:orders')
+
+
+def page_source(nav_items, blocks, rows):
+    """
+    Returns the source of the synthetic page.
+    """
+    bits = ['{% load templateutils_filters %}{% load templateutils_tags %}',
+            '<ul>']
+    for i in range(nav_items):
+        name = NAV_URLS[i % len(NAV_URLS)]
+        bits.append('<li{%% active_url request "%s" %%}><a href="'
+                    '{%% current_url request "%s" %%}">Item %d</a></li>'
+                    % (name, name, i))
+    bits.append('</ul>{% navmenu request inactive_class="off" %}<ul>')
+    for i in range(nav_items):
+        bits.append('<li{%% navitem "%s" %%}>Item %d</li>'
+                    % (NAV_URLS[i % len(NAV_URLS)], i))
+    bits.append('</ul>{% endnavmenu %}')
+    for i in range(blocks):
+        # Half of the blocks check groups the user doesn't belong to
+        bits.append('{%% ifmember %s or Group%d %%}<p>Block %d</p>'
+                    '{%% else %%}<p>Hidden</p>{%% endifmember %%}'
+                    % (GROUPS[i % len(GROUPS)] if i % 2 else 'Nobody', i, i))
+    bits.append('<dl>{% for field in form %}<dt>{{ field.label }}</dt>'
+                '<dd>{{ field|verbose }}</dd>{% endfor %}</dl>')
+    bits.append('<table>{% for row in rows %}<tr><td>{{ row.name }}</td>'
+                '<td>{{ row.quantity|integer }}</td>'
+                '<td>{{ row.price|currency }}</td>'
+                '<td>{{ row.total|currency }}</td></tr>{% endfor %}</table>')
+    bits.append('{%% mkrange 1 %d as pages %%}{%% for page in pages %%}'
+                '<a>{{ page }}</a>{%% endfor %%}' % (rows // 10 + 2))
+    return ''.join(bits)
+
+
+def page_form(fields):
+    from django import forms
+    choices = [(i, 'Choice %d' % i) for i in range(50)]
+    form_fields = dict(('field_%d' % i, forms.ChoiceField(choices=choices))
+                       for i in range(fields))
+    form_class = type('LoadTestForm', (forms.Form,), form_fields)
+    return form_class(dict(('field_%d' % i, str(i * 7 % 50))
+                           for i in range(fields)))
+
+
+def page_rows(rows):
+    return [{'name': 'Product %d' % i,
+             'quantity': i * 3,
+             'price': Decimal('%d.%02d' % (i * 17, i % 100)),
+             'total': Decimal('%d.%02d' % (i * 51, i * 3 % 100))}
+            for i in range(rows)]
+
+
+def setup_data():
+    """
+    Creates the tables, the user and its groups if they are missing, and
+    returns the user's pk.
+    """
+    from django.contrib.auth.models import Group, User
+    call_command('syncdb', interactive=False, verbosity=0)
+    user, created = User.objects.get_or_create(username=USERNAME)
+    for name in GROUPS:
+        user.groups.add(Group.objects.get_or_create(name=name)[0])
+    return user.pk
+
+
+def render_thread(template, context, user_pk, renders, warmup, samples):
+    """
+    Renders ``template`` ``warmup + renders`` times, appending the
+    ``(start, seconds, queries)`` of the last ``renders`` ones to
+    ``samples``.
+    """
+    from django.contrib.auth.models import User
+    from django.test.client import RequestFactory
+    factory = RequestFactory()
+    connection.use_debug_cursor = True
+    try:
+        for i in range(warmup + renders):
+            request = factory.get('/orders/')
+            request.user = User.objects.get(pk=user_pk)
+            page = Context(context)
+            page.update({'request': request, 'user': request.user})
+            del connection.queries[:]
+            start = time.time()
+            template.render(page)
+            seconds = time.time() - start
+            if i >= warmup:
+                samples.append((start, seconds, len(connection.queries)))
+    finally:
+        connection.close()
+
+
+def render_process(options):
+    """
+    Runs the threads of a process, returning their samples.
+    """
+    template = fold_arguments(Template(page_source(
+        options['nav_items'], options['blocks'], options['rows'])))
+    context = {'form': page_form(options['fields']),
+               'rows': page_rows(options['rows'])}
+    samples = []
+    threads = [threading.Thread(target=render_thread, args=(
+        template, context, options['user_pk'], options['renders'],
+        options['warmup'], samples)) for i in range(options['threads'])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of the sorted ``values``.
+    """
+    index = int(round(percent / 100.0 * len(values) + 0.5)) - 1
+    return values[max(0, min(index, len(values) - 1))]
+
+
+class Command(BaseCommand):
+    help = ('Renders a synthetic page using template_utils from several '
+            'processes and threads, and reports throughput, latency and '
+            'queries per render.')
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', type='int', default=1,
+                    help='Number of processes [default: %default].'),
+        make_option('--threads', type='int', default=4,
+                    help='Number of threads per process [default: %default].'),
+        make_option('--renders', type='int', default=100,
+                    help='Renders measured per thread [default: %default].'),
+        make_option('--warmup', type='int', default=5,
+                    help='Renders per thread before measuring '
+                         '[default: %default].'),
+        make_option('--nav-items', type='int', default=40, dest='nav_items',
+                    help='Entries of the navigation [default: %default].'),
+        make_option('--blocks', type='int', default=50,
+                    help='ifmember blocks [default: %default].'),
+        make_option('--rows', type='int', default=200,
+                    help='Rows of the currency table [default: %default].'),
+        make_option('--fields', type='int', default=20,
+                    help='Fields of the form [default: %default].'),
+    )
+
+    def handle(self, *args, **options):
+        for name in ('processes', 'threads', 'renders'):
+            if options[name] < 1:
+                raise CommandError('--%s must be at least 1.' % name)
+        # The urls the navigation refers to
+        settings.ROOT_URLCONF = 'template_utils.testurls'
+        options['user_pk'] = setup_data()
+        # Forked processes must not share the connection
+        connection.close()
+
+        if options['processes'] == 1:
+            samples = render_process(options)
+        else:
+            pool = multiprocessing.Pool(options['processes'])
+            try:
+                samples = sum(pool.map(render_process,
+                                       [options] * options['processes']), [])
+            finally:
+                pool.close()
+                pool.join()
+
+        # From the first measured render to the last one, without the
+        # warm-up and the start of the processes
+        elapsed = (max(start + seconds for start, seconds, queries in samples)
+                   - min(start for start, seconds, queries in samples))
+        latencies = sorted(seconds * 1000 for start, seconds, queries
+                           in samples)
+        queries = [queries for start, seconds, queries in samples]
+        self.stdout.write('renders     %d (%d processes x %d threads x %d)' % (
+            len(samples), options['processes'], options['threads'],
+            options['renders']))
+        self.stdout.write('throughput  %.1f renders/sec' % (
+            len(samples) / elapsed))
+        self.stdout.write('latency     p50 %.2f ms, p95 %.2f ms, p99 %.2f ms, '
+                          'max %.2f ms' % (
+                              percentile(latencies, 50),
+                              percentile(latencies, 95),
+                              percentile(latencies, 99), latencies[-1]))
+        self.stdout.write('queries     %.2f per render (max %d)' % (
+            float(sum(queries)) / len(queries), max(queries)))
@@ -123,6 +123,7 @@ INSTALLED_APPS = (
     # Uncomment the next line to enable admin documentation:
     # 'django.contrib.admindocs',
     'template_utils',
+    'template_utils_project',
 )
 
 # A sample logging configuration. The only tangible logging